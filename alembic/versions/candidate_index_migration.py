@@ -0,0 +1,20 @@
+"""composite index for candidate prefiltering
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_users_candidates', 'users', ['gender', 'looking_for', 'is_active', 'date_of_birth'])
+
+def downgrade():
+    op.drop_index('ix_users_candidates', table_name='users')
@@ -0,0 +1,35 @@
+"""versioned compatibility reports
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('users', sa.Column('profile_revision', sa.Integer(), nullable=False, server_default='1'))
+    # Existing reports have no revisions, so they are rescored on their next read
+    op.add_column('compatibility_reports', sa.Column('user_revision', sa.Integer(), nullable=True))
+    op.add_column('compatibility_reports', sa.Column('target_revision', sa.Integer(), nullable=True))
+
+    # Keep only the newest report per pair before enforcing uniqueness
+    reports = sa.table('compatibility_reports', sa.column('id'), sa.column('user_id'), sa.column('target_id'))
+    newest = sa.select(sa.func.max(reports.c.id)).group_by(reports.c.user_id, reports.c.target_id)
+    op.get_bind().execute(reports.delete().where(reports.c.id.notin_(newest)))
+
+    # A unique index rather than a constraint, so SQLite does not need a table rebuild
+    op.create_index('ux_compatibility_reports_user_target', 'compatibility_reports', ['user_id', 'target_id'], unique=True)
+
+def downgrade():
+    op.drop_index('ux_compatibility_reports_user_target', table_name='compatibility_reports')
+    op.drop_column('compatibility_reports', 'target_revision')
+    op.drop_column('compatibility_reports', 'user_revision')
+    op.drop_column('users', 'profile_revision')
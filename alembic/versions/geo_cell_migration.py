@@ -0,0 +1,54 @@
+"""user geo cell
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import math
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+# Must match app.models.user.GEO_CELL_DEGREES
+GEO_CELL_DEGREES = 0.5
+GEO_CELL_COLUMNS = int(360 / GEO_CELL_DEGREES)
+BATCH_SIZE = 10000
+
+def geo_cell(latitude, longitude):
+    row = min(int(math.floor((latitude + 90) / GEO_CELL_DEGREES)), int(180 / GEO_CELL_DEGREES) - 1)
+    column = min(max(int(math.floor((longitude + 180) / GEO_CELL_DEGREES)), 0), GEO_CELL_COLUMNS - 1)
+    return row * GEO_CELL_COLUMNS + column
+
+def upgrade():
+    op.add_column('users', sa.Column('geo_cell', sa.Integer(), nullable=True))
+
+    # Backfill in id-ordered batches so large tables are not locked by one huge UPDATE
+    connection = op.get_bind()
+    users = sa.table('users', sa.column('id'), sa.column('latitude'), sa.column('longitude'), sa.column('geo_cell'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(users.c.id, users.c.latitude, users.c.longitude)
+            .where(users.c.id > last_id, users.c.latitude.isnot(None), users.c.longitude.isnot(None))
+            .order_by(users.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            users.update().where(users.c.id == sa.bindparam('user_id')).values(geo_cell=sa.bindparam('cell')),
+            [{'user_id': row.id, 'cell': geo_cell(row.latitude, row.longitude)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.create_index(op.f('ix_users_geo_cell'), 'users', ['geo_cell'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_users_geo_cell'), table_name='users')
+    op.drop_column('users', 'geo_cell')
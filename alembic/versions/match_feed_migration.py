@@ -0,0 +1,40 @@
+"""match feed
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Materialized top-K candidates per user; filled lazily on the first /matches read
+    op.create_table(
+        'match_feed',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('candidate_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['candidate_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'candidate_id', name='uq_match_feed_user_candidate')
+    )
+    op.create_index(op.f('ix_match_feed_id'), 'match_feed', ['id'], unique=False)
+    op.create_index('ix_match_feed_user_rank', 'match_feed', ['user_id', 'rank'], unique=False)
+    op.create_index('ix_match_feed_candidate', 'match_feed', ['candidate_id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_match_feed_candidate', table_name='match_feed')
+    op.drop_index('ix_match_feed_user_rank', table_name='match_feed')
+    op.drop_index(op.f('ix_match_feed_id'), table_name='match_feed')
+    op.drop_table('match_feed')
@@ -0,0 +1,96 @@
+"""matches table and unique like index
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from datetime import datetime, time, timezone
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+def upgrade():
+    connection = op.get_bind()
+    sqlite = connection.dialect.name == 'sqlite'
+    likes = sa.table('likes', sa.column('id'), sa.column('liker_id'), sa.column('liked_id'), sa.column('timestamp', sa.Date))
+    other = likes.alias('other')
+
+    # Built first, it also serves the per-pair lookups of the dedupe below
+    op.create_index('ix_likes_liked_liker', 'likes', ['liked_id', 'liker_id'], unique=False)
+
+    # Keep the oldest like of every pair, walking the table in id-ordered batches
+    first_of_pair = (
+        sa.select(sa.func.min(other.c.id))
+        .where(other.c.liker_id == likes.c.liker_id, other.c.liked_id == likes.c.liked_id)
+        .scalar_subquery()
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(likes.c.id, likes.c.id != first_of_pair)
+            .where(likes.c.id > last_id)
+            .order_by(likes.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        duplicates = [row[0] for row in rows if row[1]]
+        if duplicates:
+            connection.execute(likes.delete().where(likes.c.id.in_(duplicates)))
+        last_id = rows[-1][0]
+
+    op.create_index('ux_likes_liker_liked', 'likes', ['liker_id', 'liked_id'], unique=True)
+
+    matches = op.create_table(
+        'matches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('matched_user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['matched_user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'matched_user_id', name='uq_matches_user_matched')
+    )
+    op.create_index(op.f('ix_matches_id'), 'matches', ['id'], unique=False)
+
+    def matched_at(*days):
+        # A match forms with the later of its two likes; likes only know their day
+        days = [day for day in days if day is not None]
+        if not days:
+            return None
+        value = datetime.combine(max(days), time(), timezone.utc)
+        # Must match app.models.user.UTCDateTime, which stores naive UTC on SQLite
+        return value.replace(tzinfo=None) if sqlite else value
+
+    # One match row per side: every like whose reverse exists
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(likes.c.id, likes.c.liker_id, likes.c.liked_id, likes.c.timestamp, other.c.timestamp)
+            .join(other, sa.and_(other.c.liker_id == likes.c.liked_id, other.c.liked_id == likes.c.liker_id))
+            .where(likes.c.id > last_id)
+            .order_by(likes.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        op.bulk_insert(matches, [
+            {'user_id': row[1], 'matched_user_id': row[2], 'created_at': matched_at(row[3], row[4])}
+            for row in rows
+        ])
+        last_id = rows[-1][0]
+
+def downgrade():
+    op.drop_index(op.f('ix_matches_id'), table_name='matches')
+    op.drop_table('matches')
+    op.drop_index('ux_likes_liker_liked', table_name='likes')
+    op.drop_index('ix_likes_liked_liker', table_name='likes')
@@ -0,0 +1,71 @@
+"""datetime message timestamps and conversation index
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from datetime import datetime, time, timezone
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+def copy_column(source, target, target_type, convert):
+    """Fill messages.<target> from messages.<source> in id-ordered batches"""
+    connection = op.get_bind()
+    messages = sa.table('messages', sa.column('id'), sa.column(source), sa.column(target, target_type))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(messages.c.id, messages.c[source])
+            .where(messages.c.id > last_id)
+            .order_by(messages.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        updates = [{'message_id': row[0], 'value': convert(row[1])} for row in rows if row[1] is not None]
+        if updates:
+            connection.execute(
+                messages.update().where(messages.c.id == sa.bindparam('message_id')).values(
+                    {target: sa.bindparam('value')}
+                ),
+                updates,
+            )
+        last_id = rows[-1][0]
+
+def upgrade():
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+
+    def to_datetime(day):
+        # Existing messages only know their day; they are placed at midnight UTC, ordered by id
+        if isinstance(day, str):
+            day = datetime.strptime(day[:10], '%Y-%m-%d').date()
+        value = datetime.combine(day, time(), timezone.utc)
+        # Must match app.models.user.UTCDateTime, which stores naive UTC on SQLite
+        return value.replace(tzinfo=None) if sqlite else value
+
+    op.add_column('messages', sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True))
+    copy_column('timestamp', 'sent_at', sa.DateTime(timezone=True), to_datetime)
+    op.drop_column('messages', 'timestamp')
+    op.alter_column('messages', 'sent_at', new_column_name='timestamp')
+    op.create_index('ix_messages_conversation', 'messages', ['sender_id', 'receiver_id', 'timestamp', 'id'], unique=False)
+
+def downgrade():
+    def to_date(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.date()
+
+    op.drop_index('ix_messages_conversation', table_name='messages')
+    op.add_column('messages', sa.Column('sent_on', sa.Date(), nullable=True))
+    copy_column('timestamp', 'sent_on', sa.Date(), to_date)
+    op.drop_column('messages', 'timestamp')
+    op.alter_column('messages', 'sent_on', new_column_name='timestamp')
@@ -0,0 +1,55 @@
+"""full-text index of profile text
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+# Must match app.models.search
+FTS_COLUMNS = 'bio, occupation, interests'
+
+def fts_values(row):
+    return "%s.bio, %s.occupation, (SELECT group_concat(value, ' ') FROM json_each(%s.interests))" % (row, row, row)
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE profile_search USING fts5(%s, content='', tokenize='unicode61 remove_diacritics 2')"
+                   % FTS_COLUMNS)
+        op.execute("CREATE TRIGGER users_search_insert AFTER INSERT ON users BEGIN "
+                   "INSERT INTO profile_search(rowid, %s) VALUES (new.id, %s); END" % (FTS_COLUMNS, fts_values('new')))
+        op.execute("CREATE TRIGGER users_search_delete AFTER DELETE ON users BEGIN "
+                   "INSERT INTO profile_search(profile_search, rowid, %s) VALUES ('delete', old.id, %s); END"
+                   % (FTS_COLUMNS, fts_values('old')))
+        op.execute("CREATE TRIGGER users_search_update AFTER UPDATE OF %s ON users BEGIN "
+                   "INSERT INTO profile_search(profile_search, rowid, %s) VALUES ('delete', old.id, %s); "
+                   "INSERT INTO profile_search(rowid, %s) VALUES (new.id, %s); END"
+                   % (FTS_COLUMNS, FTS_COLUMNS, fts_values('old'), FTS_COLUMNS, fts_values('new')))
+        # Index the existing profiles
+        op.execute("INSERT INTO profile_search(rowid, %s) SELECT users.id, %s FROM users" % (FTS_COLUMNS, fts_values('users')))
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE users ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(interests::text, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(occupation, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(bio, '')), 'C')) STORED"
+        )
+        op.execute("CREATE INDEX ix_users_search ON users USING gin (search_vector)")
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('users_search_insert', 'users_search_delete', 'users_search_update'):
+            op.execute("DROP TRIGGER IF EXISTS %s" % trigger)
+        op.execute("DROP TABLE IF EXISTS profile_search")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_users_search")
+        op.execute("ALTER TABLE users DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,30 @@
+"""per-user seen-set filters
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # No backfill: a user without a row gets a filter seeded from their likes on first use
+    op.create_table(
+        'seen_filters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('bloom', sa.LargeBinary(), nullable=False),
+        sa.Column('items', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+def downgrade():
+    op.drop_table('seen_filters')
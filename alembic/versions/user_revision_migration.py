@@ -0,0 +1,21 @@
+"""row revision of users for ETags
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('users', sa.Column('revision', sa.Integer(), nullable=False, server_default='1'))
+
+def downgrade():
+    op.drop_column('users', 'revision')
@@ -0,0 +1,93 @@
+"""interned interest and language vocabulary
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+def to_bytes(term_ids):
+    # Must match app.services.vocabulary.to_bytes
+    value = 0
+    for term_id in term_ids:
+        value |= 1 << term_id
+    if not value:
+        return None
+    return value.to_bytes((value.bit_length() + 63) // 64 * 8, 'little')
+
+def upgrade():
+    terms = op.create_table(
+        'vocabulary_terms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('term', sa.String(), nullable=False),
+        sa.Column('bit', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'term', name='uq_vocabulary_terms_kind_term'),
+        sa.UniqueConstraint('kind', 'bit', name='uq_vocabulary_terms_kind_bit')
+    )
+    op.create_index(op.f('ix_vocabulary_terms_id'), 'vocabulary_terms', ['id'], unique=False)
+    op.add_column('users', sa.Column('interest_bits', sa.LargeBinary(), nullable=True))
+    op.add_column('users', sa.Column('language_bits', sa.LargeBinary(), nullable=True))
+
+    # Backfill in id-ordered batches; bits are handed out in first-seen order
+    connection = op.get_bind()
+    users = sa.table(
+        'users', sa.column('id'), sa.column('interests', sa.JSON), sa.column('languages', sa.JSON),
+        sa.column('interest_bits'), sa.column('language_bits'),
+    )
+    vocabularies = {'interest': {}, 'language': {}}
+
+    def encode(kind, items):
+        if not items:
+            return None
+        vocabulary = vocabularies[kind]
+        return to_bytes(vocabulary.setdefault(item, len(vocabulary)) for item in items)
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(users.c.id, users.c.interests, users.c.languages)
+            .where(users.c.id > last_id)
+            .order_by(users.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        updates = [
+            {'user_id': row.id, 'interest_value': encode('interest', row.interests), 'language_value': encode('language', row.languages)}
+            for row in rows
+            if row.interests or row.languages
+        ]
+        if updates:
+            connection.execute(
+                users.update().where(users.c.id == sa.bindparam('user_id')).values(
+                    interest_bits=sa.bindparam('interest_value'), language_bits=sa.bindparam('language_value'),
+                ),
+                updates,
+            )
+        last_id = rows[-1].id
+
+    rows = [
+        {'kind': kind, 'term': term, 'bit': bit}
+        for kind, vocabulary in vocabularies.items()
+        for term, bit in vocabulary.items()
+    ]
+    if rows:
+        op.bulk_insert(terms, rows)
+
+def downgrade():
+    op.drop_column('users', 'language_bits')
+    op.drop_column('users', 'interest_bits')
+    op.drop_index(op.f('ix_vocabulary_terms_id'), table_name='vocabulary_terms')
+    op.drop_table('vocabulary_terms')
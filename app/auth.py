@@ -1,12 +1,15 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Sequence, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
 from .database import get_db
+from .models.loading import CREDENTIALS, DETAIL, PRINCIPAL, USER_CARDS
+from .services.passwords import password_hasher, pwd_context
+from .services.principal import Principal, principal_cache
 import os
 from dotenv import load_dotenv
 
@@ -17,7 +20,6 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def verify_password(plain_password, hashed_password):
@@ -26,15 +28,25 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_user(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user(db: AsyncSession, username: str, options: Sequence = DETAIL):
+    """The user with this username, loading the columns of `options` (card and detail by default)"""
+    result = await db.execute(select(models.User).options(*options).filter(models.User.username == username))
+    return result.scalars().first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    """The user signing in with this email or username and password, loaded with CREDENTIALS; False otherwise"""
+    user = (await db.execute(select(models.User).options(*CREDENTIALS).filter(
+        or_(models.User.email == username, models.User.username == username)
+    ))).scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt is CPU bound, so it runs on the password hasher's workers
+    verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash is not None:
+        # Stored with an outdated cost; the caller's commit persists the rehash
+        user.hashed_password = new_hash
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -47,12 +59,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def _resolve_token(token: str, db: AsyncSession, options: Sequence = PRINCIPAL) -> Tuple[Principal, Optional[models.User]]:
+    """The token's principal, from the cache when possible; the user row (loaded with options) only on a miss"""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal, None
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    epoch = principal_cache.epoch
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -61,12 +79,44 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    user = await get_user(db, token_data.username, options)
     if user is None:
         raise credentials_exception
+    principal = Principal.from_user(user)
+    principal_cache.put(token, principal, payload.get("exp"), epoch)
+    return principal, user
+
+async def principal_for_token(token: str, db: AsyncSession) -> Principal:
+    """The principal of a bearer token; raises the same 401 as the HTTP dependencies"""
+    principal, _ = await _resolve_token(token, db)
+    return principal
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    return await principal_for_token(token, db)
+
+async def get_current_active_principal(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+async def principal_user(db: AsyncSession, principal: Principal, options: Sequence = USER_CARDS) -> models.User:
+    """The principal's user row, loaded with options; 401 if it no longer exists"""
+    user = await db.get(models.User, principal.id, options=options)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    principal, user = await _resolve_token(token, db, USER_CARDS)
+    if user is None:
+        user = await principal_user(db, principal)
     return user
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user 
\ No newline at end of file
+    return current_user
@@ -1,28 +1,69 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+from . import query_audit
+from .telemetry import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_pool, instrument_queries
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dating_app.db")
 
+def async_database_url(url: str) -> str:
+    """The asyncio driver variant of a database URL (aiosqlite / asyncpg)"""
+    scheme, _, rest = url.partition("://")
+    if scheme == "sqlite":
+        return "sqlite+aiosqlite://" + rest
+    if scheme in ("postgresql", "postgres", "postgresql+psycopg2"):
+        return "postgresql+asyncpg://" + rest
+    return url
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+def pool_options(url: str, asynchronous: bool = False) -> dict:
+    """Pool settings from the DB_POOL_* environment variables"""
+    if url.startswith("sqlite") and (url.endswith(":memory:") or url.rstrip("/").endswith(":")):
+        # In-memory SQLite lives in a single connection, so keep SQLAlchemy's default pool
+        return {}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if asynchronous else TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+        "pool_pre_ping": _flag("DB_POOL_PRE_PING", "false"),
+        "pool_use_lifo": _flag("DB_POOL_USE_LIFO", "false"),
+    }
+
 # Configure the engine based on the database URL
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        **pool_options(SQLALCHEMY_DATABASE_URL)
     )
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+
+# The synchronous engine remains for migrations, scripts and benchmarks; requests use the async one
+ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, asynchronous=True))
+
+instrument_pool(engine, "sync")
+instrument_pool(async_engine.sync_engine, "async")
+instrument_queries(engine)
+instrument_queries(async_engine.sync_engine)
+query_audit.instrument(engine)
+query_audit.instrument(async_engine.sync_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit, since an expired attribute cannot be refreshed implicitly under asyncio
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
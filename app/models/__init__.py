@@ -1,4 +1,5 @@
 from ..database import Base
-from .user import User, Message, Like, CompatibilityReport
+from .user import User, Message, Like, Match, SeenFilter, CompatibilityReport, MatchFeedEntry, VocabularyTerm
+from . import search  # noqa: F401  full-text DDL on the users table
 
-__all__ = ['Base', 'User', 'Message', 'Like', 'CompatibilityReport'] 
\ No newline at end of file
+__all__ = ['Base', 'User', 'Message', 'Like', 'Match', 'SeenFilter', 'CompatibilityReport', 'MatchFeedEntry', 'VocabularyTerm'] 
\ No newline at end of file
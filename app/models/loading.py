@@ -0,0 +1,40 @@
+"""
+Loader options per endpoint.
+
+Relationships are lazy by default, so reading one per row of a list fires a query
+per row. Each query an endpoint serializes therefore states how relationships are
+loaded: "selectin" (one extra IN query per relationship), "joined" (same SELECT,
+for many-to-one) or "raise" (must not be read at all). The response schemas only
+read columns today, so the list endpoints raise; an endpoint that starts reading a
+relationship must switch it to selectin or joined here.
+
+Queries also state which User columns they load, by column group or load_only,
+so hashed_password, bio and other display columns are only read where needed.
+"""
+from typing import Tuple
+from sqlalchemy.orm import joinedload, lazyload, load_only, raiseload, selectinload, undefer_group
+from .user import ELIGIBILITY_FIELDS, SCORED_FIELDS, Message, User
+
+LOADERS = {"selectin": selectinload, "joined": joinedload, "raise": raiseload, "lazy": lazyload}
+
+def load_options(model, default: str = "raise", **strategies: str) -> Tuple:
+    """Loader options for `model`: a strategy per named relationship, `default` for the others"""
+    options = [LOADERS[strategy](getattr(model, name)) for name, strategy in strategies.items()]
+    options.append(LOADERS[default]("*"))
+    return tuple(options)
+
+# User column groups beyond the default "card" columns (see models.user.User)
+DETAIL = (undefer_group("detail"),)
+SECRET = (undefer_group("secret"),)
+
+# Users read whole through schemas.User (card and detail columns)
+USER_CARDS = load_options(User) + DETAIL
+# Users signing in: the password hash and what the token needs
+CREDENTIALS = (load_only(User.id, User.username, User.hashed_password),) + load_options(User)
+# Users resolved into an auth Principal
+PRINCIPAL = (load_only(User.id, User.username, User.email, User.is_active),) + load_options(User)
+# Users read by candidate pools, feed rebuilds and scoring: no display-only columns
+MATCHING_COLUMNS = ("id",) + SCORED_FIELDS + ELIGIBILITY_FIELDS + ("interest_bits", "language_bits", "profile_revision")
+MATCHING = (load_only(*(getattr(User, name) for name in MATCHING_COLUMNS)),) + load_options(User)
+# GET /messages and GET /messages/{username}, serialized through schemas.Message
+MESSAGES = load_options(Message)
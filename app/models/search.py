@@ -0,0 +1,56 @@
+"""
+Full-text index of profile text: bio, occupation and interests.
+
+SQLite: profile_search is a contentless FTS5 table keyed by user id, written by
+triggers on users, so every insert, update and delete keeps it in sync within
+the same transaction. Interests are indexed as their words rather than their
+JSON text. The unicode61 tokenizer folds case and diacritics.
+
+PostgreSQL: users.search_vector is a stored generated tsvector, with interests
+weighted A, occupation B and bio C, behind a GIN index. The 'simple'
+configuration neither stems nor drops stop words, like FTS5 here.
+
+Both are created with the users table (metadata.create_all) and by migration
+011. On other databases, or without these objects, services.search falls back to
+an in-memory index.
+"""
+from sqlalchemy import DDL, event
+from .user import User
+
+FTS_TABLE = "profile_search"
+# FTS5 column order, which bm25() weights follow
+FTS_COLUMNS = ("bio", "occupation", "interests")
+
+def _fts_values(row: str) -> str:
+    return "%s.bio, %s.occupation, (SELECT group_concat(value, ' ') FROM json_each(%s.interests))" % (row, row, row)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='', tokenize='unicode61 remove_diacritics 2')"
+    % (FTS_TABLE, ", ".join(FTS_COLUMNS)),
+    "CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (FTS_TABLE, ", ".join(FTS_COLUMNS), _fts_values("new")),
+    "CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END"
+    % (FTS_TABLE, FTS_TABLE, ", ".join(FTS_COLUMNS), _fts_values("old")),
+    "CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF %s ON users BEGIN "
+    "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+    "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END"
+    % (", ".join(FTS_COLUMNS), FTS_TABLE, FTS_TABLE, ", ".join(FTS_COLUMNS), _fts_values("old"),
+       FTS_TABLE, ", ".join(FTS_COLUMNS), _fts_values("new")),
+)
+# Contentless tables cannot be rebuilt from users, so they go with it
+SQLITE_DROP = "DROP TABLE IF EXISTS %s" % FTS_TABLE
+
+POSTGRESQL_DDL = (
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(interests::text, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(occupation, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(bio, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_users_search ON users USING gin (search_vector)",
+)
+
+for _statement in SQLITE_DDL:
+    event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRESQL_DDL:
+    event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+event.listen(User.__table__, "before_drop", DDL(SQLITE_DROP).execute_if(dialect="sqlite"))
@@ -1,43 +1,110 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, JSON, Float, Enum
-from sqlalchemy.orm import relationship
+import math
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, DateTime, JSON, Float, Enum, Index, LargeBinary, UniqueConstraint, event, inspect
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import deferred, relationship
 from ..database import Base
 from ..schemas.user import PersonalityTrait
 
+# Size of the lat/lon grid cells stored in User.geo_cell
+GEO_CELL_DEGREES = 0.5
+GEO_CELL_COLUMNS = int(360 / GEO_CELL_DEGREES)
+
+def geo_cell(latitude: Optional[float], longitude: Optional[float]) -> Optional[int]:
+    """Row-major id of the grid cell containing a coordinate; None without coordinates"""
+    if latitude is None or longitude is None:
+        return None
+    row = min(int(math.floor((latitude + 90) / GEO_CELL_DEGREES)), int(180 / GEO_CELL_DEGREES) - 1)
+    # Clamped like the row, so longitude 180 stays in the easternmost column instead of wrapping
+    column = min(max(int(math.floor((longitude + 180) / GEO_CELL_DEGREES)), 0), GEO_CELL_COLUMNS - 1)
+    return row * GEO_CELL_COLUMNS + column
+
+# Profile fields read by CompatibilityService; editing any of them bumps User.profile_revision
+SCORED_FIELDS = (
+    "interests", "personality_traits", "languages", "relationship_goals",
+    "smoking", "drinking", "education", "wants_children",
+)
+# Profile fields that decide who is eligible for whose match feed (see MatchFeedService)
+ELIGIBILITY_FIELDS = (
+    "gender", "looking_for", "date_of_birth", "min_age_preference", "max_age_preference",
+    "latitude", "longitude", "max_distance", "is_active",
+)
+
+class UTCDateTime(TypeDecorator):
+    """
+    Timezone-aware datetimes stored in UTC. SQLite has no timezone type, so values
+    are stored naive there and get their UTC tzinfo back when loaded.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        return value.replace(tzinfo=None) if dialect.name == "sqlite" else value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
 class User(Base):
+    """
+    Columns form three groups. "card" columns (the default) load with every User
+    query; "detail" columns (display-only text) and "secret" columns (the password
+    hash) are deferred, and load only when a query undefers their group (see
+    models.loading) or on first access.
+    """
     __tablename__ = "users"
+    __table_args__ = (
+        # Candidate prefilter (services.candidates): equality on the first three, birth-date range last
+        Index("ix_users_candidates", "gender", "looking_for", "is_active", "date_of_birth"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     username = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
+    hashed_password = deferred(Column(String), group="secret")
     first_name = Column(String)
     last_name = Column(String)
     date_of_birth = Column(Date)
     gender = Column(String)
     looking_for = Column(String)
-    bio = Column(String, nullable=True)
+    bio = deferred(Column(String, nullable=True), group="detail")
     interests = Column(JSON, nullable=True)
     personality_traits = Column(JSON, nullable=True)  # List of PersonalityTrait
-    location = Column(String, nullable=True)
+    location = deferred(Column(String, nullable=True), group="detail")
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
-    profile_picture = Column(String, nullable=True)
+    geo_cell = Column(Integer, nullable=True, index=True)  # see geo_cell(); kept in sync on flush
+    profile_picture = deferred(Column(String, nullable=True), group="detail")
     min_age_preference = Column(Integer, nullable=True)
     max_age_preference = Column(Integer, nullable=True)
     max_distance = Column(Integer, nullable=True)  # in kilometers
     relationship_goals = Column(String, nullable=True)
     languages = Column(JSON, nullable=True)  # List of languages
-    height = Column(Integer, nullable=True)  # in cm
-    zodiac_sign = Column(String, nullable=True)
+    interest_bits = Column(LargeBinary, nullable=True)  # interests as an interned bitset, see services.vocabulary
+    language_bits = Column(LargeBinary, nullable=True)  # languages as an interned bitset
+    height = deferred(Column(Integer, nullable=True), group="detail")  # in cm
+    zodiac_sign = deferred(Column(String, nullable=True), group="detail")
     education = Column(String, nullable=True)
-    occupation = Column(String, nullable=True)
+    occupation = deferred(Column(String, nullable=True), group="detail")
     smoking = Column(String, nullable=True)
     drinking = Column(String, nullable=True)
-    has_children = Column(Boolean, nullable=True)
+    has_children = deferred(Column(Boolean, nullable=True), group="detail")
     wants_children = Column(Boolean, nullable=True)
     is_active = Column(Boolean, default=True)
     last_active = Column(Date, nullable=True)
     compatibility_score = Column(Float, nullable=True)
+    profile_revision = Column(Integer, nullable=False, default=1, server_default="1")  # see SCORED_FIELDS
+    revision = Column(Integer, nullable=False, default=1, server_default="1")  # bumped by any change; see services.revisions
 
     # Relationships
     sent_messages = relationship("Message", back_populates="sender", foreign_keys="Message.sender_id")
@@ -46,14 +113,59 @@ class User(Base):
     received_likes = relationship("Like", back_populates="liked", foreign_keys="Like.liked_id")
     compatibility_reports = relationship("CompatibilityReport", back_populates="user", foreign_keys="CompatibilityReport.user_id")
 
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def _sync_geo_cell(mapper, connection, target):
+    target.geo_cell = geo_cell(target.latitude, target.longitude)
+
+@event.listens_for(User.interests, "set")
+def _clear_interest_bits(target, value, oldvalue, initiator):
+    target.interest_bits = None
+
+@event.listens_for(User.languages, "set")
+def _clear_language_bits(target, value, oldvalue, initiator):
+    target.language_bits = None
+
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def _sync_term_bits(mapper, connection, target):
+    from ..services.vocabulary import INTEREST, LANGUAGE, VocabularyService
+    if target.interest_bits is None and target.interests:
+        target.interest_bits = VocabularyService.encode(connection, INTEREST, target.interests)
+    if target.language_bits is None and target.languages:
+        target.language_bits = VocabularyService.encode(connection, LANGUAGE, target.languages)
+
+@event.listens_for(User, "before_update")
+def _bump_profile_revision(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in SCORED_FIELDS):
+        target.profile_revision = (target.profile_revision or 0) + 1
+
+@event.listens_for(User, "before_update")
+def _bump_revision(mapper, connection, target):
+    state = inspect(target)
+    if any(attr.history.has_changes() for attr in state.attrs if attr.key in mapper.columns and attr.key != "revision"):
+        target.revision = (target.revision or 0) + 1
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    from ..services.principal import invalidate_user
+    invalidate_user(connection, target.id)
+
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Serves each direction of a conversation in (timestamp, id) order
+        Index("ix_messages_conversation", "sender_id", "receiver_id", "timestamp", "id"),
+    )
 
+    # Ids only grow, so they order messages sent within the same timestamp
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
-    timestamp = Column(Date)
+    timestamp = Column(UTCDateTime, default=utcnow)
     is_read = Column(Boolean, default=False)
 
     sender = relationship("User", back_populates="sent_messages", foreign_keys=[sender_id])
@@ -61,6 +173,11 @@ class Message(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        # One like per direction; "did A like B" is answered from the index alone
+        Index("ux_likes_liker_liked", "liker_id", "liked_id", unique=True),
+        Index("ix_likes_liked_liker", "liked_id", "liker_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     liker_id = Column(Integer, ForeignKey("users.id"))
@@ -70,8 +187,33 @@ class Like(Base):
     liker = relationship("User", back_populates="sent_likes", foreign_keys=[liker_id])
     liked = relationship("User", back_populates="received_likes", foreign_keys=[liked_id])
 
+class Match(Base):
+    """A mutual like, stored once for each side so a user's matches are one index range"""
+    __tablename__ = "matches"
+    __table_args__ = (
+        UniqueConstraint("user_id", "matched_user_id", name="uq_matches_user_matched"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    matched_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(UTCDateTime, default=utcnow)
+
+class SeenFilter(Base):
+    """Serialized Bloom filter of the users a user liked or passed on"""
+    __tablename__ = "seen_filters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    bloom = Column(LargeBinary, nullable=False)
+    items = Column(Integer, nullable=False, default=0)
+    updated_at = Column(UTCDateTime, default=utcnow)
+
 class CompatibilityReport(Base):
+    """Cached compatibility of user -> target, valid while both profile revisions match"""
     __tablename__ = "compatibility_reports"
+    __table_args__ = (
+        Index("ux_compatibility_reports_user_target", "user_id", "target_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -81,5 +223,38 @@ class CompatibilityReport(Base):
     personality_match = Column(JSON)  # Dict of personality trait matches
     potential_issues = Column(JSON)  # List of potential issues
     timestamp = Column(Date)
+    user_revision = Column(Integer, nullable=True)  # User.profile_revision of both users when scored
+    target_revision = Column(Integer, nullable=True)
+
+    user = relationship("User", back_populates="compatibility_reports", foreign_keys=[user_id]) 
+
+class VocabularyTerm(Base):
+    """An interned interest or language; `bit` is its position in the users' bitsets"""
+    __tablename__ = "vocabulary_terms"
+    __table_args__ = (
+        UniqueConstraint("kind", "term", name="uq_vocabulary_terms_kind_term"),
+        UniqueConstraint("kind", "bit", name="uq_vocabulary_terms_kind_bit"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    term = Column(String, nullable=False)
+    bit = Column(Integer, nullable=False)
+
+class MatchFeedEntry(Base):
+    """One precomputed candidate in a user's top-K match feed, ordered by rank"""
+    __tablename__ = "match_feed"
+    __table_args__ = (
+        UniqueConstraint("user_id", "candidate_id", name="uq_match_feed_user_candidate"),
+        Index("ix_match_feed_user_rank", "user_id", "rank"),
+        Index("ix_match_feed_candidate", "candidate_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    candidate_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    score = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
 
-    user = relationship("User", back_populates="compatibility_reports", foreign_keys=[user_id]) 
\ No newline at end of file
+    candidate = relationship("User", foreign_keys=[candidate_id])
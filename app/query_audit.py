@@ -0,0 +1,120 @@
+"""
+N+1 detection: the SQL of a request or test, grouped by statement shape.
+
+Statements are fingerprinted by replacing literals and bind parameters with `?`
+and collapsing IN lists, so "the same query for another row" has one fingerprint.
+A fingerprint executed THRESHOLD times or more within one audit is reported as a
+likely N+1. Relationship lazy loads are recorded separately, by relationship, and
+a strict audit raises UnplannedLazyLoad on the first one instead: every
+relationship an endpoint reads is expected to be loaded by its loader options
+(see app.models.loading).
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+import logging
+import os
+import re
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+
+logger = logging.getLogger(__name__)
+
+# off, warn (log likely N+1s per request) or strict (also raise on lazy loads)
+MODE = os.getenv("QUERY_AUDIT", "off").lower()
+THRESHOLD = int(os.getenv("QUERY_AUDIT_THRESHOLD", "5"))
+
+class UnplannedLazyLoad(Exception):
+    """A relationship was lazy loaded inside a strict audit"""
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),                   # string literals
+    (re.compile(r"%\(\w+\)s|\$\d+|:\w+|%s"), "?"),          # named and numbered bind parameters
+    (re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),      # numeric literals
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),     # IN lists of any length
+    (re.compile(r"\s+"), " "),
+]
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """The shape of a SQL statement: literals and parameters become ?, IN lists one (?)"""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+class QueryAudit:
+    """Statements and lazy loads seen while the audit is current"""
+
+    def __init__(self, strict: bool = False, threshold: int = THRESHOLD):
+        self.strict = strict
+        self.threshold = threshold
+        self.shapes: Counter = Counter()
+        self.lazy_loads: Counter = Counter()
+
+    @property
+    def queries(self) -> int:
+        return sum(self.shapes.values())
+
+    def repeated(self) -> Dict[str, int]:
+        """Fingerprints executed at least `threshold` times: likely N+1 queries"""
+        return {shape: count for shape, count in self.shapes.most_common() if count >= self.threshold}
+
+    def problems(self) -> List[str]:
+        found = ["%dx %s" % (count, shape) for shape, count in self.repeated().items()]
+        found += ["%dx lazy load of %s" % (count, name) for name, count in self.lazy_loads.most_common()]
+        return found
+
+current_audit: ContextVar[Optional[QueryAudit]] = ContextVar("current_audit", default=None)
+
+@contextmanager
+def audit_queries(strict: bool = False, threshold: int = THRESHOLD) -> Iterator[QueryAudit]:
+    """Audit the statements run in this context (and tasks, greenlets and threads it starts)"""
+    audit = QueryAudit(strict, threshold)
+    token = current_audit.set(audit)
+    try:
+        yield audit
+    finally:
+        current_audit.reset(token)
+
+def instrument(engine: Engine) -> None:
+    """Feed an engine's statements to the current audit (pass AsyncEngine.sync_engine for async engines)"""
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        audit = current_audit.get()
+        if audit is not None:
+            audit.shapes[fingerprint(statement)] += 1
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(state: ORMExecuteState) -> None:
+    # Registered on the Session class, so every session (AsyncSession included) is covered
+    audit = current_audit.get()
+    if audit is None or not state.is_select or state.lazy_loaded_from is None:
+        return
+    attribute = state.loader_strategy_path[-1] if state.loader_strategy_path else None
+    name = str(attribute) if attribute is not None else state.lazy_loaded_from.class_.__name__
+    audit.lazy_loads[name] += 1
+    if audit.strict:
+        raise UnplannedLazyLoad("%s was lazy loaded; load it with the query's loader options" % name)
+
+class QueryAuditMiddleware:
+    """Audits every HTTP request and logs its likely N+1 queries; strict mode raises on lazy loads"""
+
+    def __init__(self, app, strict: bool = False, threshold: int = THRESHOLD):
+        self.app = app
+        self.strict = strict
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with audit_queries(self.strict, self.threshold) as audit:
+            await self.app(scope, receive, send)
+        problems = audit.problems()
+        if problems:
+            route = getattr(scope.get("route"), "path", scope["path"])
+            logger.warning("%s %s: %s", scope["method"], route, "; ".join(problems))
@@ -7,7 +7,9 @@ from .user import (
     Token,
     TokenData,
     Message,
+    MessageBase,
     MessageCreate,
+    MessagePage,
     Like,
     LikeCreate,
     MatchResponse,
@@ -24,7 +26,9 @@ __all__ = [
     'Token',
     'TokenData',
     'Message',
+    'MessageBase',
     'MessageCreate',
+    'MessagePage',
     'Like',
     'LikeCreate',
     'MatchResponse',
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, conint, confloat
 from typing import Optional, List, Dict
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
 
 class PersonalityTrait(str, Enum):
@@ -32,6 +32,8 @@ class UserProfile(BaseModel):
     interests: Optional[List[str]] = None
     personality_traits: Optional[List[PersonalityTrait]] = None
     location: Optional[str] = None
+    latitude: Optional[confloat(ge=-90, le=90)] = None
+    longitude: Optional[confloat(ge=-180, le=180)] = None
     profile_picture: Optional[str] = None
     min_age_preference: Optional[conint(ge=18, le=100)] = None
     max_age_preference: Optional[conint(ge=18, le=100)] = None
@@ -57,6 +59,8 @@ class User(UserBase):
     interests: Optional[List[str]] = None
     personality_traits: Optional[List[PersonalityTrait]] = None
     location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     profile_picture: Optional[str] = None
     min_age_preference: Optional[int] = None
     max_age_preference: Optional[int] = None
@@ -93,12 +97,17 @@ class Message(MessageBase):
     id: int
     sender_id: int
     receiver_id: int
-    timestamp: date
+    timestamp: datetime
     is_read: bool = False
 
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    """Newest first; pass next_cursor as `before` to get the page of older messages"""
+    messages: List[Message]
+    next_cursor: Optional[str] = None
+
 class LikeCreate(BaseModel):
     liked_id: int
 
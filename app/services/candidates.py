@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Query, Session
+from ..models.loading import MATCHING
+from ..models.user import User
+
+def age_on(date_of_birth: Optional[date], today: date) -> Optional[int]:
+    """Age in whole years; a February 29 birthday moves to March 1 in common years"""
+    if date_of_birth is None:
+        return None
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+def _years_before(today: date, years: int) -> date:
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        # February 29 in a common year: the latest existing day before it
+        return today.replace(year=today.year - years, day=28)
+
+def birth_date_range(min_age: Optional[int], max_age: Optional[int], today: date) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Inclusive (earliest, latest) birth dates of people aged min_age..max_age on `today`,
+    None where the age is unbounded. These bound date_of_birth in an index range,
+    which an age computed in SQL could not.
+    """
+    latest = _years_before(today, min_age) if min_age is not None else None
+    earliest = _years_before(today, max_age + 1) + timedelta(days=1) if max_age is not None else None
+    return earliest, latest
+
+def _between(column, earliest: Optional[date], latest: Optional[date]):
+    if earliest is not None and latest is not None:
+        return column.between(earliest, latest)
+    if earliest is not None:
+        return column >= earliest
+    if latest is not None:
+        return column <= latest
+    return None
+
+def age_columns(users: Sequence[User], today: date) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ages, min_age_preferences, max_age_preferences) of users as float arrays, NaN where unset"""
+    def column(values: Iterable[Optional[int]]) -> np.ndarray:
+        return np.fromiter((value if value is not None else np.nan for value in values), dtype=np.float64, count=len(users))
+    return (
+        column(age_on(user.date_of_birth, today) for user in users),
+        column(user.min_age_preference for user in users),
+        column(user.max_age_preference for user in users),
+    )
+
+class CandidateFilter:
+    """
+    SQL prefilter of match candidates, served by ix_users_candidates.
+
+    Eligibility is symmetric: both users are active, each one's gender is what the
+    other is looking for, and each one's age is inside the other's age preferences.
+    A user without a date of birth only matches users who set no age preference.
+    """
+
+    @staticmethod
+    def today() -> date:
+        return datetime.utcnow().date()
+
+    @staticmethod
+    def pool(
+        db: Session, gender: str, looking_for: str,
+        earliest: Optional[date] = None, latest: Optional[date] = None,
+    ) -> Query:
+        """Active users a person with this gender/looking_for can match, born within the given bounds"""
+        query = db.query(User).options(*MATCHING).filter(
+            User.gender == looking_for,
+            User.looking_for == gender,
+            User.is_active == True,
+        )
+        born = _between(User.date_of_birth, earliest, latest)
+        return query.filter(born) if born is not None else query
+
+    @staticmethod
+    def for_user(db: Session, user: User, today: Optional[date] = None) -> Query:
+        """Candidates of one user, with both sides' age preferences applied in SQL"""
+        today = today or CandidateFilter.today()
+        earliest, latest = birth_date_range(user.min_age_preference, user.max_age_preference, today)
+        query = CandidateFilter.pool(db, user.gender, user.looking_for, earliest, latest).filter(User.id != user.id)
+        age = age_on(user.date_of_birth, today)
+        if age is None:
+            return query.filter(User.min_age_preference.is_(None), User.max_age_preference.is_(None))
+        return query.filter(
+            or_(User.min_age_preference.is_(None), User.min_age_preference <= age),
+            or_(User.max_age_preference.is_(None), User.max_age_preference >= age),
+        )
+
+    @staticmethod
+    def group_range(users: Sequence[User], today: date) -> Tuple[Optional[date], Optional[date]]:
+        """Birth-date bounds wide enough for every user's age preferences, to prefilter a shared pool"""
+        ranges = [birth_date_range(user.min_age_preference, user.max_age_preference, today) for user in users]
+        earliest = [bound for bound, _ in ranges]
+        latest = [bound for _, bound in ranges]
+        return (
+            None if not ranges or None in earliest else min(earliest),
+            None if not ranges or None in latest else max(latest),
+        )
+
+    @staticmethod
+    def age_mask(
+        user: User, today: date, ages: np.ndarray, min_preferences: np.ndarray, max_preferences: np.ndarray,
+    ) -> np.ndarray:
+        """Which candidates (see age_columns) satisfy both users' age preferences, like for_user"""
+        keep = np.ones(len(ages), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            # NaN comparisons are False, so candidates without an age fail a set preference
+            if user.min_age_preference is not None:
+                keep &= ages >= user.min_age_preference
+            if user.max_age_preference is not None:
+                keep &= ages <= user.max_age_preference
+            age = age_on(user.date_of_birth, today)
+            if age is None:
+                return keep & np.isnan(min_preferences) & np.isnan(max_preferences)
+            keep &= np.isnan(min_preferences) | (min_preferences <= age)
+            keep &= np.isnan(max_preferences) | (max_preferences >= age)
+        return keep
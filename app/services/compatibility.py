@@ -1,11 +1,56 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+import copy
+import os
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from ..models.loading import MATCHING
 from ..models.user import User, CompatibilityReport
 from ..schemas.user import PersonalityTrait
+from ..telemetry import timed
+from .cache import LRUCache
+from .vocabulary import INTEREST, VocabularyService
+from .features import NO_TRAIT, FeatureVocabularies, ProfileFeatures, contains, popcount
+
+# In-process tier in front of the compatibility_reports table, keyed by (user_id, target_id)
+report_cache = LRUCache(int(os.getenv("COMPATIBILITY_CACHE_SIZE", "10000")))
+
+# Some traits are complementary
+COMPLEMENTARY_TRAITS = {
+    PersonalityTrait.INTROVERT: PersonalityTrait.EXTROVERT,
+    PersonalityTrait.EXTROVERT: PersonalityTrait.INTROVERT,
+    PersonalityTrait.ADVENTUROUS: PersonalityTrait.CAUTIOUS,
+    PersonalityTrait.CAUTIOUS: PersonalityTrait.ADVENTUROUS,
+    PersonalityTrait.SPONTANEOUS: PersonalityTrait.PLANNED,
+    PersonalityTrait.PLANNED: PersonalityTrait.SPONTANEOUS,
+    PersonalityTrait.ANALYTICAL: PersonalityTrait.CREATIVE,
+    PersonalityTrait.CREATIVE: PersonalityTrait.ANALYTICAL,
+    PersonalityTrait.TRADITIONAL: PersonalityTrait.MODERN,
+    PersonalityTrait.MODERN: PersonalityTrait.TRADITIONAL
+}
+
+# COMPLEMENTARY_TRAITS as trait vocabulary ids (enum traits always take the first ids)
+_TRAIT_IDS = FeatureVocabularies().traits
+_COMPLEMENT_IDS = np.array(
+    [_TRAIT_IDS.get(COMPLEMENTARY_TRAITS[trait]) for trait in PersonalityTrait], dtype=np.int64
+)
+
+def top_ranked(ids: np.ndarray, scores: np.ndarray, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, scores) ordered by descending score, ties broken by ascending id, cut to limit"""
+    rows = np.arange(len(ids))
+    if limit is not None and 0 < limit < len(ids):
+        # Keep every row tied with the cut-off so the tie-break stays deterministic
+        cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        rows = np.flatnonzero(scores >= cutoff)
+    order = rows[np.lexsort((ids[rows], -scores[rows]))][:limit]
+    return ids[order], scores[order]
 
 class CompatibilityService:
     @staticmethod
+    @timed("compatibility.calculate_compatibility")
     def calculate_compatibility(user1: User, user2: User) -> Tuple[float, List[str], Dict[str, float], List[str]]:
         """
         Calculate compatibility score between two users based on various factors.
@@ -18,7 +63,9 @@ class CompatibilityService:
         
         # Calculate interest compatibility (30% of total score)
         if user1.interests and user2.interests:
-            common_interests = list(set(user1.interests) & set(user2.interests))
+            common_interests = VocabularyService.shared_terms(INTEREST, user1, user2)
+            if common_interests is None:
+                common_interests = list(set(user1.interests) & set(user2.interests))
             interest_score = len(common_interests) / max(len(user1.interests), len(user2.interests))
             score += interest_score * 30
         
@@ -28,20 +75,7 @@ class CompatibilityService:
                 if trait in user2.personality_traits:
                     personality_match[trait] = 1.0
                 else:
-                    # Some traits are complementary
-                    complementary_traits = {
-                        PersonalityTrait.INTROVERT: PersonalityTrait.EXTROVERT,
-                        PersonalityTrait.EXTROVERT: PersonalityTrait.INTROVERT,
-                        PersonalityTrait.ADVENTUROUS: PersonalityTrait.CAUTIOUS,
-                        PersonalityTrait.CAUTIOUS: PersonalityTrait.ADVENTUROUS,
-                        PersonalityTrait.SPONTANEOUS: PersonalityTrait.PLANNED,
-                        PersonalityTrait.PLANNED: PersonalityTrait.SPONTANEOUS,
-                        PersonalityTrait.ANALYTICAL: PersonalityTrait.CREATIVE,
-                        PersonalityTrait.CREATIVE: PersonalityTrait.ANALYTICAL,
-                        PersonalityTrait.TRADITIONAL: PersonalityTrait.MODERN,
-                        PersonalityTrait.MODERN: PersonalityTrait.TRADITIONAL
-                    }
-                    if trait in complementary_traits and complementary_traits[trait] in user2.personality_traits:
+                    if trait in COMPLEMENTARY_TRAITS and COMPLEMENTARY_TRAITS[trait] in user2.personality_traits:
                         personality_match[trait] = 0.8  # Complementary traits get a high score
                     else:
                         personality_match[trait] = 0.3  # Different traits get a lower score
@@ -96,50 +130,222 @@ class CompatibilityService:
         
         # Check language compatibility (10% of total score)
         if user1.languages and user2.languages:
-            common_languages = list(set(user1.languages) & set(user2.languages))
+            if user1.language_bits is not None and user2.language_bits is not None:
+                common_languages = int.from_bytes(user1.language_bits, "little") & int.from_bytes(user2.language_bits, "little")
+            else:
+                common_languages = list(set(user1.languages) & set(user2.languages))
             if common_languages:
                 score += 10
             else:
                 potential_issues.append("No common languages")
         
         return score, common_interests, personality_match, potential_issues
-    
+
+    @staticmethod
+    @timed("compatibility.score_pairs")
+    def score_pairs(left: ProfileFeatures, right: ProfileFeatures) -> np.ndarray:
+        """
+        Vectorized calculate_compatibility(left[i], right[i])[0] over two feature batches.
+        Either batch may hold a single row, which is broadcast against the other one.
+        Terms are accumulated in the same order as the scalar function, so the float64
+        results are identical to it.
+        """
+        vocabularies = right.vocabularies
+        size = np.broadcast_shapes((len(left),), (len(right),))[0]
+        score = np.zeros(size, dtype=np.float64)
+
+        # Interests (30%)
+        has_interests = (left.interest_len > 0) & (right.interest_len > 0)
+        common = popcount(left.interest_bits & right.interest_bits).sum(axis=1, dtype=np.int64)
+        longest = np.maximum(left.interest_len, right.interest_len)
+        interest_score = np.divide(common, longest, out=np.zeros(size), where=has_interests)
+        score += interest_score * 30
+
+        # Personality (25%): left's distinct traits are summed in their original order
+        has_traits = (left.trait_len > 0) & (right.trait_len > 0)
+        personality_sum = np.zeros(size, dtype=np.float64)
+        for slot in range(left.trait_order.shape[1]):
+            trait_ids = left.trait_order[:, slot]
+            in_table = (trait_ids >= 0) & (trait_ids < len(_COMPLEMENT_IDS))
+            complement_ids = np.where(in_table, _COMPLEMENT_IDS[np.clip(trait_ids, 0, len(_COMPLEMENT_IDS) - 1)], -1)
+            match = np.where(
+                contains(right.trait_bits, trait_ids), 1.0,
+                np.where(contains(right.trait_bits, complement_ids), 0.8, 0.3),
+            )
+            personality_sum += np.where(trait_ids != NO_TRAIT, match, 0.0)
+        personality_score = np.divide(personality_sum, left.trait_len, out=np.zeros(size), where=has_traits)
+        score += np.where(has_traits, personality_score * 25, 0.0)
+
+        # Relationship goals (15%)
+        goals = vocabularies.relationship_goals
+        left_goals, right_goals = left.relationship_goals, right.relationship_goals
+        casual, friendship = goals.get("casual"), goals.get("friendship")
+        close = ((left_goals == casual) & (right_goals == friendship)) | \
+                ((left_goals == friendship) & (right_goals == casual))
+        both = (left_goals > 0) & (right_goals > 0)
+        score += np.where(both & (left_goals == right_goals), 15, np.where(both & close, 10, 0))
+
+        # Children (10%)
+        both = (left.wants_children >= 0) & (right.wants_children >= 0)
+        score += np.where(both & (left.wants_children == right.wants_children), 10, 0)
+
+        # Lifestyle (10%)
+        lifestyle_score = np.zeros(size, dtype=np.int64)
+        for field in ("smoking", "drinking"):
+            vocabulary = getattr(vocabularies, field)
+            left_codes, right_codes = getattr(left, field), getattr(right, field)
+            never, sometimes = vocabulary.get("never"), vocabulary.get("sometimes")
+            close = ((left_codes == never) & (right_codes == sometimes)) | \
+                    ((left_codes == sometimes) & (right_codes == never))
+            both = (left_codes > 0) & (right_codes > 0)
+            lifestyle_score += np.where(both & (left_codes == right_codes), 3, np.where(both & close, 1, 0))
+        both = (left.education > 0) & (right.education > 0)
+        lifestyle_score += np.where(both & (left.education == right.education), 4, 0)
+        score += lifestyle_score
+
+        # Languages (10%)
+        shares_language = (left.language_bits & right.language_bits).any(axis=1)
+        score += np.where(shares_language, 10, 0)
+
+        return score
+
+    @staticmethod
+    def calculate_compatibility_batch(user: User, candidates: ProfileFeatures) -> np.ndarray:
+        """Score one user (as user1) against every candidate: calculate_compatibility(user, candidate)"""
+        source = ProfileFeatures.from_users([user], like=candidates)
+        return CompatibilityService.score_pairs(source, candidates)
+
+    @staticmethod
+    def calculate_compatibility_reverse(users: ProfileFeatures, target: User) -> np.ndarray:
+        """Score every user (as user1) against one target: calculate_compatibility(user, target)"""
+        encoded = ProfileFeatures.from_users([target], like=users)
+        return CompatibilityService.score_pairs(users, encoded)
+
+    @staticmethod
+    @timed("compatibility.rank_candidates")
+    def rank_candidates(user: User, candidates: ProfileFeatures, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (candidate ids, scores) ordered by descending score, ties broken by ascending id"""
+        scores = CompatibilityService.calculate_compatibility_batch(user, candidates)
+        return top_ranked(candidates.ids, scores, limit)
+
     @staticmethod
     def create_compatibility_report(db: Session, user_id: int, target_id: int) -> CompatibilityReport:
-        """Create a compatibility report between two users"""
-        user = db.query(User).filter(User.id == user_id).first()
-        target = db.query(User).filter(User.id == target_id).first()
+        """Score a pair of users and upsert their compatibility report"""
+        users = {u.id: u for u in db.query(User).options(*MATCHING).filter(User.id.in_((user_id, target_id))).all()}
+        user, target = users.get(user_id), users.get(target_id)
         
         if not user or not target:
             return None
         
-        score, common_interests, personality_match, potential_issues = CompatibilityService.calculate_compatibility(user, target)
-        
-        report = CompatibilityReport(
-            user_id=user_id,
-            target_id=target_id,
-            compatibility_score=score,
-            common_interests=common_interests,
-            personality_match=personality_match,
-            potential_issues=potential_issues,
-            timestamp=datetime.utcnow().date()
-        )
-        
-        db.add(report)
+        _upsert_reports(db, [_report_values(user, target)])
         db.commit()
-        db.refresh(report)
         
+        report = db.query(CompatibilityReport).populate_existing().filter(
+            CompatibilityReport.user_id == user_id,
+            CompatibilityReport.target_id == target_id
+        ).one()
+        report_cache.put((user_id, target_id), _snapshot(report))
         return report
     
     @staticmethod
     def get_compatibility_report(db: Session, user_id: int, target_id: int) -> CompatibilityReport:
-        """Get existing compatibility report or create a new one"""
+        """
+        Get the compatibility report for the users' current profile revisions,
+        rescoring it when either profile changed since it was stored.
+        Hits in the in-process LRU tier return a detached copy.
+        """
+        revisions = dict(db.query(User.id, User.profile_revision).filter(User.id.in_((user_id, target_id))).all())
+        if user_id not in revisions or target_id not in revisions:
+            return None
+        current = (revisions[user_id], revisions[target_id])
+        
+        cached = report_cache.get((user_id, target_id))
+        if cached is not None and (cached["user_revision"], cached["target_revision"]) == current:
+            return CompatibilityReport(**copy.deepcopy(cached))
+        
         report = db.query(CompatibilityReport).filter(
             CompatibilityReport.user_id == user_id,
             CompatibilityReport.target_id == target_id
         ).first()
+        if report and (report.user_revision, report.target_revision) == current:
+            report_cache.put((user_id, target_id), _snapshot(report))
+            return report
         
-        if not report:
-            report = CompatibilityService.create_compatibility_report(db, user_id, target_id)
-        
-        return report 
\ No newline at end of file
+        return CompatibilityService.create_compatibility_report(db, user_id, target_id)
+
+    @staticmethod
+    def recompute_reports(db: Session, pairs: List[Tuple[int, int]]) -> int:
+        """
+        Rescore existing (user_id, target_id) reports with one user query and bulk
+        upserts, and drop them from report_cache (does not commit). Returns how many
+        were written; pairs whose users no longer exist are skipped.
+        """
+        user_ids = {user_id for pair in pairs for user_id in pair}
+        users = {}
+        for chunk in _chunks(sorted(user_ids)):
+            users.update((user.id, user) for user in db.query(User).options(*MATCHING).filter(User.id.in_(chunk)))
+        rows = [_report_values(users[user_id], users[target_id])
+                for user_id, target_id in pairs if user_id in users and target_id in users]
+        _upsert_reports(db, rows)
+        for user_id, target_id in pairs:
+            report_cache.pop((user_id, target_id))
+        return len(rows)
+
+    @staticmethod
+    async def create_compatibility_report_async(db: AsyncSession, user_id: int, target_id: int) -> CompatibilityReport:
+        """create_compatibility_report for an AsyncSession"""
+        return await db.run_sync(CompatibilityService.create_compatibility_report, user_id, target_id)
+    
+    @staticmethod
+    async def get_compatibility_report_async(db: AsyncSession, user_id: int, target_id: int) -> CompatibilityReport:
+        """get_compatibility_report for an AsyncSession"""
+        return await db.run_sync(CompatibilityService.get_compatibility_report, user_id, target_id)
+
+def _snapshot(report: CompatibilityReport) -> Dict[str, object]:
+    return {column.key: copy.deepcopy(getattr(report, column.key)) for column in CompatibilityReport.__table__.columns}
+
+def _chunks(values: List, size: int = 500):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _report_values(user: User, target: User) -> Dict[str, object]:
+    score, common_interests, personality_match, potential_issues = CompatibilityService.calculate_compatibility(user, target)
+    return {
+        "user_id": user.id,
+        "target_id": target.id,
+        "compatibility_score": score,
+        "common_interests": common_interests,
+        "personality_match": personality_match,
+        "potential_issues": potential_issues,
+        "timestamp": datetime.utcnow().date(),
+        "user_revision": user.profile_revision,
+        "target_revision": target.profile_revision,
+    }
+
+def _upsert_reports(db: Session, rows: List[Dict[str, object]]) -> None:
+    """Insert or overwrite the (user_id, target_id) report rows"""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        # Stays below SQLite's default limit of 999 bound parameters per statement
+        for chunk in _chunks(rows, max(1, 999 // len(rows[0]))):
+            statement = insert(CompatibilityReport).values(chunk)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["user_id", "target_id"],
+                set_={key: statement.excluded[key] for key in rows[0] if key not in ("user_id", "target_id")},
+            ))
+        return
+    
+    for values in rows:
+        report = db.query(CompatibilityReport).filter(
+            CompatibilityReport.user_id == values["user_id"],
+            CompatibilityReport.target_id == values["target_id"]
+        ).first()
+        if report is None:
+            db.add(CompatibilityReport(**values))
+        else:
+            for key, value in values.items():
+                setattr(report, key, value)
+    db.flush()
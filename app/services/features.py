@@ -0,0 +1,230 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from ..models.user import User
+from ..schemas.user import PersonalityTrait
+
+WORD_BITS = 64
+
+# trait_order padding, and the id of traits missing from the vocabulary
+NO_TRAIT = -1
+UNKNOWN_TRAIT = -2
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Count set bits of every uint64 word"""
+        return np.bitwise_count(words)
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Count set bits of every uint64 word"""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        counts = _BYTE_POPCOUNT[as_bytes].reshape(words.shape + (8,))
+        return counts.sum(axis=-1, dtype=np.uint8)
+
+class Vocabulary:
+    """
+    Maps strings to dense integer ids.
+    Categorical vocabularies reserve id 0 for a missing (falsy) value.
+    """
+
+    def __init__(self, reserve_missing: bool = False, terms: Iterable[str] = ()):
+        self.reserve_missing = reserve_missing
+        self._ids: Dict[str, int] = {}
+        self._terms: List[Optional[str]] = [None] if reserve_missing else []
+        for term in terms:
+            self.add(term)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, term) -> bool:
+        return term in self._ids
+
+    def add(self, term: str) -> int:
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._ids[term] = term_id
+            self._terms.append(term)
+        return term_id
+
+    def reserve(self, size: int) -> None:
+        """Pad the id space up to `size` with unnamed placeholder ids"""
+        while len(self._terms) < size:
+            self._terms.append(None)
+
+    def get(self, term, default: int = -1) -> int:
+        return self._ids.get(term, default)
+
+    def term(self, term_id: int) -> Optional[str]:
+        return self._terms[term_id]
+
+    def code(self, value) -> int:
+        """Categorical code of a value; 0 when the value is missing"""
+        if not value:
+            return 0
+        return self.add(value)
+
+class FeatureVocabularies:
+    """
+    The vocabularies used to encode one family of profile features.
+    When `interned` is set, interest and language ids are the persisted bits of
+    User.interest_bits / User.language_bits, which are then used as-is.
+    """
+
+    def __init__(self, interests: Optional[Vocabulary] = None, languages: Optional[Vocabulary] = None,
+                 interned: bool = False):
+        self.interned = interned
+        self.interests = interests if interests is not None else Vocabulary()
+        self.languages = languages if languages is not None else Vocabulary()
+        # Enum traits get the first ids so the complementary table is stable
+        self.traits = Vocabulary(terms=[trait.value for trait in PersonalityTrait])
+        self.relationship_goals = Vocabulary(reserve_missing=True)
+        self.smoking = Vocabulary(reserve_missing=True)
+        self.drinking = Vocabulary(reserve_missing=True)
+        self.education = Vocabulary(reserve_missing=True)
+
+def _words_for(vocabulary: Vocabulary) -> int:
+    return max(1, (len(vocabulary) + WORD_BITS - 1) // WORD_BITS)
+
+def _encode_lists(values: Sequence[Optional[list]], vocabulary: Vocabulary, grow: bool, words: Optional[int],
+                  stored: Optional[Sequence[Optional[bytes]]] = None):
+    """
+    Encode list columns into (bitsets, list lengths); lengths keep duplicates like len(list).
+    Rows with a `stored` bitset use it instead of looking their terms up again.
+    """
+    rows, term_ids = [], []
+    lengths = np.zeros(len(values), dtype=np.int32)
+    stored_rows = []
+    for row, items in enumerate(values):
+        if not items:
+            continue
+        lengths[row] = len(items)
+        if stored is not None and stored[row]:
+            stored_rows.append(row)
+            continue
+        for item in items:
+            term_id = vocabulary.add(item) if grow else vocabulary.get(item)
+            if term_id >= 0:
+                rows.append(row)
+                term_ids.append(term_id)
+    if not words:
+        words = max([_words_for(vocabulary)] + [len(stored[row]) // 8 for row in stored_rows])
+    bits = np.zeros((len(values), words), dtype=np.uint64)
+    if stored_rows:
+        # Bits past the width of an existing batch cannot intersect any of its rows
+        width = words * 8
+        packed = b"".join(stored[row][:width].ljust(width, b"\0") for row in stored_rows)
+        bits[stored_rows] = np.frombuffer(packed, dtype="<u8").reshape(len(stored_rows), words)
+    if rows:
+        term_ids = np.asarray(term_ids, dtype=np.uint64)
+        # Terms added after the bitsets of a batch were sized can never intersect it
+        fits = term_ids < np.uint64(words * WORD_BITS)
+        term_ids = term_ids[fits]
+        np.bitwise_or.at(
+            bits,
+            (np.asarray(rows)[fits], (term_ids // np.uint64(WORD_BITS)).astype(np.intp)),
+            np.left_shift(np.uint64(1), term_ids % np.uint64(WORD_BITS)),
+        )
+    return bits, lengths
+
+def _encode_trait_order(values: Sequence[Optional[list]], vocabulary: Vocabulary) -> np.ndarray:
+    """Distinct traits of every user in first-occurrence order, padded with NO_TRAIT"""
+    ordered = [list(dict.fromkeys(items)) if items else [] for items in values]
+    slots = max((len(items) for items in ordered), default=0)
+    order = np.full((len(values), slots), NO_TRAIT, dtype=np.int32)
+    for row, items in enumerate(ordered):
+        order[row, :len(items)] = [vocabulary.get(item, UNKNOWN_TRAIT) for item in items]
+    return order
+
+def _encode_children(value: Optional[bool]) -> int:
+    if value is None:
+        return -1
+    return 1 if value else 0
+
+class ProfileFeatures:
+    """
+    Struct of arrays holding the scoring-relevant fields of many users.
+    Row i describes ids[i]; list fields are uint64 bitsets over a Vocabulary.
+    """
+
+    ARRAYS = (
+        "ids",
+        "interest_bits", "interest_len",
+        "language_bits", "language_len",
+        "trait_bits", "trait_len", "trait_order",
+        "relationship_goals", "smoking", "drinking", "education",
+        "wants_children",
+    )
+
+    def __init__(self, vocabularies: FeatureVocabularies, **arrays):
+        self.vocabularies = vocabularies
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_users(cls, users: Sequence[User], vocabularies: Optional[FeatureVocabularies] = None,
+                   like: Optional["ProfileFeatures"] = None) -> "ProfileFeatures":
+        """
+        Encode ORM users.
+        When `like` is given the result shares its vocabularies and bitset widths so both
+        batches can be scored against each other; list terms it does not know are dropped.
+        """
+        if like is not None:
+            vocabularies = like.vocabularies
+        vocabularies = vocabularies or FeatureVocabularies()
+        grow = like is None
+
+        def lists(field: str, vocabulary: Vocabulary, array: str, stored_field: Optional[str] = None):
+            words = getattr(like, array).shape[1] if like is not None else None
+            values = [getattr(u, field) for u in users]
+            if stored_field and vocabularies.interned:
+                # Interned ids belong to the database, so they are never allocated locally
+                stored = [getattr(u, stored_field) for u in users]
+                return _encode_lists(values, vocabulary, False, words, stored)
+            return _encode_lists(values, vocabulary, grow, words)
+
+        def codes(field: str, vocabulary: Vocabulary) -> np.ndarray:
+            return np.fromiter((vocabulary.code(getattr(u, field)) for u in users),
+                               dtype=np.int32, count=len(users))
+
+        interest_bits, interest_len = lists("interests", vocabularies.interests, "interest_bits", "interest_bits")
+        language_bits, language_len = lists("languages", vocabularies.languages, "language_bits", "language_bits")
+        trait_bits, trait_len = lists("personality_traits", vocabularies.traits, "trait_bits")
+        return cls(
+            vocabularies,
+            ids=np.fromiter((u.id if u.id is not None else -1 for u in users), dtype=np.int64, count=len(users)),
+            interest_bits=interest_bits,
+            interest_len=interest_len,
+            language_bits=language_bits,
+            language_len=language_len,
+            trait_bits=trait_bits,
+            trait_len=trait_len,
+            trait_order=_encode_trait_order([u.personality_traits for u in users], vocabularies.traits),
+            relationship_goals=codes("relationship_goals", vocabularies.relationship_goals),
+            smoking=codes("smoking", vocabularies.smoking),
+            drinking=codes("drinking", vocabularies.drinking),
+            education=codes("education", vocabularies.education),
+            wants_children=np.fromiter((_encode_children(u.wants_children) for u in users),
+                                       dtype=np.int8, count=len(users)),
+        )
+
+    def take(self, rows) -> "ProfileFeatures":
+        """Return the features of the given row positions (a mask, slice or index array)"""
+        return ProfileFeatures(self.vocabularies, **{name: getattr(self, name)[rows] for name in self.ARRAYS})
+
+def contains(bits: np.ndarray, term_ids) -> np.ndarray:
+    """
+    Whether each bitset row contains the matching term id.
+    `bits` and `term_ids` broadcast against each other row-wise; negative ids never match.
+    """
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    known = (term_ids >= 0) & (term_ids < bits.shape[1] * WORD_BITS)
+    safe_ids = np.where(known, term_ids, 0)
+    rows = 0 if bits.shape[0] == 1 else np.arange(bits.shape[0])
+    words = bits[rows, safe_ids // WORD_BITS]
+    return known & ((words >> (safe_ids % WORD_BITS).astype(np.uint64)) & np.uint64(1) == np.uint64(1))
@@ -0,0 +1,359 @@
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from datetime import datetime
+from collections import defaultdict
+import os
+from sqlalchemy import func, insert, or_, select, tuple_, update
+from sqlalchemy.orm import Query, Session
+from ..models.loading import MATCHING
+from ..models.user import User, MatchFeedEntry
+from ..serialization import FEED_CARD
+from .candidates import CandidateFilter, age_columns, birth_date_range
+from .compatibility import CompatibilityService
+from .features import ProfileFeatures
+from .geo import GeoService, coordinates
+from .matching_pool import MATCHING_MIN_JOBS, matching_pool
+from .profile_store import profile_store
+from .seen import SeenService
+from .vocabulary import VocabularyService
+
+# Number of candidates materialized per user
+FEED_SIZE = int(os.getenv("MATCH_FEED_SIZE", "100"))
+
+# Keeps IN (...) lists below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+def _chunks(values: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+def _sort_key(score: float, candidate_id: int) -> Tuple[float, int]:
+    """Feed order: highest score first, ties broken by the lowest candidate id"""
+    return (-score, candidate_id)
+
+class MatchFeedService:
+    """
+    Maintains the materialized top-K candidate feed of every user.
+
+    A feed holds the FEED_SIZE best eligible candidates of its owner, scored with
+    CompatibilityService.calculate_compatibility(owner, candidate). Eligibility is
+    symmetric: gender/looking_for must be reciprocal, both users must be active, within
+    both users' age preferences (see CandidateFilter) and within both users' max_distance. A user can therefore only ever appear in the
+    feeds of their own candidate pool. Candidates the owner already liked or passed
+    on are dropped with the owner's seen-set before anything is scored.
+    """
+
+    @staticmethod
+    def candidate_pool(db: Session, gender: str, looking_for: str):
+        """Active users a person with this gender/looking_for is eligible to match with"""
+        return CandidateFilter.pool(db, gender, looking_for)
+
+    @staticmethod
+    def eligible_query(db: Session, user: User) -> Query:
+        """
+        SQL prefilter of eligible_candidates: reciprocal, age and a bounding test of
+        the user's own max_distance; the exact distance and seen checks follow in Python
+        """
+        query = CandidateFilter.for_user(db, user)
+        radius = GeoService.search_radius(user)
+        if radius is not None:
+            # Users without a location are never filtered by distance
+            query = query.filter(or_(
+                User.latitude.is_(None),
+                User.longitude.is_(None),
+                GeoService.within_radius_clause(user.latitude, user.longitude, radius),
+            ))
+        return query
+
+    @staticmethod
+    def eligible_candidates(db: Session, user: User, exclude_seen: bool = True) -> List[User]:
+        """
+        Active users that are eligible to appear in the given user's feed; with
+        exclude_seen=False, also those the user already liked or passed on
+        """
+        candidates = MatchFeedService.eligible_query(db, user).all()
+        eligible = GeoService.distance_mask(user, *coordinates(candidates))
+        if exclude_seen:
+            eligible &= ~SeenService.seen_mask(db, user.id, [candidate.id for candidate in candidates])
+        return [candidate for candidate, keep in zip(candidates, eligible) if keep]
+
+    @staticmethod
+    def get_feed_cards(db: Session, user: User, skip: int = 0, limit: int = FEED_SIZE) -> List[Dict[str, object]]:
+        """
+        A ranked slice of the user's feed as schemas.User dicts read straight from SQL,
+        building the feed on first use; compatibility_score is the feed score
+        """
+        MatchFeedService._ensure_feed(db, user)
+        rows = db.execute(FEED_CARD.select().select_from(User).join(
+            MatchFeedEntry, MatchFeedEntry.candidate_id == User.id
+        ).where(
+            MatchFeedEntry.user_id == user.id,
+            MatchFeedEntry.rank > skip,
+            MatchFeedEntry.rank <= skip + limit,
+        ).order_by(MatchFeedEntry.rank))
+        return FEED_CARD.dicts(rows)
+
+    @staticmethod
+    def feed_page(db: Session, user_id: int, skip: int = 0, limit: int = FEED_SIZE) -> List[Tuple[int, float]]:
+        """(candidate id, score) of the feed slice get_feed_cards would return; empty before the feed is built"""
+        return [tuple(row) for row in db.execute(select(MatchFeedEntry.candidate_id, MatchFeedEntry.score).where(
+            MatchFeedEntry.user_id == user_id,
+            MatchFeedEntry.rank > skip,
+            MatchFeedEntry.rank <= skip + limit,
+        ).order_by(MatchFeedEntry.rank))]
+
+    @staticmethod
+    def _ensure_feed(db: Session, user: User) -> None:
+        has_feed = db.query(MatchFeedEntry.id).filter(MatchFeedEntry.user_id == user.id).first() is not None
+        if not has_feed:
+            MatchFeedService.rebuild_feeds(db, [user])
+            db.commit()
+
+    @staticmethod
+    def rebuild_feeds(db: Session, users: List[User]) -> None:
+        """Recompute the feeds of the given users from scratch (does not commit)"""
+        # Users with the same gender/looking_for share a candidate pool, so it is loaded once
+        groups: Dict[Tuple[str, str], List[User]] = defaultdict(list)
+        for user in users:
+            groups[(user.gender, user.looking_for)].append(user)
+
+        today = CandidateFilter.today()
+        for (gender, looking_for), owners in groups.items():
+            # Only birth dates some owner accepts are loaded; each owner's own window is applied below
+            pool, locations, ages = MatchFeedService._load_pool(
+                db, gender, looking_for, today, *CandidateFilter.group_range(owners, today)
+            )
+            # Large rebuilds from the profile store are ranked on the matching workers, in parallel
+            store = profile_store(db) if matching_pool is not None and len(owners) >= MATCHING_MIN_JOBS else None
+            ranked = {}
+            for owner in owners:
+                eligible = (pool.ids != owner.id) & GeoService.distance_mask(owner, *locations)
+                eligible &= CandidateFilter.age_mask(owner, today, *ages)
+                eligible &= ~SeenService.seen_mask(db, owner.id, pool.ids)
+                if store is not None:
+                    ranked[owner] = (matching_pool.rank(store, owner.id, pool.ids[eligible], FEED_SIZE), eligible)
+                else:
+                    MatchFeedService._write_feed(db, owner, pool.take(eligible))
+            for owner, (future, eligible) in ranked.items():
+                try:
+                    MatchFeedService._store_feed(db, owner.id, *future.result())
+                except KeyError:
+                    # The owner is not in the snapshot yet: a user this transaction added
+                    MatchFeedService._write_feed(db, owner, pool.take(eligible))
+
+    @staticmethod
+    def _load_pool(db: Session, gender: str, looking_for: str, today, earliest=None, latest=None):
+        """(features, coordinates, age columns) of a candidate pool, from the profile store when enabled"""
+        store = profile_store(db)
+        if store is not None:
+            return store.candidates(gender, looking_for, today, earliest, latest)
+        candidates = CandidateFilter.pool(db, gender, looking_for, earliest, latest).all()
+        features = ProfileFeatures.from_users(candidates, VocabularyService.feature_vocabularies(db))
+        return features, coordinates(candidates), age_columns(candidates, today)
+
+    @staticmethod
+    def _eligible_pool(db: Session, user: User, exclude_seen: bool = True) -> ProfileFeatures:
+        """Features of eligible_candidates(db, user, exclude_seen)"""
+        if profile_store(db) is None:
+            return ProfileFeatures.from_users(
+                MatchFeedService.eligible_candidates(db, user, exclude_seen), VocabularyService.feature_vocabularies(db)
+            )
+        today = CandidateFilter.today()
+        earliest, latest = birth_date_range(user.min_age_preference, user.max_age_preference, today)
+        pool, locations, ages = MatchFeedService._load_pool(db, user.gender, user.looking_for, today, earliest, latest)
+        eligible = (pool.ids != user.id) & GeoService.distance_mask(user, *locations)
+        eligible &= CandidateFilter.age_mask(user, today, *ages)
+        if exclude_seen:
+            eligible &= ~SeenService.seen_mask(db, user.id, pool.ids)
+        return pool.take(eligible)
+
+    @staticmethod
+    def refresh_user(db: Session, user: User) -> None:
+        """
+        Incrementally maintain feeds after a user was created, edited their profile,
+        or became active or inactive. Only the user's own feed and the feed rows where
+        they are a candidate are recomputed.
+        """
+        if user.is_active:
+            MatchFeedService._place_user(db, user)
+        else:
+            MatchFeedService._remove_user(db, user)
+        db.commit()
+
+    @staticmethod
+    def record_swipes(db: Session, swipes: Dict[int, Sequence[int]]) -> None:
+        """
+        Record that each user in {user_id: [candidate ids]} liked or passed on those
+        candidates: they join the user's seen-set and leave the user's feed (does not commit).
+        A feed is refilled once swipes have taken it below half of FEED_SIZE, so a rebuild
+        is paid every few dozen swipes rather than on each one.
+        """
+        swipes = {user_id: list(candidate_ids) for user_id, candidate_ids in swipes.items() if candidate_ids}
+        if not swipes:
+            return
+        SeenService.mark_seen(db, swipes)
+        pairs = [(user_id, candidate_id) for user_id, candidate_ids in swipes.items() for candidate_id in candidate_ids]
+        for chunk in _chunks(pairs):
+            db.query(MatchFeedEntry).filter(
+                tuple_(MatchFeedEntry.user_id, MatchFeedEntry.candidate_id).in_(chunk)
+            ).delete(synchronize_session=False)
+        sizes: Dict[int, int] = {}
+        for chunk in _chunks(list(swipes)):
+            sizes.update(db.query(MatchFeedEntry.user_id, func.count()).filter(
+                MatchFeedEntry.user_id.in_(chunk)
+            ).group_by(MatchFeedEntry.user_id).all())
+        # Owners without rows never had a feed, or swiped it empty: both are built on read
+        depleted = {owner_id for owner_id, size in sizes.items() if size < FEED_SIZE // 2}
+        MatchFeedService._rebuild_by_id(db, list(depleted))
+        MatchFeedService._rerank(db, [owner_id for owner_id in sizes if owner_id not in depleted])
+
+    @staticmethod
+    def record_pass(db: Session, user_id: int, candidate_id: int) -> None:
+        MatchFeedService.record_swipes(db, {user_id: [candidate_id]})
+        db.commit()
+
+    @staticmethod
+    def _write_feed(db: Session, owner: User, candidates: ProfileFeatures) -> None:
+        ids, scores = CompatibilityService.rank_candidates(owner, candidates, FEED_SIZE)
+        MatchFeedService._store_feed(db, owner.id, ids, scores)
+
+    @staticmethod
+    def _store_feed(db: Session, owner_id: int, ids, scores) -> None:
+        db.query(MatchFeedEntry).filter(MatchFeedEntry.user_id == owner_id).delete(synchronize_session=False)
+        if len(ids):
+            computed_at = datetime.utcnow()
+            db.execute(insert(MatchFeedEntry), [
+                {
+                    "user_id": owner_id,
+                    "candidate_id": candidate_id,
+                    "score": score,
+                    "rank": rank,
+                    "computed_at": computed_at,
+                }
+                for rank, (candidate_id, score) in enumerate(zip(ids.tolist(), scores.tolist()), start=1)
+            ])
+
+    @staticmethod
+    def _remove_user(db: Session, user: User) -> None:
+        db.query(MatchFeedEntry).filter(MatchFeedEntry.user_id == user.id).delete(synchronize_session=False)
+        owner_ids = [owner_id for (owner_id,) in
+                     db.query(MatchFeedEntry.user_id).filter(MatchFeedEntry.candidate_id == user.id)]
+        db.query(MatchFeedEntry).filter(MatchFeedEntry.candidate_id == user.id).delete(synchronize_session=False)
+        # Each of those feeds lost a row and needs the next best candidate
+        MatchFeedService._rebuild_by_id(db, owner_ids)
+
+    @staticmethod
+    def _place_user(db: Session, user: User) -> None:
+        # Eligibility is symmetric, but the seen-sets are not: the user's own swipes only
+        # filter their own feed, while the owners' swipes are checked below
+        pool = MatchFeedService._eligible_pool(db, user, exclude_seen=False)
+        MatchFeedService._write_feed(db, user, pool.take(~SeenService.seen_mask(db, user.id, pool.ids)))
+
+        # Score the user as a candidate of everyone in their pool in one pass
+        reverse_scores = dict(zip(
+            pool.ids.tolist(),
+            CompatibilityService.calculate_compatibility_reverse(pool, user).tolist(),
+        ))
+        current = {entry.user_id: entry for entry in
+                   db.query(MatchFeedEntry).filter(MatchFeedEntry.candidate_id == user.id)}
+
+        sizes, tails = MatchFeedService._feed_tails(db, list(reverse_scores))
+        # Owners who already swiped on the user must not get them back; only
+        # materialized feeds matter, the others filter on their next build
+        seen = SeenService.load_many(db, list(sizes))
+        for owner_id, bloom in seen.items():
+            if user.id in bloom:
+                del reverse_scores[owner_id]
+
+        to_rebuild: Set[int] = set()
+        to_rerank: Set[int] = set()
+        # Feeds that still list the user although they are no longer eligible
+        for owner_id, entry in current.items():
+            if owner_id not in reverse_scores:
+                db.delete(entry)
+                to_rebuild.add(owner_id)
+
+        computed_at = datetime.utcnow()
+        new_entries = []
+        evicted = []
+        for owner_id, score in reverse_scores.items():
+            size = sizes.get(owner_id)
+            if size is None:
+                # Never materialized: it is built lazily on the owner's next read
+                continue
+            key = _sort_key(score, user.id)
+            tail = tails.get(owner_id)
+            entry = current.get(owner_id)
+            if entry is not None:
+                # Everything outside a full feed ranks after its tail, so the user only keeps
+                # the slot without a rebuild while they do not fall behind it
+                if tail is not None and key > _sort_key(*tail[1:]):
+                    to_rebuild.add(owner_id)
+                else:
+                    entry.score = score
+                    entry.computed_at = computed_at
+                    to_rerank.add(owner_id)
+            elif tail is None or key < _sort_key(*tail[1:]):
+                new_entries.append({
+                    "user_id": owner_id,
+                    "candidate_id": user.id,
+                    "score": score,
+                    "rank": size + 1,
+                    "computed_at": computed_at,
+                })
+                if tail is not None:
+                    evicted.append(tail[0])
+                to_rerank.add(owner_id)
+
+        for chunk in _chunks(evicted):
+            db.query(MatchFeedEntry).filter(MatchFeedEntry.id.in_(chunk)).delete(synchronize_session=False)
+        if new_entries:
+            db.execute(insert(MatchFeedEntry), new_entries)
+        db.flush()
+        MatchFeedService._rebuild_by_id(db, list(to_rebuild))
+        MatchFeedService._rerank(db, list(to_rerank - to_rebuild))
+
+    @staticmethod
+    def _feed_tails(db: Session, owner_ids: List[int]):
+        """
+        Return ({owner_id: feed size}, {owner_id: (entry id, score, candidate id)}) where
+        the tail (lowest ranked row) is only reported for full feeds.
+        """
+        sizes: Dict[int, int] = {}
+        tails: Dict[int, Tuple[int, float, int]] = {}
+        for chunk in _chunks(owner_ids):
+            sizes.update(db.query(MatchFeedEntry.user_id, func.max(MatchFeedEntry.rank)).filter(
+                MatchFeedEntry.user_id.in_(chunk)
+            ).group_by(MatchFeedEntry.user_id).all())
+            for entry_id, owner_id, score, candidate_id in db.query(
+                MatchFeedEntry.id, MatchFeedEntry.user_id, MatchFeedEntry.score, MatchFeedEntry.candidate_id
+            ).filter(MatchFeedEntry.user_id.in_(chunk), MatchFeedEntry.rank == FEED_SIZE):
+                tails[owner_id] = (entry_id, score, candidate_id)
+        return sizes, tails
+
+    @staticmethod
+    def _rebuild_by_id(db: Session, owner_ids: List[int]) -> None:
+        owners = []
+        for chunk in _chunks(owner_ids):
+            owners.extend(db.query(User).options(*MATCHING).filter(User.id.in_(chunk), User.is_active == True))
+        MatchFeedService.rebuild_feeds(db, owners)
+
+    @staticmethod
+    def _rerank(db: Session, owner_ids: List[int]) -> None:
+        """Renumber the ranks of the given feeds after scores changed or rows were added"""
+        changes = []
+        for chunk in _chunks(owner_ids):
+            feeds = defaultdict(list)
+            for entry_id, owner_id, score, candidate_id, rank in db.query(
+                MatchFeedEntry.id, MatchFeedEntry.user_id, MatchFeedEntry.score,
+                MatchFeedEntry.candidate_id, MatchFeedEntry.rank,
+            ).filter(MatchFeedEntry.user_id.in_(chunk)):
+                feeds[owner_id].append((_sort_key(score, candidate_id), entry_id, rank))
+            for rows in feeds.values():
+                rows.sort()
+                changes.extend(
+                    {"id": entry_id, "rank": new_rank}
+                    for new_rank, (_, entry_id, rank) in enumerate(rows, start=1)
+                    if rank != new_rank
+                )
+        if changes:
+            db.execute(update(MatchFeedEntry), changes)
@@ -0,0 +1,222 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from ..models.user import GEO_CELL_COLUMNS, GEO_CELL_DEGREES, User, geo_cell
+
+EARTH_RADIUS_KM = 6371.0088
+# Upper bound of UserProfile.max_distance
+MAX_DISTANCE_KM = 1000
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distance from one point to many points, in kilometers"""
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """
+    Return (min_lat, max_lat, longitude ranges) enclosing the circle of radius_km.
+    The longitude span is split in two when it crosses the antimeridian.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angular)
+    max_lat = latitude + math.degrees(angular)
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle contains a pole, so it spans every longitude
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    ratio = math.sin(angular) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+    delta = math.degrees(math.asin(ratio))
+    west, east = longitude - delta, longitude + delta
+    if west < -180:
+        return min_lat, max_lat, [(west + 360, 180.0), (-180.0, east)]
+    if east > 180:
+        return min_lat, max_lat, [(west, 180.0), (-180.0, east - 360)]
+    return min_lat, max_lat, [(west, east)]
+
+def cell_ranges(latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, int]]:
+    """Inclusive ranges of User.geo_cell ids covering the bounding box of the circle"""
+    min_lat, max_lat, longitudes = bounding_box(latitude, longitude, radius_km)
+    first_row = geo_cell(min_lat, 0) // GEO_CELL_COLUMNS
+    last_row = geo_cell(max_lat, 0) // GEO_CELL_COLUMNS
+    ranges = []
+    for row in range(first_row, last_row + 1):
+        for west, east in longitudes:
+            first = int(math.floor((west + 180) / GEO_CELL_DEGREES))
+            last = min(int(math.floor((east + 180) / GEO_CELL_DEGREES)), GEO_CELL_COLUMNS - 1)
+            ranges.append((row * GEO_CELL_COLUMNS + first, row * GEO_CELL_COLUMNS + last))
+    # Adjacent ranges (e.g. whole rows, or both sides of the antimeridian) are merged
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and merged[-1][1] + 1 >= start:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def coordinates(users: Sequence[User]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(latitudes, longitudes, max_distances) of users as float arrays, NaN where unset"""
+    def column(field: str) -> np.ndarray:
+        return np.fromiter(
+            (value if value is not None else np.nan for value in (getattr(u, field) for u in users)),
+            dtype=np.float64, count=len(users),
+        )
+    return column("latitude"), column("longitude"), column("max_distance")
+
+class GeoService:
+    @staticmethod
+    def within_radius_clause(latitude: float, longitude: float, radius_km: float):
+        """SQL prefilter: the indexed geo_cell ranges plus the exact lat/lon bounding box"""
+        min_lat, max_lat, longitudes = bounding_box(latitude, longitude, radius_km)
+        return and_(
+            or_(*[User.geo_cell.between(start, end) for start, end in cell_ranges(latitude, longitude, radius_km)]),
+            User.latitude.between(min_lat, max_lat),
+            or_(*[User.longitude.between(west, east) for west, east in longitudes]),
+        )
+
+    @staticmethod
+    def users_within(db: Session, latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (ids, distances in km) of active users within radius_km, closest first:
+        the indexed cell ranges in SQL, then the exact distance with distance_mask
+        """
+        rows = db.query(User.id, User.latitude, User.longitude).filter(
+            User.is_active == True,
+            GeoService.within_radius_clause(latitude, longitude, radius_km),
+        ).all()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        latitudes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        longitudes = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        # Only the radius limits the query, not the max_distance of the users found
+        origin = User(latitude=latitude, longitude=longitude, max_distance=radius_km)
+        inside = GeoService.distance_mask(origin, latitudes, longitudes, np.full(len(rows), np.nan))
+        ids, latitudes, longitudes = ids[inside], latitudes[inside], longitudes[inside]
+        distances = haversine_km(latitude, longitude, latitudes, longitudes)
+        order = np.argsort(distances, kind="stable")
+        return ids[order], distances[order]
+
+    @staticmethod
+    def search_radius(user: User) -> Optional[float]:
+        """Widest distance at which the user can match anyone; None when location is unknown"""
+        if user.latitude is None or user.longitude is None:
+            return None
+        return user.max_distance or MAX_DISTANCE_KM
+
+    @staticmethod
+    def distance_mask(user: User, latitudes: np.ndarray, longitudes: np.ndarray, max_distances: np.ndarray) -> np.ndarray:
+        """
+        Which candidates are close enough to match with the user.
+        Both users' max_distance are honored, so the relation is symmetric. Distance is
+        not enforced when either user has no location or neither sets a max_distance.
+        """
+        if user.latitude is None or user.longitude is None:
+            return np.ones(len(latitudes), dtype=bool)
+        located = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        own_limit = user.max_distance if user.max_distance is not None else np.nan
+        limits = np.fmin(max_distances, own_limit)
+        distances = haversine_km(user.latitude, user.longitude, np.where(located, latitudes, 0.0),
+                                 np.where(located, longitudes, 0.0))
+        return ~located | np.isnan(limits) | (distances <= limits)
+
+class GeoIndex:
+    """
+    In-process grid-bucket index over user locations, using the User.geo_cell grid.
+    Each bucket keeps NumPy arrays so a radius query gathers a few buckets and refines
+    them with one vectorized haversine pass.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._cells: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, float, float]]) -> "GeoIndex":
+        """Build from (id, latitude, longitude) rows, e.g. a yield_per query"""
+        pending: Dict[int, List[Tuple[int, float, float]]] = {}
+        index = cls()
+        for user_id, latitude, longitude in rows:
+            if latitude is None or longitude is None:
+                continue
+            cell = geo_cell(latitude, longitude)
+            pending.setdefault(cell, []).append((user_id, latitude, longitude))
+            index._cells[user_id] = cell
+        for cell, items in pending.items():
+            ids, latitudes, longitudes = zip(*items)
+            index._buckets[cell] = (
+                np.asarray(ids, dtype=np.int64),
+                np.asarray(latitudes, dtype=np.float64),
+                np.asarray(longitudes, dtype=np.float64),
+            )
+        return index
+
+    @classmethod
+    def from_db(cls, db: Session, batch_size: int = 10000) -> "GeoIndex":
+        """Index every active user with a location"""
+        rows = db.query(User.id, User.latitude, User.longitude).filter(
+            User.is_active == True,
+            User.latitude.isnot(None),
+            User.longitude.isnot(None),
+        ).yield_per(batch_size)
+        return cls.from_rows(rows)
+
+    def remove(self, user_id: int) -> None:
+        cell = self._cells.pop(user_id, None)
+        if cell is None:
+            return
+        ids, latitudes, longitudes = self._buckets[cell]
+        keep = ids != user_id
+        if keep.any():
+            self._buckets[cell] = (ids[keep], latitudes[keep], longitudes[keep])
+        else:
+            del self._buckets[cell]
+
+    def update(self, user_id: int, latitude: Optional[float], longitude: Optional[float]) -> None:
+        """Insert, move or (with no coordinates) remove a user"""
+        self.remove(user_id)
+        if latitude is None or longitude is None:
+            return
+        cell = geo_cell(latitude, longitude)
+        self._cells[user_id] = cell
+        ids, latitudes, longitudes = self._buckets.get(cell, (
+            np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        ))
+        self._buckets[cell] = (
+            np.append(ids, user_id),
+            np.append(latitudes, latitude),
+            np.append(longitudes, longitude),
+        )
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, distances in km) of indexed users within radius_km, closest first"""
+        parts = []
+        if self._buckets:
+            for start, end in cell_ranges(latitude, longitude, radius_km):
+                if end - start + 1 > len(self._buckets):
+                    parts.extend(bucket for cell, bucket in self._buckets.items() if start <= cell <= end)
+                else:
+                    parts.extend(self._buckets[cell] for cell in range(start, end + 1) if cell in self._buckets)
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids = np.concatenate([part[0] for part in parts])
+        latitudes = np.concatenate([part[1] for part in parts])
+        longitudes = np.concatenate([part[2] for part in parts])
+
+        min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius_km)
+        in_box = (latitudes >= min_lat) & (latitudes <= max_lat)
+        in_box &= np.logical_or.reduce([(longitudes >= west) & (longitudes <= east) for west, east in lon_ranges])
+        ids, latitudes, longitudes = ids[in_box], latitudes[in_box], longitudes[in_box]
+
+        distances = haversine_km(latitude, longitude, latitudes, longitudes)
+        inside = distances <= radius_km
+        order = np.argsort(distances[inside], kind="stable")
+        return ids[inside][order], distances[inside][order]
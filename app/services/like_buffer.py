@@ -0,0 +1,211 @@
+from typing import Callable, List, Optional, Set, Tuple
+import asyncio
+import glob
+import logging
+import os
+from .matches import MatchService
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: likes are batched by LikeBuffer instead of committed one request at a time
+WRITE_BEHIND = os.getenv("LIKE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes", "on")
+FLUSH_ROWS = int(os.getenv("LIKE_FLUSH_ROWS", "500"))
+FLUSH_INTERVAL_MS = float(os.getenv("LIKE_FLUSH_INTERVAL_MS", "20"))
+BUFFER_SIZE = int(os.getenv("LIKE_BUFFER_SIZE", "10000"))
+LOG_DIR = os.getenv("LIKE_LOG_DIR", "./like_log")
+LOG_FSYNC = os.getenv("LIKE_LOG_FSYNC", "false").lower() in ("1", "true", "yes", "on")
+FLUSH_RETRIES = int(os.getenv("LIKE_FLUSH_RETRIES", "3"))
+RETRY_DELAY_MS = float(os.getenv("LIKE_RETRY_DELAY_MS", "50"))
+
+Pair = Tuple[int, int]
+
+class AppendLog:
+    """
+    Crash-safe record of likes that are not answered yet. Each batch is written to
+    a segment of its own before it is committed, so one write (and fsync) covers a
+    whole batch; a segment is deleted once its likes were committed or failed back
+    to their callers, and whatever segments remain after a crash are replayed on
+    the next start. Segments are written and removed by the flush task only, off
+    the event loop.
+    """
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        existing = [self._number(path) for path in self.segments()]
+        self._next = max(existing, default=0) + 1
+
+    def segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "likes-*.log")), key=self._number)
+
+    @staticmethod
+    def _number(path: str) -> int:
+        return int(os.path.basename(path)[len("likes-"):-len(".log")])
+
+    def write(self, pairs: List[Pair]) -> str:
+        """Write a batch to a new segment, fsynced when enabled, and return its path (blocking)"""
+        path = os.path.join(self.directory, "likes-%012d.log" % self._next)
+        self._next += 1
+        with open(path, "w") as segment:
+            segment.write("".join("%d %d\n" % pair for pair in pairs))
+            segment.flush()
+            if self.fsync:
+                os.fsync(segment.fileno())
+        return path
+
+    @staticmethod
+    def remove(path: str) -> None:
+        os.remove(path)
+
+    @staticmethod
+    def read(path: str) -> List[Pair]:
+        pairs = []
+        with open(path) as segment:
+            for line in segment:
+                fields = line.split()
+                # A torn last line from a crash mid-write is skipped
+                if len(fields) == 2:
+                    pairs.append((int(fields[0]), int(fields[1])))
+        return pairs
+
+class LikeBuffer:
+    """
+    Write-behind ingestion of likes. Callers enqueue a like and await its batch;
+    a background task flushes every FLUSH_INTERVAL_MS or FLUSH_ROWS likes in one
+    transaction through MatchService.record_likes, which also detects the matches.
+    A full buffer makes callers wait for the next flush instead of growing further.
+    A batch that fails is retried flush_retries times, with a doubling delay, before
+    its callers get the error; failed likes are not replayed later.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        flush_rows: int = FLUSH_ROWS,
+        flush_interval_ms: float = FLUSH_INTERVAL_MS,
+        max_pending: int = BUFFER_SIZE,
+        log: Optional[AppendLog] = None,
+        flush_retries: int = FLUSH_RETRIES,
+        retry_delay_ms: float = RETRY_DELAY_MS,
+    ):
+        self.session_factory = session_factory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.log = log
+        self.flush_retries = flush_retries
+        self.retry_delay = retry_delay_ms / 1000
+        self.flushes = 0
+        self.flushed_likes = 0
+        self._pending: List[Tuple[Pair, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        if self.log is not None:
+            await self.replay()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def replay(self) -> None:
+        """Commit the likes of segments left behind by a crash"""
+        for path in self.log.segments():
+            pairs = AppendLog.read(path)
+            if pairs:
+                await self._write(pairs)
+                logger.info("replayed %d buffered likes from %s", len(pairs), path)
+            await asyncio.to_thread(AppendLog.remove, path)
+
+    async def add(self, liker_id: int, liked_id: int) -> bool:
+        """Buffer a like and return whether it matched, once its batch has committed"""
+        async with self._space:
+            await self._space.wait_for(lambda: len(self._pending) < self.max_pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((liker_id, liked_id), future))
+        if len(self._pending) >= self.flush_rows:
+            self._wakeup.set()
+        return await future
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("like flush failed")
+
+    async def flush(self) -> None:
+        """Write everything buffered so far, in batches of at most flush_rows"""
+        while self._pending:
+            batch, self._pending = self._pending[:self.flush_rows], self._pending[self.flush_rows:]
+            async with self._space:
+                self._space.notify_all()
+            pairs = [pair for pair, _ in batch]
+            segment = None
+            try:
+                if self.log is not None:
+                    # No caller is answered before its like is on disk
+                    segment = await asyncio.to_thread(self.log.write, pairs)
+                matched = await self._write_retrying(pairs)
+            except Exception as error:
+                logger.exception("like flush failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for pair, future in batch:
+                    if not future.done():
+                        future.set_result(pair in matched)
+            # Every like in the segment has its answer now: replaying the failed ones on the
+            # next start would record likes their callers were told did not go through
+            if segment is not None:
+                await asyncio.to_thread(AppendLog.remove, segment)
+
+    async def _write_retrying(self, pairs: List[Pair]) -> Set[Pair]:
+        for attempt in range(self.flush_retries):
+            try:
+                return await self._write(pairs)
+            except Exception:
+                logger.warning("like flush failed, retrying", exc_info=True)
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        return await self._write(pairs)
+
+    async def _write(self, pairs: List[Pair]) -> Set[Pair]:
+        async with self.session_factory() as db:
+            matched = await db.run_sync(MatchService.record_likes, pairs)
+        self.flushes += 1
+        self.flushed_likes += len(pairs)
+        return matched
+
+    async def stop(self) -> None:
+        """Flush what is buffered and stop the background task; called on shutdown"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+# The running buffer when LIKE_WRITE_BEHIND is on
+active: Optional[LikeBuffer] = None
+
+async def start(session_factory: Callable) -> None:
+    global active
+    if WRITE_BEHIND and active is None:
+        active = LikeBuffer(session_factory, log=AppendLog(LOG_DIR, LOG_FSYNC))
+        await active.start()
+
+async def stop() -> None:
+    global active
+    if active is not None:
+        buffer, active = active, None
+        await buffer.stop()
@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..models.user import Like, Match, User, utcnow
+from ..serialization import USER_CARD
+from .feed import MatchFeedService
+
+# Rows per statement; keeps bound parameters below SQLite's limit
+CHUNK_SIZE = 200
+
+class MatchService:
+    """
+    Likes and the mutual matches they form. A match is written in the same
+    transaction as the like that completes it, so readers never see one without
+    the other, and lookups are single ranges of the unique indexes.
+    """
+
+    @staticmethod
+    def record_like(db: Session, liker_id: int, liked_id: int) -> bool:
+        """Store a like (repeats are ignored) and return whether the pair is now matched"""
+        return (liker_id, liked_id) in MatchService.record_likes(db, [(liker_id, liked_id)])
+
+    @staticmethod
+    def record_likes(db: Session, likes: Sequence[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+        """
+        Store a batch of (liker_id, liked_id) likes in one transaction, with multi-row
+        inserts, and return those that are matched, including pairs completed within the batch.
+        Liked users also join their liker's seen-set and leave the liker's feed.
+        """
+        likes = list(dict.fromkeys(likes))
+        if not likes:
+            return set()
+        _lock_pairs(db, likes)
+        today = datetime.utcnow().date()
+        for chunk in _chunks(likes):
+            _insert_ignore(db, Like, [{"liker_id": liker, "liked_id": liked, "timestamp": today} for liker, liked in chunk],
+                           ["liker_id", "liked_id"])
+        swipes = defaultdict(list)
+        for liker, liked in likes:
+            swipes[liker].append(liked)
+        MatchFeedService.record_swipes(db, swipes)
+        matched = set()
+        for chunk in _chunks(likes):
+            reverse = [(liked, liker) for liker, liked in chunk]
+            matched.update(
+                (liked, liker) for liker, liked in db.execute(
+                    select(Like.liker_id, Like.liked_id).where(tuple_(Like.liker_id, Like.liked_id).in_(reverse))
+                )
+            )
+        if matched:
+            created_at = utcnow()
+            rows = [
+                {"user_id": user_id, "matched_user_id": other_id, "created_at": created_at}
+                for liker, liked in matched
+                for user_id, other_id in ((liker, liked), (liked, liker))
+            ]
+            for chunk in _chunks(rows):
+                _insert_ignore(db, Match, chunk, ["user_id", "matched_user_id"])
+        db.commit()
+        return matched
+
+    @staticmethod
+    def is_matched(db: Session, user_id: int, other_id: int) -> bool:
+        return db.execute(
+            select(Match.matched_user_id).where(Match.user_id == user_id, Match.matched_user_id == other_id)
+        ).first() is not None
+
+    @staticmethod
+    def list_match_cards(db: Session, user_id: int, after: int = 0, limit: int = 100) -> List[Dict[str, object]]:
+        """
+        The user's matches in id order, starting after `after`, as schemas.User dicts
+        read straight from SQL with one join
+        """
+        rows = db.execute(USER_CARD.select().join(Match, Match.matched_user_id == User.id).where(
+            Match.user_id == user_id, Match.matched_user_id > after,
+        ).order_by(Match.matched_user_id).limit(limit))
+        return USER_CARD.dicts(rows)
+
+def _chunks(values: list) -> Iterable[list]:
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+def _lock_pairs(db: Session, likes: Sequence[Tuple[int, int]]) -> None:
+    """
+    Serialize likes within a pair, so two users liking each other at once cannot
+    both miss the other's like. Locks are taken in key order, so batches cannot
+    deadlock. SQLite already allows a single writer at a time.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # The two-key form takes the ordered pair as is: user ids are int4 like its keys
+        for low, high in sorted({(min(pair), max(pair)) for pair in likes}):
+            db.execute(text("SELECT pg_advisory_xact_lock(:low, :high)"), {"low": low, "high": high})
+
+def _insert_ignore(db: Session, model, rows: List[Dict[str, object]], index_elements: List[str]) -> None:
+    """Insert rows, skipping those that already exist under the unique index"""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        db.execute(insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements))
+        return
+
+    for row in rows:
+        exists = db.query(model).filter_by(**{key: row[key] for key in index_elements}).first()
+        if exists is None:
+            db.add(model(**row))
+    db.flush()
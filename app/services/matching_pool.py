@@ -0,0 +1,175 @@
+"""
+Process pool that ranks candidates outside the API workers.
+
+Scoring is CPU-bound NumPy and Python, so one process ranks decks on one core.
+Worker processes share the profile features through a snapshot file: the
+ProfileFeatures arrays of every stored user (see profile_store) written once,
+in id order, and mapped read-only by each worker. Pages of the file are shared
+through the page cache, so N workers cost one copy of the features rather than N.
+A scoring job only carries a snapshot path, a user id and candidate ids.
+
+Snapshots are immutable. When the store has changed, the next ranking call
+publishes a new one; the previous file is removed once no queued job needs it.
+"""
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+import asyncio
+import mmap
+import multiprocessing
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import numpy as np
+from .compatibility import CompatibilityService, top_ranked
+from .features import ProfileFeatures
+from .profile_store import ProfileStore
+
+# Ranking processes; 0 ranks in the calling process
+MATCHING_WORKERS = int(os.getenv("MATCHING_WORKERS", "0"))
+# Feed rebuilds with fewer owners are ranked in process: shipping them costs more than it saves
+MATCHING_MIN_JOBS = int(os.getenv("MATCHING_MIN_JOBS", "32"))
+# Where snapshots are written; a tmpfs keeps them in memory
+SNAPSHOT_DIR = os.getenv("MATCHING_SNAPSHOT_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+# Arrays start on cache-line boundaries
+_ALIGNMENT = 64
+_HEADER = struct.Struct("<Q")
+
+def _aligned(size: int) -> int:
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+def write_snapshot(path: str, features: ProfileFeatures) -> None:
+    """
+    Write features, which must be in ascending id order, as: the length of a pickled
+    layout, the layout (vocabularies and each array's dtype, shape and offset past
+    the header), then the arrays.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(features, name)) for name in ProfileFeatures.ARRAYS}
+    layout = {"vocabularies": features.vocabularies, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        layout["arrays"][name] = (array.dtype.str, array.shape, offset)
+        offset += _aligned(array.nbytes)
+    header = pickle.dumps(layout)
+    start = _aligned(_HEADER.size + len(header))
+    with open(path, "wb") as snapshot:
+        snapshot.write(_HEADER.pack(len(header)) + header)
+        for name, array in arrays.items():
+            snapshot.seek(start + layout["arrays"][name][2])
+            array.tofile(snapshot)
+
+def map_snapshot(path: str) -> ProfileFeatures:
+    """The features of a snapshot file, as read-only views of a shared mapping"""
+    with open(path, "rb") as snapshot:
+        buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    (length,) = _HEADER.unpack_from(buffer)
+    layout = pickle.loads(buffer[_HEADER.size:_HEADER.size + length])
+    start = _aligned(_HEADER.size + length)
+    arrays = {
+        name: np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=start + offset).reshape(shape)
+        for name, (dtype, shape, offset) in layout["arrays"].items()
+    }
+    return ProfileFeatures(layout["vocabularies"], **arrays)
+
+def rank_in(features: ProfileFeatures, user_id: int, candidate_ids: Sequence[int],
+            limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    rank_candidates(user, candidates, limit) with the user and candidates read from
+    id-ordered features. Candidate ids that are not in the features are skipped.
+    """
+    user_row = np.searchsorted(features.ids, user_id)
+    if user_row >= len(features) or features.ids[user_row] != user_id:
+        raise KeyError(user_id)
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(features.ids, candidate_ids), len(features) - 1)
+    candidates = features.take(rows[features.ids[rows] == candidate_ids])
+    scores = CompatibilityService.score_pairs(features.take([user_row]), candidates)
+    return top_ranked(candidates.ids, scores, limit)
+
+# Snapshots mapped by this worker process, by path
+_mapped: Dict[str, ProfileFeatures] = {}
+
+def _rank_job(path: str, user_id: int, candidate_ids: np.ndarray, limit: Optional[int]):
+    features = _mapped.get(path)
+    if features is None:
+        # A new snapshot supersedes the previous ones; their views are released with them
+        _mapped.clear()
+        features = _mapped[path] = map_snapshot(path)
+    return rank_in(features, user_id, candidate_ids, limit)
+
+class MatchingPool:
+    """
+    Ranks candidates on worker processes against the latest snapshot of a profile store.
+    Thread-safe; workers are started on first use.
+    """
+
+    def __init__(self, workers: int, directory: str = SNAPSHOT_DIR):
+        self.workers = workers
+        self.directory = directory
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._snapshot: Optional[str] = None
+        self._source: Optional[Tuple[ProfileStore, int]] = None
+        # Queued jobs per snapshot path, so a replaced snapshot is removed once they finish
+        self._jobs: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def publish(self, store: ProfileStore) -> str:
+        """The path of a snapshot of the store's current version, writing one if needed"""
+        with self._lock:
+            if self._source == (store, store.version) and self._snapshot is not None:
+                return self._snapshot
+        version, features = store.snapshot()
+        descriptor, path = tempfile.mkstemp(prefix="profiles-", suffix=".snapshot", dir=self.directory)
+        os.close(descriptor)
+        write_snapshot(path, features)
+        with self._lock:
+            previous, self._snapshot, self._source = self._snapshot, path, (store, version)
+            self._retire(previous)
+        return path
+
+    def _retire(self, path: Optional[str]) -> None:
+        if path is not None and path != self._snapshot and not self._jobs[path]:
+            del self._jobs[path]
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def submit(self, path: str, user_id: int, candidate_ids: Sequence[int], limit: Optional[int] = None) -> Future:
+        """Rank candidate ids for a user of the snapshot at path; the future holds (ids, scores)"""
+        with self._lock:
+            if self._executor is None:
+                # Not forked: the API process runs threads and holds connections a fork would share
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            executor = self._executor
+            self._jobs[path] += 1
+        future = executor.submit(_rank_job, path, user_id, np.asarray(candidate_ids, dtype=np.int64), limit)
+        future.add_done_callback(lambda _: self._finished(path))
+        return future
+
+    def _finished(self, path: str) -> None:
+        with self._lock:
+            self._jobs[path] -= 1
+            self._retire(path)
+
+    def rank(self, store: ProfileStore, user_id: int, candidate_ids: Sequence[int],
+             limit: Optional[int] = None) -> Future:
+        return self.submit(self.publish(store), user_id, candidate_ids, limit)
+
+    async def rank_async(self, store: ProfileStore, user_id: int, candidate_ids: Sequence[int],
+                         limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        return await asyncio.wrap_future(self.rank(store, user_id, candidate_ids, limit))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            path, self._snapshot, self._source = self._snapshot, None, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            self._retire(path)
+
+matching_pool = MatchingPool(MATCHING_WORKERS) if MATCHING_WORKERS > 0 else None
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+from sqlalchemy import and_, or_, select, union_all
+from sqlalchemy.orm import Session
+from ..models.loading import MESSAGES
+from ..models.user import Message
+
+# Largest page served by /messages/{username}
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    pass
+
+class MessageService:
+    """
+    Conversation history, paged by keyset: a page starts strictly below the
+    (timestamp, id) of the last message already seen, so it costs O(page)
+    index reads however long the history is. OFFSET would scan every skipped row.
+    """
+
+    @staticmethod
+    def encode_cursor(message: Message) -> str:
+        raw = "%s|%d" % (message.timestamp.isoformat(), message.id)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            timestamp, message_id = raw.rsplit("|", 1)
+            return datetime.fromisoformat(timestamp), int(message_id)
+        except ValueError as error:
+            raise InvalidCursor(cursor) from error
+
+    @staticmethod
+    def conversation(
+        db: Session, user_id: int, other_id: int, limit: int, before: Optional[str] = None,
+    ) -> Tuple[List[Message], Optional[str]]:
+        """A page of messages between two users, newest first, and the cursor of the next page"""
+        position = MessageService.decode_cursor(before) if before else None
+
+        def direction(sender_id: int, receiver_id: int):
+            # Each direction is one range of ix_messages_conversation, read backwards
+            query = select(Message.id).where(Message.sender_id == sender_id, Message.receiver_id == receiver_id)
+            if position is not None:
+                timestamp, message_id = position
+                # The redundant `<=` gives the planner an index range; the OR alone would not
+                query = query.where(Message.timestamp <= timestamp, or_(
+                    Message.timestamp < timestamp,
+                    and_(Message.timestamp == timestamp, Message.id < message_id),
+                ))
+            return select(query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).subquery())
+
+        candidates = union_all(direction(user_id, other_id), direction(other_id, user_id))
+        messages = db.execute(
+            select(Message)
+            .options(*MESSAGES)
+            .where(Message.id.in_(candidates))
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(limit + 1)
+        ).scalars().all()
+        if len(messages) <= limit:
+            return list(messages), None
+        page = list(messages[:limit])
+        return page, MessageService.encode_cursor(page[-1])
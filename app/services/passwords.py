@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+import asyncio
+import os
+import threading
+from passlib.context import CryptContext
+from ..telemetry import observe_call
+
+# Changing the cost makes existing hashes "deprecated", so they are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so each worker thread can keep one core busy
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait for a worker before new ones are rejected
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordHasherBusy(Exception):
+    """Raised instead of queueing once every worker and queue slot is taken"""
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated thread pool, off the event loop and away from the
+    threadpool shared with sync endpoints. Admission is capped at workers + queue
+    depth, so a login storm fails fast rather than growing every caller's latency.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, context: CryptContext = pwd_context):
+        self.workers = workers
+        self.limit = workers + queue_depth
+        self.context = context
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _submit(self, fn: Callable, *args, operation: Optional[str] = None):
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self.pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt")
+        if operation is None:
+            future = self._executor.submit(fn, *args)
+        else:
+            # Timed on the worker, so the metric is bcrypt's cost and not the queueing before it
+            future = self._executor.submit(observe_call, operation, fn, *args)
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password, operation="bcrypt.hash")
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, password, hashed_password, operation="bcrypt.verify")
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Whether the password matches, and a new hash when the stored one uses an outdated cost"""
+        return await self._submit(self.context.verify_and_update, password, hashed_password, operation="bcrypt.verify")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
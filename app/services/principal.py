@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+import hashlib
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from .cache import LRUCache
+
+# connection.info key of users updated by the open transaction
+_PENDING = "principal_invalidations"
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, detached from any session"""
+    id: int
+    username: str
+    email: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, username=user.username, email=user.email, is_active=bool(user.is_active))
+
+class PrincipalCache:
+    """
+    Principals by token hash, each valid until its token expires or the TTL runs out,
+    whichever comes first. Invalidating a user bumps its generation, which retires
+    every cached token of that user at once.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a lookup racing one does not cache what it read
+        self.epoch = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        principal, expires_at, generation = entry
+        if expires_at <= time.time() or generation != self._generations.get(principal.id, 0):
+            self._entries.pop(key)
+            return None
+        return principal
+
+    def put(self, token: str, principal: Principal, expires_at: Optional[float], epoch: int) -> None:
+        """Cache a principal read after `epoch` was observed, unless a user was invalidated since"""
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            if epoch != self.epoch:
+                return
+            generation = self._generations.get(principal.id, 0)
+        self._entries.put(self.key(token), (principal, deadline, generation))
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.epoch += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self.epoch += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+principal_cache = PrincipalCache(
+    int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    float(os.getenv("PRINCIPAL_CACHE_TTL", "300")),
+)
+
+def invalidate_user(connection: Connection, user_id: int) -> None:
+    """
+    Drop the user's cached principals now, and again once the transaction commits:
+    a request reading the old row before the commit may have cached it in between.
+    """
+    principal_cache.invalidate(user_id)
+    connection.info.setdefault(_PENDING, set()).add(user_id)
+
+@event.listens_for(Engine, "commit")
+def _invalidate_committed(connection):
+    for user_id in connection.info.pop(_PENDING, ()):
+        principal_cache.invalidate(user_id)
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
@@ -0,0 +1,303 @@
+"""
+Columnar in-memory copy of the profile fields matching reads.
+
+An ORM User carries every mapped attribute, its identity-map state and decoded
+JSON lists; at a million users that is gigabytes. ProfileStore keeps one row per
+user in NumPy arrays instead: ProfileFeatures for the scored fields (list fields as
+bitsets), categorical codes, coordinates and age data for eligibility, and an
+id-to-row array. It is built by one streaming yield_per scan of the needed columns
+and then kept current from the mapper events of committed transactions.
+"""
+from datetime import date
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import os
+import threading
+import weakref
+import numpy as np
+from sqlalchemy import Engine, event, select
+from sqlalchemy.orm import Session
+from ..models.user import User
+from .features import NO_TRAIT, FeatureVocabularies, ProfileFeatures, Vocabulary
+from .vocabulary import VocabularyService
+
+ENABLED = os.getenv("PROFILE_STORE", "false").lower() in ("1", "true", "yes", "on")
+BATCH_SIZE = int(os.getenv("PROFILE_STORE_BATCH_SIZE", "20000"))
+
+# The User columns the store reads, so the build never loads whole entities
+FIELDS = (
+    "id", "gender", "looking_for", "is_active", "date_of_birth", "min_age_preference", "max_age_preference",
+    "latitude", "longitude", "max_distance",
+    "interests", "interest_bits", "languages", "language_bits", "personality_traits",
+    "relationship_goals", "smoking", "drinking", "education", "wants_children",
+)
+MISSING_BIRTH = -1
+
+# connection.info key of the profile changes made by the open transaction
+_PENDING = "profile_store_pending"
+
+def _pad_columns(array: np.ndarray, width: int, fill) -> np.ndarray:
+    if array.shape[1] >= width:
+        return array
+    padded = np.full((array.shape[0], width), fill, dtype=array.dtype)
+    padded[:, :array.shape[1]] = array
+    return padded
+
+def _floats(values: Iterable[Optional[float]], count: int, dtype=np.float64) -> np.ndarray:
+    return np.fromiter((value if value is not None else np.nan for value in values), dtype=dtype, count=count)
+
+class ProfileStore:
+    """
+    Struct of arrays over every user, with spare capacity so single-row changes
+    append in amortized O(1). Rows of deleted users are retired, not reused.
+    """
+
+    # Per-row arrays besides ProfileFeatures, with their dtype and fill value
+    COLUMNS = {
+        "gender": (np.int32, 0),
+        "looking_for": (np.int32, 0),
+        "active": (np.bool_, False),
+        "birth_day": (np.int32, MISSING_BIRTH),   # date.toordinal(), for birth-date ranges
+        "birth_year": (np.int16, 0),
+        "birth_month_day": (np.int16, 0),         # month * 100 + day, for ages
+        "min_age": (np.float32, np.nan),
+        "max_age": (np.float32, np.nan),
+        "latitude": (np.float64, np.nan),
+        "longitude": (np.float64, np.nan),
+        "max_distance": (np.float64, np.nan),
+    }
+
+    def __init__(self, vocabularies: FeatureVocabularies):
+        self.vocabularies = vocabularies
+        self.genders = Vocabulary(reserve_missing=True)
+        self.size = 0
+        self.capacity = 0
+        # Bumped by every change, so copies of the store can tell they are stale
+        self.version = 0
+        self.row_of = np.full(0, -1, dtype=np.int64)
+        self._features = ProfileFeatures.from_users([], vocabularies)
+        for name, (dtype, fill) in self.COLUMNS.items():
+            setattr(self, name, np.full(0, fill, dtype=dtype))
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, db: Session, batch_size: int = BATCH_SIZE) -> "ProfileStore":
+        """Load every user with one streaming scan of FIELDS, batch_size rows at a time"""
+        store = cls(VocabularyService.feature_vocabularies(db))
+        columns = [getattr(User, field) for field in FIELDS]
+        result = db.execute(select(*columns).order_by(User.id).execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            store.upsert(rows)
+        return store
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.active[:self.size]))
+
+    @property
+    def features(self) -> ProfileFeatures:
+        return self._features.take(slice(0, self.size))
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.row_of] + [getattr(self, name) for name in self.COLUMNS]
+        arrays += [getattr(self._features, name) for name in ProfileFeatures.ARRAYS]
+        return sum(array.nbytes for array in arrays)
+
+    def _reserve(self, rows: int, max_id: int) -> None:
+        if max_id >= len(self.row_of):
+            row_of = np.full(max(max_id + 1, 2 * len(self.row_of)), -1, dtype=np.int64)
+            row_of[:len(self.row_of)] = self.row_of
+            self.row_of = row_of
+        needed = self.size + rows
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity, 1024)
+        for name, (dtype, fill) in self.COLUMNS.items():
+            array = np.full(capacity, fill, dtype=dtype)
+            array[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, array)
+        arrays = {}
+        for name in ProfileFeatures.ARRAYS:
+            current = getattr(self._features, name)
+            array = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            if name == "trait_order":
+                array.fill(NO_TRAIT)
+            array[:self.size] = current[:self.size]
+            arrays[name] = array
+        self._features = ProfileFeatures(self.vocabularies, **arrays)
+        self.capacity = capacity
+
+    def _write_features(self, rows: np.ndarray, encoded: ProfileFeatures) -> None:
+        current = self._features
+        for name in ("interest_bits", "language_bits", "trait_bits", "trait_order"):
+            # A batch may know more terms (wider bitsets) or list more traits than the store so far
+            fill = NO_TRAIT if name == "trait_order" else 0
+            width = max(getattr(current, name).shape[1], getattr(encoded, name).shape[1])
+            setattr(current, name, _pad_columns(getattr(current, name), width, fill))
+            setattr(encoded, name, _pad_columns(getattr(encoded, name), width, fill))
+        for name in ProfileFeatures.ARRAYS:
+            getattr(current, name)[rows] = getattr(encoded, name)
+
+    def upsert(self, profiles: Sequence) -> None:
+        """Insert or replace users; profiles are rows or objects with the FIELDS attributes, distinct ids"""
+        if not len(profiles):
+            return
+        with self._lock:
+            self.version += 1
+            ids = np.fromiter((profile.id for profile in profiles), dtype=np.int64, count=len(profiles))
+            self._reserve(len(profiles), int(ids.max()))
+            rows = self.row_of[ids]
+            new = rows < 0
+            rows[new] = self.size + np.arange(np.count_nonzero(new))
+            self.size += int(np.count_nonzero(new))
+            self.row_of[ids] = rows
+
+            self._write_features(rows, ProfileFeatures.from_users(profiles, self.vocabularies))
+            count = len(profiles)
+            self.gender[rows] = np.fromiter((self.genders.code(p.gender) for p in profiles), dtype=np.int32, count=count)
+            self.looking_for[rows] = np.fromiter(
+                (self.genders.code(p.looking_for) for p in profiles), dtype=np.int32, count=count)
+            self.active[rows] = np.fromiter((bool(p.is_active) for p in profiles), dtype=np.bool_, count=count)
+            births = [p.date_of_birth for p in profiles]
+            self.birth_day[rows] = np.fromiter(
+                (born.toordinal() if born else MISSING_BIRTH for born in births), dtype=np.int32, count=count)
+            self.birth_year[rows] = np.fromiter((born.year if born else 0 for born in births), dtype=np.int16, count=count)
+            self.birth_month_day[rows] = np.fromiter(
+                (born.month * 100 + born.day if born else 0 for born in births), dtype=np.int16, count=count)
+            self.min_age[rows] = _floats((p.min_age_preference for p in profiles), count, np.float32)
+            self.max_age[rows] = _floats((p.max_age_preference for p in profiles), count, np.float32)
+            self.latitude[rows] = _floats((p.latitude for p in profiles), count)
+            self.longitude[rows] = _floats((p.longitude for p in profiles), count)
+            self.max_distance[rows] = _floats((p.max_distance for p in profiles), count)
+
+    def remove(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            self.version += 1
+            ids = np.fromiter(user_ids, dtype=np.int64)
+            ids = ids[ids < len(self.row_of)]
+            rows = self.row_of[ids]
+            self.active[rows[rows >= 0]] = False
+            self.row_of[ids] = -1
+
+    def snapshot(self) -> Tuple[int, ProfileFeatures]:
+        """(version, features of every stored user in ascending id order), copied under the lock"""
+        with self._lock:
+            ids = np.flatnonzero(self.row_of >= 0)
+            return self.version, self.take(self.row_of[ids])
+
+    def candidates(
+        self, gender: str, looking_for: str, today: date, earliest: Optional[date] = None, latest: Optional[date] = None,
+    ) -> Tuple[ProfileFeatures, Tuple[np.ndarray, ...], Tuple[np.ndarray, ...]]:
+        """
+        The pool CandidateFilter.pool would load, as (features, coordinates, age columns):
+        the same inputs matching builds from ORM users with geo.coordinates and
+        candidates.age_columns. Copied under the lock, so concurrent changes cannot tear it.
+        """
+        with self._lock:
+            rows = self.pool(gender, looking_for, earliest, latest)
+            return self.take(rows), self.coordinates(rows), self.age_columns(rows, today)
+
+    def pool(self, gender: str, looking_for: str, earliest: Optional[date] = None, latest: Optional[date] = None) -> np.ndarray:
+        """Rows of active users a person with this gender/looking_for can match, like CandidateFilter.pool"""
+        size = self.size
+        keep = self.active[:size] & (self.gender[:size] == self.genders.get(looking_for, -2)) \
+            & (self.looking_for[:size] == self.genders.get(gender, -2))
+        if earliest is not None:
+            keep &= self.birth_day[:size] >= earliest.toordinal()
+        if latest is not None:
+            keep &= (self.birth_day[:size] <= latest.toordinal()) & (self.birth_day[:size] != MISSING_BIRTH)
+        return np.flatnonzero(keep)
+
+    def take(self, rows: np.ndarray) -> ProfileFeatures:
+        return self._features.take(rows)
+
+    def coordinates(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Like geo.coordinates for the given rows"""
+        return self.latitude[rows], self.longitude[rows], self.max_distance[rows]
+
+    def age_columns(self, rows: np.ndarray, today: date) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Like candidates.age_columns for the given rows"""
+        born = self.birth_day[rows] != MISSING_BIRTH
+        before_birthday = (today.month * 100 + today.day) < self.birth_month_day[rows]
+        ages = np.where(born, today.year - self.birth_year[rows].astype(np.float64) - before_birthday, np.nan)
+        return ages, self.min_age[rows].astype(np.float64), self.max_age[rows].astype(np.float64)
+
+# One store per database, built on first use
+_stores: "weakref.WeakKeyDictionary[Engine, ProfileStore]" = weakref.WeakKeyDictionary()
+# Changes committed while a database's store is being built
+_building: "weakref.WeakKeyDictionary[Engine, Dict[int, Optional[SimpleNamespace]]]" = weakref.WeakKeyDictionary()
+_build_lock = threading.Lock()
+
+def profile_store(db: Session) -> Optional[ProfileStore]:
+    """The profile store of the session's database; None unless PROFILE_STORE is enabled"""
+    if not ENABLED:
+        return None
+    engine = db.get_bind()
+    store = _stores.get(engine)
+    if store is None:
+        with _build_lock:
+            store = _stores.get(engine)
+            if store is None:
+                store = _stores[engine] = build_store(db)
+    return store
+
+def build_store(db: Session) -> ProfileStore:
+    """
+    Build the store of the session's database and register it. Changes committed
+    while the scan runs are replayed afterwards, since the scan may have read
+    their rows before or after the commit.
+    """
+    engine = db.get_bind()
+    replay: Dict[int, Optional[SimpleNamespace]] = {}
+    _building[engine] = replay
+    try:
+        store = ProfileStore.build(db)
+    finally:
+        _building.pop(engine, None)
+    _apply(store, replay)
+    _stores[engine] = store
+    return store
+
+def memory_report(store: ProfileStore, seconds: Optional[float] = None) -> Dict[str, float]:
+    users = max(store.size, 1)
+    report = {"users": store.size, "bytes": store.nbytes, "bytes_per_user": round(store.nbytes / users, 1)}
+    if seconds is not None:
+        report["load_seconds"] = round(seconds, 3)
+    return report
+
+def _apply(store: ProfileStore, changes: Dict[int, Optional[SimpleNamespace]]) -> None:
+    store.upsert([profile for profile in changes.values() if profile is not None])
+    store.remove([user_id for user_id, profile in changes.items() if profile is None])
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def _record_profile(mapper, connection, target):
+    if ENABLED:
+        profile = SimpleNamespace(**{field: getattr(target, field) for field in FIELDS})
+        connection.info.setdefault(_PENDING, {})[target.id] = profile
+
+@event.listens_for(User, "after_delete")
+def _record_removal(mapper, connection, target):
+    if ENABLED:
+        connection.info.setdefault(_PENDING, {})[target.id] = None
+
+@event.listens_for(Engine, "commit")
+def _apply_committed(connection):
+    changes = connection.info.pop(_PENDING, None)
+    if not changes:
+        return
+    engine = connection.engine
+    replay = _building.get(engine)
+    if replay is not None:
+        replay.update(changes)
+    store = _stores.get(engine)
+    if store is not None:
+        _apply(store, changes)
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
+
+def _reset() -> None:
+    """Drop every store (tests)"""
+    _stores.clear()
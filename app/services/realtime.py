@@ -0,0 +1,122 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Callable, Dict, Set
+import asyncio
+import os
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# Payloads a connection may have waiting before it is dropped as too slow
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+
+Payload = Dict[str, Any]
+Listener = Callable[[Payload], None]
+
+def user_channel(user_id: int) -> str:
+    return "user:%d" % user_id
+
+class Broker(ABC):
+    """
+    Carries payloads between hubs. The in-memory broker only reaches this process;
+    running several workers needs one backed by a shared bus (Redis, Postgres NOTIFY).
+    """
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: Payload) -> None:
+        """Deliver a payload to every listener of the channel, in any process"""
+
+    @abstractmethod
+    async def subscribe(self, channel: str, listener: Listener) -> None:
+        """Call the listener with every payload later published on the channel"""
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str, listener: Listener) -> None:
+        """Stop calling a subscribed listener"""
+
+class InMemoryBroker(Broker):
+    def __init__(self):
+        self.listeners: Dict[str, Set[Listener]] = defaultdict(set)
+
+    async def publish(self, channel: str, payload: Payload) -> None:
+        for listener in list(self.listeners.get(channel, ())):
+            listener(payload)
+
+    async def subscribe(self, channel: str, listener: Listener) -> None:
+        self.listeners[channel].add(listener)
+
+    async def unsubscribe(self, channel: str, listener: Listener) -> None:
+        listeners = self.listeners.get(channel)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del self.listeners[channel]
+
+# Queued in place of the backlog of a connection that fell too far behind
+_OVERFLOW = object()
+
+class Connection:
+    """One socket, with a bounded queue drained by its own sender task"""
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def offer(self, payload: Payload) -> None:
+        """Queue a payload without waiting; a full queue drops the connection, not the publisher"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_OVERFLOW)
+
+    async def pump(self) -> None:
+        try:
+            while True:
+                payload = await self.queue.get()
+                if payload is _OVERFLOW:
+                    # The client reconnects and catches up through /messages/{username}
+                    await self.websocket.close(code=1013, reason="Receiver too slow")
+                    return
+                await self.websocket.send_json(payload)
+        except (WebSocketDisconnect, RuntimeError):
+            # The socket closed under us; serve() notices and cleans up
+            return
+
+class MessageHub:
+    """Fans published payloads out to the sockets of their receivers connected to this process"""
+
+    def __init__(self, broker: Broker, queue_size: int = SEND_QUEUE_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self.connections: Set[Connection] = set()
+
+    async def publish(self, user_id: int, payload: Payload) -> None:
+        await self.broker.publish(user_channel(user_id), payload)
+
+    async def serve(self, user_id: int, websocket: WebSocket) -> None:
+        """Stream payloads to an accepted socket until either side closes it"""
+        connection = Connection(websocket, user_id, self.queue_size)
+        channel = user_channel(user_id)
+        # Every socket subscribes on its own, so a user's devices come and go independently
+        await self.broker.subscribe(channel, connection.offer)
+        self.connections.add(connection)
+        sender = asyncio.create_task(connection.pump())
+        try:
+            # Clients only listen; reading is how a disconnect is noticed
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            sender.cancel()
+            self.connections.discard(connection)
+            await self.broker.unsubscribe(channel, connection.offer)
+
+hub = MessageHub(InMemoryBroker())
@@ -0,0 +1,225 @@
+"""
+Background rescoring of stored compatibility reports after profile edits.
+
+Setting one of SCORED_FIELDS to a different value flags the user through an
+attribute event; when the flush writes the user and the transaction commits, the
+user id reaches the running RecomputeWorker. Other edits (bio, pictures,
+occupation, ...) are never flagged. The worker expands dirty users into dirty
+pairs, the stored reports either user is part of that were scored against an
+older profile revision, and rescores them in batches.
+
+Reports are also rescored lazily on read when their revisions are stale (see
+CompatibilityService.get_compatibility_report); the worker moves that work off
+the request path. That is also why a failing drain is not retried forever: it is
+retried with exponential backoff, and users that failed MAX_ATTEMPTS drains in a
+row are left to the read path.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import threading
+from sqlalchemy import Engine, event, inspect, or_
+from sqlalchemy.orm import Session, aliased
+from ..models.user import SCORED_FIELDS, CompatibilityReport, User
+from .compatibility import CompatibilityService
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: stale reports are otherwise rescored on their next read
+ENABLED = os.getenv("REPORT_RECOMPUTE", "false").lower() in ("1", "true", "yes", "on")
+BATCH_SIZE = int(os.getenv("REPORT_RECOMPUTE_BATCH_SIZE", "500"))
+# How long the worker waits for more edits before draining
+DELAY_MS = float(os.getenv("REPORT_RECOMPUTE_DELAY_MS", "50"))
+MAX_ATTEMPTS = int(os.getenv("REPORT_RECOMPUTE_MAX_ATTEMPTS", "5"))
+# Wait before retrying a failed drain, doubled after each further failure up to the maximum
+RETRY_MS = float(os.getenv("REPORT_RECOMPUTE_RETRY_MS", "100"))
+MAX_BACKOFF_MS = float(os.getenv("REPORT_RECOMPUTE_MAX_BACKOFF_MS", "30000"))
+
+# InstanceState.info key of a user with an unflushed scored change
+_CHANGED = "scored_change"
+# connection.info key of users with scored changes flushed by the open transaction
+_PENDING = "recompute_pending"
+
+Pair = Tuple[int, int]
+
+def _flag_scored_change(target, value, oldvalue, initiator):
+    # Unloaded old values compare unequal, so those edits are flagged too
+    if value != oldvalue:
+        inspect(target).info[_CHANGED] = True
+
+for _field in SCORED_FIELDS:
+    event.listen(getattr(User, _field), "set", _flag_scored_change)
+
+@event.listens_for(User, "after_update")
+def _record_scored_change(mapper, connection, target):
+    if inspect(target).info.pop(_CHANGED, False):
+        connection.info.setdefault(_PENDING, set()).add(target.id)
+
+@event.listens_for(Engine, "commit")
+def _queue_committed(connection):
+    user_ids = connection.info.pop(_PENDING, None)
+    worker = active
+    if user_ids and worker is not None and connection.engine is worker.engine:
+        worker.mark(user_ids)
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
+
+def stale_pairs(db: Session, user_ids: Iterable[int]) -> List[Pair]:
+    """Stored reports involving these users that were scored against an older profile revision"""
+    user_ids = sorted(user_ids)
+    scorer, target = aliased(User), aliased(User)
+    pairs: Set[Pair] = set()
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        pairs.update(db.query(CompatibilityReport.user_id, CompatibilityReport.target_id).join(
+            scorer, scorer.id == CompatibilityReport.user_id
+        ).join(
+            target, target.id == CompatibilityReport.target_id
+        ).filter(
+            or_(CompatibilityReport.user_id.in_(chunk), CompatibilityReport.target_id.in_(chunk)),
+            or_(
+                CompatibilityReport.user_revision.is_distinct_from(scorer.profile_revision),
+                CompatibilityReport.target_revision.is_distinct_from(target.profile_revision),
+            ),
+        ).all())
+    return sorted(pairs)
+
+class RecomputeWorker:
+    """
+    Drains the users with committed scored changes on the event loop. Edits that
+    arrive while a drain runs are picked up by the next one; a user edited many
+    times before a drain is rescored once.
+    """
+
+    def __init__(self, session_factory: Callable, engine: Engine, batch_size: int = BATCH_SIZE,
+                 delay_ms: float = DELAY_MS, max_attempts: int = MAX_ATTEMPTS,
+                 retry_ms: float = RETRY_MS, max_backoff_ms: float = MAX_BACKOFF_MS):
+        self.session_factory = session_factory
+        self.engine = engine
+        self.batch_size = batch_size
+        self.delay = delay_ms / 1000
+        self.max_attempts = max_attempts
+        self.retry = retry_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self.recomputed = 0
+        self.batches = 0
+        self.abandoned = 0
+        self._dirty: Set[int] = set()
+        # Failed drains of each queued user since it was last rescored
+        self._attempts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._halt: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._halt = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def mark(self, user_ids: Iterable[int]) -> None:
+        """Queue users for rescoring; safe to call from any thread"""
+        with self._lock:
+            self._dirty.update(user_ids)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    async def _run(self) -> None:
+        failures = 0
+        while not self._stopping:
+            await self._wakeup.wait()
+            # Let a burst of edits accumulate into fewer, larger batches
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                await self.drain()
+                failures = 0
+            except Exception:
+                logger.exception("compatibility recompute failed")
+                # Edits arriving meanwhile wait too; stop() cuts the wait short
+                backoff = min(self.retry * 2 ** failures, self.max_backoff)
+                failures += 1
+                try:
+                    await asyncio.wait_for(self._halt.wait(), backoff)
+                except asyncio.TimeoutError:
+                    pass
+                if self.pending:
+                    self._wakeup.set()
+
+    async def drain(self) -> int:
+        """Rescore the stale reports of every queued user; returns how many were rescored"""
+        with self._lock:
+            user_ids, self._dirty = self._dirty, set()
+        if not user_ids:
+            return 0
+        try:
+            async with self.session_factory() as db:
+                pairs = await db.run_sync(stale_pairs, user_ids)
+                for start in range(0, len(pairs), self.batch_size):
+                    await db.run_sync(self._rescore, pairs[start:start + self.batch_size])
+        except Exception:
+            # Retried with the next drain; readers rescore stale reports meanwhile
+            self._requeue(user_ids)
+            raise
+        with self._lock:
+            for user_id in user_ids:
+                self._attempts.pop(user_id, None)
+        return len(pairs)
+
+    def _requeue(self, user_ids: Set[int]) -> None:
+        """Queue the users of a failed drain again, without waking the worker, up to max_attempts"""
+        abandoned = 0
+        with self._lock:
+            for user_id in user_ids:
+                attempts = self._attempts.get(user_id, 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[user_id] = attempts
+                    self._dirty.add(user_id)
+                else:
+                    self._attempts.pop(user_id, None)
+                    abandoned += 1
+        if abandoned:
+            self.abandoned += abandoned
+            logger.warning("gave up rescoring the reports of %d users; they are rescored on read", abandoned)
+
+    def _rescore(self, db: Session, pairs: List[Pair]) -> None:
+        self.recomputed += CompatibilityService.recompute_reports(db, pairs)
+        db.commit()
+        self.batches += 1
+
+    async def stop(self) -> None:
+        """Drain what is queued and stop the background task; called on shutdown"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._halt.set()
+            await self._task
+            self._task = None
+        await self.drain()
+
+# The running worker when REPORT_RECOMPUTE is on
+active: Optional[RecomputeWorker] = None
+
+async def start(session_factory: Callable, engine: Engine) -> None:
+    global active
+    if ENABLED and active is None:
+        active = RecomputeWorker(session_factory, engine)
+        await active.start()
+
+async def stop() -> None:
+    global active
+    if active is not None:
+        worker, active = active, None
+        await worker.stop()
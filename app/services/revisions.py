@@ -0,0 +1,138 @@
+"""
+User revisions for conditional requests.
+
+Every change to a user row bumps User.revision, so a profile response is fully
+described by (user id, revision) and a list of profiles by its members' ids and
+revisions plus whatever the list adds per member (the feed score). ETags are
+built from those, and a request whose If-None-Match still matches gets a 304
+without loading or serializing any profile.
+
+RevisionIndex keeps revisions in memory so that check needs no query for users
+it has seen. Updates drop the user's entry when they flush and again when they
+commit, like the principal cache. Another process's edits are not seen here, so
+entries also expire after REVISION_INDEX_TTL seconds, which bounds how long a
+multi-worker deployment can answer 304 for a profile edited elsewhere.
+"""
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import hashlib
+import os
+import threading
+import time
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from ..models.user import User
+from .cache import LRUCache
+
+# connection.info key of users updated by the open transaction
+_PENDING = "revision_invalidations"
+
+class RevisionIndex:
+    """User.revision by user id; reads race invalidations the same way PrincipalCache does"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a read racing one does not store what it read
+        self.epoch = 0
+
+    def get(self, user_id: int) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        revision, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(user_id)
+            return None
+        return revision
+
+    def put(self, user_id: int, revision: int, epoch: int) -> None:
+        """Store a revision read after `epoch` was observed, unless a user was invalidated since"""
+        with self._lock:
+            if epoch != self.epoch:
+                return
+        self._entries.put(user_id, (revision, time.monotonic() + self.ttl))
+
+    def revisions(self, db: Session, user_ids: Sequence[int]) -> Dict[int, int]:
+        """Revisions of these users, reading the ones not indexed; unknown users are left out"""
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            revision = self.get(user_id)
+            if revision is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = revision
+        for start in range(0, len(missing), 500):
+            epoch = self.epoch
+            rows = db.execute(select(User.id, User.revision).where(User.id.in_(missing[start:start + 500]))).all()
+            for user_id, revision in rows:
+                found[user_id] = revision
+                self.put(user_id, revision, epoch)
+        return found
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id)
+            self.epoch += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.epoch += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+revision_index = RevisionIndex(
+    int(os.getenv("REVISION_INDEX_SIZE", "100000")),
+    float(os.getenv("REVISION_INDEX_TTL", "60")),
+)
+
+def _etag(kind: str, parts: Iterable) -> str:
+    digest = hashlib.blake2b(kind.encode(), digest_size=12)
+    for part in parts:
+        digest.update(repr(part).encode())
+    return '"%s-%s"' % (kind, digest.hexdigest())
+
+def user_etag(user_id: int, revision: int) -> str:
+    """ETag of one schemas.User representation"""
+    return _etag("user", (user_id, revision))
+
+def list_etag(kind: str, members: Iterable[Tuple], revisions: Dict[int, int]) -> Optional[str]:
+    """
+    ETag of a list of profiles: each member is (user id, *what the list adds for it).
+    None when a member's revision is unknown, since the list cannot be described then.
+    """
+    parts = []
+    for member in members:
+        revision = revisions.get(member[0])
+        if revision is None:
+            return None
+        parts.append(member + (revision,))
+    return _etag(kind, parts)
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match or If-Match header lists this ETag (weak comparison)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_revision(mapper, connection: Connection, target) -> None:
+    # Again on commit: a request reading the old row before the commit may have indexed it in between
+    revision_index.invalidate(target.id)
+    connection.info.setdefault(_PENDING, set()).add(target.id)
+
+@event.listens_for(Engine, "commit")
+def _invalidate_committed(connection):
+    for user_id in connection.info.pop(_PENDING, ()):
+        revision_index.invalidate(user_id)
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
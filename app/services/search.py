@@ -0,0 +1,282 @@
+"""
+Profile search over bio, occupation and interests.
+
+Text is matched through an inverted index, never by scanning users: FTS5 on
+SQLite and the GIN-indexed search_vector on PostgreSQL (see models.search), or
+InvertedIndex in memory where neither exists. Every query word must match, in
+any of the three fields; results are ordered by relevance (BM25, or ts_rank_cd
+on PostgreSQL), ties by user id. Only users eligible for the searcher's feed are
+returned: the reciprocal gender, age and distance rules of MatchFeedService, and
+nobody the searcher already liked or passed on.
+
+SEARCH_BACKEND picks "fts" or "memory"; "auto" uses the database's index when
+it exists.
+"""
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import math
+import os
+import re
+import threading
+import unicodedata
+import weakref
+from sqlalchemy import Engine, column, event, func, inspect, literal_column, select, table, text
+from sqlalchemy.orm import Session
+from ..models.search import FTS_COLUMNS, FTS_TABLE
+from ..models.user import User
+from ..serialization import USER_CARD
+from .feed import MatchFeedService
+from .geo import GeoService, coordinates
+from .seen import SeenService
+
+BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+# Relevance weight of a match per field, in FTS_COLUMNS order: short fields are more telling
+WEIGHTS = {"bio": 1.0, "occupation": 2.0, "interests": 2.0}
+# Ranked hits read per round; some fail the exact distance and seen checks
+BATCH_SIZE = 200
+MAX_TERMS = 16
+
+_WORD = re.compile(r"[^\W_]+")
+
+def terms(text: Optional[str]) -> List[str]:
+    """Lowercased words without diacritics, as the unicode61 tokenizer splits them"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.lower())
+    return _WORD.findall("".join(char for char in folded if not unicodedata.combining(char)))
+
+def _query_terms(query: str) -> List[str]:
+    return list(dict.fromkeys(terms(query)))[:MAX_TERMS]
+
+class InvertedIndex:
+    """
+    Term -> {user id: weighted term frequency} over the three fields, ranked with
+    BM25 (k1=1.2, b=0.75) on the weighted frequencies and document lengths.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.lengths: Dict[int, float] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._total_length = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, db: Session, batch_size: int = 10000) -> "InvertedIndex":
+        index = cls()
+        rows = db.execute(select(User.id, User.bio, User.occupation, User.interests).execution_options(yield_per=batch_size))
+        for user_id, bio, occupation, interests in rows:
+            index.add(user_id, bio, occupation, interests)
+        return index
+
+    def add(self, user_id: int, bio: Optional[str], occupation: Optional[str], interests: Optional[Sequence[str]]) -> None:
+        fields = {"bio": terms(bio), "occupation": terms(occupation), "interests": terms(" ".join(interests or ()))}
+        frequencies: Dict[str, float] = defaultdict(float)
+        length = 0.0
+        for field, words in fields.items():
+            for word in words:
+                frequencies[word] += WEIGHTS[field]
+            length += WEIGHTS[field] * len(words)
+        with self._lock:
+            self._remove(user_id)
+            if not frequencies:
+                return
+            for word, frequency in frequencies.items():
+                self.postings[word][user_id] = frequency
+            self._terms[user_id] = tuple(frequencies)
+            self.lengths[user_id] = length
+            self._total_length += length
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id: int) -> None:
+        for word in self._terms.pop(user_id, ()):
+            postings = self.postings[word]
+            postings.pop(user_id, None)
+            if not postings:
+                del self.postings[word]
+        self._total_length -= self.lengths.pop(user_id, 0.0)
+
+    def search(self, words: Sequence[str]) -> List[Tuple[int, float]]:
+        """(user id, score) of the users matching every word, best first"""
+        with self._lock:
+            postings = [self.postings.get(word) for word in words]
+            if not postings or not all(postings):
+                return []
+            count = len(self.lengths)
+            average = self._total_length / count
+            matches = set(min(postings, key=len))
+            for posting in postings:
+                matches.intersection_update(posting)
+            scores = dict.fromkeys(matches, 0.0)
+            for posting in postings:
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for user_id in matches:
+                    frequency = posting[user_id]
+                    norm = self.K1 * (1 - self.B + self.B * self.lengths[user_id] / average)
+                    scores[user_id] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+# One in-memory index per database, built on first use and patched from committed changes
+_indexes: "weakref.WeakKeyDictionary[Engine, InvertedIndex]" = weakref.WeakKeyDictionary()
+# Users changed while a database's index is being built
+_building: "weakref.WeakKeyDictionary[Engine, Set[int]]" = weakref.WeakKeyDictionary()
+# Users changed since their text was indexed, reread on the next search
+_stale: "weakref.WeakKeyDictionary[Engine, Set[int]]" = weakref.WeakKeyDictionary()
+_build_lock = threading.Lock()
+_stale_lock = threading.Lock()
+# connection.info key of users whose text the open transaction changed
+_PENDING = "search_pending"
+
+def memory_index(db: Session) -> InvertedIndex:
+    """The in-memory index of the session's database, with committed text changes applied"""
+    engine = db.get_bind()
+    index = _indexes.get(engine)
+    if index is None:
+        with _build_lock:
+            index = _indexes.get(engine)
+            if index is None:
+                changed = _building[engine] = set()
+                try:
+                    index = InvertedIndex.build(db)
+                finally:
+                    _building.pop(engine, None)
+                with _stale_lock:
+                    _stale.setdefault(engine, set()).update(changed)
+                _indexes[engine] = index
+    with _stale_lock:
+        stale = _stale.pop(engine, None)
+    if stale:
+        # Changed fields may be deferred and unloaded at flush, so text is reread here
+        user_ids = sorted(stale)
+        found = set()
+        for start in range(0, len(user_ids), 500):
+            rows = db.execute(select(User.id, User.bio, User.occupation, User.interests).where(
+                User.id.in_(user_ids[start:start + 500])
+            ))
+            for user_id, bio, occupation, interests in rows:
+                index.add(user_id, bio, occupation, interests)
+                found.add(user_id)
+        for user_id in set(user_ids) - found:
+            index.remove(user_id)
+    return index
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _record_row(mapper, connection, target):
+    connection.info.setdefault(_PENDING, set()).add(target.id)
+
+@event.listens_for(User, "after_update")
+def _record_text_change(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in FTS_COLUMNS):
+        connection.info.setdefault(_PENDING, set()).add(target.id)
+
+@event.listens_for(Engine, "commit")
+def _mark_committed(connection):
+    user_ids = connection.info.pop(_PENDING, None)
+    if not user_ids:
+        return
+    engine = connection.engine
+    building = _building.get(engine)
+    if building is not None:
+        building.update(user_ids)
+    if engine in _indexes:
+        with _stale_lock:
+            _stale.setdefault(engine, set()).update(user_ids)
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
+
+def _reset() -> None:
+    """Drop every in-memory index (tests)"""
+    _indexes.clear()
+    _stale.clear()
+
+_fts = table(FTS_TABLE, column("rowid"))
+_fts_tables: "weakref.WeakKeyDictionary[Engine, bool]" = weakref.WeakKeyDictionary()
+
+def backend(db: Session) -> str:
+    """fts when the database has its full-text index (or SEARCH_BACKEND says so), else memory"""
+    if BACKEND != "auto":
+        return BACKEND
+    engine = db.get_bind()
+    found = _fts_tables.get(engine)
+    if found is None:
+        if engine.dialect.name == "sqlite":
+            found = db.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}).first() is not None
+        elif engine.dialect.name == "postgresql":
+            found = db.execute(text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = 'users' AND column_name = 'search_vector'"
+            )).first() is not None
+        else:
+            found = False
+        _fts_tables[engine] = found
+    return "fts" if found else "memory"
+
+class ProfileSearch:
+    @staticmethod
+    def _ranked_batches(db: Session, user: User, words: List[str]) -> Iterator[List[User]]:
+        """Eligible users matching every word, best first, BATCH_SIZE at a time"""
+        eligible = MatchFeedService.eligible_query(db, user)
+        if backend(db) == "memory":
+            hits = [user_id for user_id, _ in memory_index(db).search(words) if user_id != user.id]
+            for start in range(0, len(hits), BATCH_SIZE):
+                chunk = hits[start:start + BATCH_SIZE]
+                found = {candidate.id: candidate for candidate in eligible.filter(User.id.in_(chunk))}
+                yield [found[user_id] for user_id in chunk if user_id in found]
+            return
+
+        if db.get_bind().dialect.name == "postgresql":
+            query = func.plainto_tsquery("simple", " ".join(words))
+            vector = literal_column("users.search_vector")
+            ranked = eligible.filter(vector.op("@@")(query)).order_by(func.ts_rank_cd(vector, query).desc(), User.id)
+        else:
+            weights = ", ".join(str(WEIGHTS[field]) for field in FTS_COLUMNS)
+            # Quoted, so words are never read as FTS5 operators
+            ranked = eligible.join(_fts, _fts.c.rowid == User.id).filter(
+                literal_column(FTS_TABLE).op("MATCH")(" ".join('"%s"' % word for word in words))
+            ).order_by(literal_column("bm25(%s, %s)" % (FTS_TABLE, weights)), User.id)
+        offset = 0
+        while True:
+            batch = ranked.offset(offset).limit(BATCH_SIZE).all()
+            if batch:
+                yield batch
+            if len(batch) < BATCH_SIZE:
+                return
+            offset += BATCH_SIZE
+
+    @staticmethod
+    def search_ids(db: Session, user: User, query: str, skip: int = 0, limit: int = 20) -> List[int]:
+        """Ids of the eligible users matching `query`, in relevance order"""
+        words = _query_terms(query)
+        if not words:
+            return []
+        wanted = skip + limit
+        ids: List[int] = []
+        for batch in ProfileSearch._ranked_batches(db, user, words):
+            # Exact distance (including the candidate's own max_distance) and seen checks, as for feeds
+            keep = GeoService.distance_mask(user, *coordinates(batch))
+            keep &= ~SeenService.seen_mask(db, user.id, [candidate.id for candidate in batch])
+            ids.extend(candidate.id for candidate, kept in zip(batch, keep) if kept)
+            if len(ids) >= wanted:
+                break
+        return ids[skip:wanted]
+
+    @staticmethod
+    def search_cards(db: Session, user: User, query: str, skip: int = 0, limit: int = 20) -> List[Dict[str, object]]:
+        """search_ids as schemas.User dicts, read straight from SQL"""
+        ids = ProfileSearch.search_ids(db, user, query, skip, limit)
+        if not ids:
+            return []
+        cards = {card["id"]: card for card in USER_CARD.dicts(db.execute(USER_CARD.select().where(User.id.in_(ids))))}
+        return [cards[user_id] for user_id in ids if user_id in cards]
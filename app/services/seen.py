@@ -0,0 +1,249 @@
+from typing import Dict, Iterable, List, Sequence
+from collections import defaultdict
+import math
+import os
+import struct
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..models.user import Like, SeenFilter, utcnow
+from .cache import LRUCache
+
+# Overall false-positive target: the share of unseen candidates hidden by mistake
+SEEN_FALSE_POSITIVE_RATE = float(os.getenv("SEEN_FALSE_POSITIVE_RATE", "0.01"))
+SEEN_INITIAL_CAPACITY = int(os.getenv("SEEN_INITIAL_CAPACITY", "256"))
+
+# Keeps IN (...) lists below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+_FORMAT_VERSION = 1
+_SEED = 0x9E3779B97F4A7C15
+_HEADER = struct.Struct("<BdI")
+_STAGE = struct.Struct("<IIIB")
+
+def _mix(values: np.ndarray, seed: int) -> np.ndarray:
+    """splitmix64 finalizer: well spread 64-bit hashes of integer ids"""
+    with np.errstate(over="ignore"):
+        z = values.astype(np.uint64) + np.uint64(seed)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+def _probe_hashes(ids: np.ndarray, count: int) -> np.ndarray:
+    """(len(ids), count) independent hashes per id; stages use the first `hashes` columns"""
+    # Plain double hashing (h1 + i*h2) overshot the target rate by ~40% on small stages
+    probes = np.arange(count, dtype=np.uint64) * np.uint64(0x632BE59BD9B4E019)
+    with np.errstate(over="ignore"):
+        return _mix(_mix(ids, _SEED)[:, None] + probes[None, :], 0)
+
+class _Stage:
+    """One fixed-size Bloom filter"""
+    __slots__ = ("capacity", "count", "hashes", "bits")
+
+    def __init__(self, capacity: int, error_rate: float, count: int = 0, hashes: int = 0, bits: np.ndarray = None):
+        self.capacity = capacity
+        self.count = count
+        if bits is None:
+            size = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+            hashes = max(1, int(math.ceil(-math.log2(error_rate))))
+            bits = np.zeros((size + 63) // 64, dtype=np.uint64)
+        self.hashes = hashes
+        self.bits = bits
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # Multiply-shift maps the high 32 bits onto [0, size) without a division
+        size = np.uint64(len(self.bits) * 64)
+        return ((hashes >> np.uint64(32)) * size) >> np.uint64(32)
+
+    def add(self, hashes: np.ndarray) -> None:
+        positions = self._positions(hashes[:, :self.hashes]).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+        self.count += len(hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        # Probe by probe, keeping only the ids whose bits were all set so far: about
+        # half of the unseen ids drop out at each probe, so most cost one or two
+        alive = np.arange(len(hashes))
+        for column in range(self.hashes):
+            positions = self._positions(hashes[alive, column])
+            hit = (self.bits[positions >> np.uint64(6)] >> (positions & np.uint64(63))) & np.uint64(1)
+            alive = alive[hit.astype(bool)]
+            if not len(alive):
+                break
+        found = np.zeros(len(hashes), dtype=bool)
+        found[alive] = True
+        return found
+
+class ScalableBloomFilter:
+    """
+    Set of integer ids with no false negatives and a bounded false-positive rate,
+    growing without a preset size (Almeida et al., "Scalable Bloom Filters").
+    Each full stage is followed by one twice as large with half the error rate,
+    so the compounded rate stays under `error_rate` however many ids are added.
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, error_rate: float = SEEN_FALSE_POSITIVE_RATE, initial_capacity: int = SEEN_INITIAL_CAPACITY):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.stages: List[_Stage] = []
+
+    def __len__(self) -> int:
+        return sum(stage.count for stage in self.stages)
+
+    def _stage_error(self, index: int) -> float:
+        return self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** index
+
+    def add(self, ids: Iterable[int]) -> None:
+        ids = np.fromiter(ids, dtype=np.int64)
+        # Ids already present are skipped, so repeats do not use up capacity
+        ids = ids[~self.contains(ids)] if len(ids) else ids
+        while len(ids):
+            if not self.stages or self.stages[-1].count >= self.stages[-1].capacity:
+                index = len(self.stages)
+                self.stages.append(_Stage(self.initial_capacity * self.GROWTH ** index, self._stage_error(index)))
+            stage = self.stages[-1]
+            room = stage.capacity - stage.count
+            stage.add(_probe_hashes(ids[:room], stage.hashes))
+            ids = ids[room:]
+
+    def contains(self, ids) -> np.ndarray:
+        """Boolean mask of the ids that were (probably) added"""
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        if not self.stages or not len(ids):
+            return found
+        # Hashed once for all stages; later stages only need more columns
+        hashes = _probe_hashes(ids, max(stage.hashes for stage in self.stages))
+        undecided = np.arange(len(ids))
+        for stage in self.stages:
+            hit = stage.contains(hashes[undecided])
+            found[undecided[hit]] = True
+            undecided = undecided[~hit]
+            if not len(undecided):
+                break
+        return found
+
+    def __contains__(self, item: int) -> bool:
+        return bool(self.contains([item])[0])
+
+    def nbytes(self) -> int:
+        return sum(stage.bits.nbytes for stage in self.stages)
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(_FORMAT_VERSION, self.error_rate, self.initial_capacity)]
+        for stage in self.stages:
+            parts.append(_STAGE.pack(stage.capacity, stage.count, len(stage.bits), stage.hashes))
+            parts.append(stage.bits.astype("<u8").tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ScalableBloomFilter":
+        version, error_rate, initial_capacity = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError("unknown seen-filter format %d" % version)
+        bloom = cls(error_rate, initial_capacity)
+        offset = _HEADER.size
+        while offset < len(data):
+            capacity, count, words, hashes = _STAGE.unpack_from(data, offset)
+            offset += _STAGE.size
+            bits = np.frombuffer(data, dtype="<u8", count=words, offset=offset).astype(np.uint64)
+            offset += words * 8
+            bloom.stages.append(_Stage(capacity, 0, count, hashes, bits))
+        return bloom
+
+# Deserialized filters by user id
+seen_cache = LRUCache(int(os.getenv("SEEN_CACHE_SIZE", "10000")))
+
+class SeenService:
+    """Per-user seen-sets: everyone a user liked or passed on, kept out of their candidates"""
+
+    @staticmethod
+    def load(db: Session, user_id: int) -> ScalableBloomFilter:
+        return SeenService.load_many(db, [user_id])[user_id]
+
+    @staticmethod
+    def load_many(db: Session, user_ids: Sequence[int]) -> Dict[int, ScalableBloomFilter]:
+        """Filters of the given users, read from the cache or in chunked queries"""
+        filters, missing = {}, []
+        for user_id in dict.fromkeys(user_ids):
+            bloom = seen_cache.get(user_id)
+            if bloom is None:
+                missing.append(user_id)
+            else:
+                filters[user_id] = bloom
+        for start in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[start:start + CHUNK_SIZE]
+            stored = dict(db.execute(select(SeenFilter.user_id, SeenFilter.bloom).where(SeenFilter.user_id.in_(chunk))).all())
+            for user_id, bloom in _decode(db, chunk, stored).items():
+                seen_cache.put(user_id, bloom)
+                filters[user_id] = bloom
+        return filters
+
+    @staticmethod
+    def seen_mask(db: Session, user_id: int, candidate_ids) -> np.ndarray:
+        """For each candidate id, whether the user already swiped on them"""
+        return SeenService.load(db, user_id).contains(candidate_ids)
+
+    @staticmethod
+    def mark_seen(db: Session, swipes: Dict[int, Sequence[int]]) -> None:
+        """
+        Add {user_id: [candidate ids]} to the users' filters (does not commit).
+        Filters are read back from the database inside the writing transaction,
+        so concurrent swipes from other processes are not overwritten.
+        """
+        user_ids = list(swipes)
+        query = select(SeenFilter.user_id, SeenFilter.bloom).where(SeenFilter.user_id.in_(user_ids))
+        if db.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update()
+        stored = dict(db.execute(query).all())
+        filters = _decode(db, user_ids, stored)
+        rows = []
+        for user_id, candidate_ids in swipes.items():
+            bloom = filters[user_id]
+            bloom.add(candidate_ids)
+            # Cached before the commit: a rollback can only leave extra ids, hiding a few candidates
+            seen_cache.put(user_id, bloom)
+            rows.append({"user_id": user_id, "bloom": bloom.to_bytes(), "items": len(bloom), "updated_at": utcnow()})
+        _upsert_filters(db, rows)
+
+def _decode(db: Session, user_ids: Sequence[int], stored: Dict[int, bytes]) -> Dict[int, ScalableBloomFilter]:
+    """
+    Deserialize the stored filters. Users without one yet, such as those who swiped
+    before seen-sets existed, get a filter seeded from their likes.
+    """
+    missing = [user_id for user_id in user_ids if not stored.get(user_id)]
+    liked = defaultdict(list)
+    for start in range(0, len(missing), CHUNK_SIZE):
+        for liker_id, liked_id in db.execute(
+            select(Like.liker_id, Like.liked_id).where(Like.liker_id.in_(missing[start:start + CHUNK_SIZE]))
+        ):
+            liked[liker_id].append(liked_id)
+    filters = {}
+    for user_id in user_ids:
+        data = stored.get(user_id)
+        if data:
+            filters[user_id] = ScalableBloomFilter.from_bytes(data)
+        else:
+            filters[user_id] = ScalableBloomFilter()
+            filters[user_id].add(liked[user_id])
+    return filters
+
+def _upsert_filters(db: Session, rows: List[Dict[str, object]]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        statement = insert(SeenFilter).values(rows)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={key: statement.excluded[key] for key in ("bloom", "items", "updated_at")},
+        ))
+        return
+
+    for row in rows:
+        db.merge(SeenFilter(**row))
+    db.flush()
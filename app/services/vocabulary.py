@@ -0,0 +1,205 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import threading
+import weakref
+from sqlalchemy import Engine, event, literal, select, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, object_session
+from ..models.user import User, VocabularyTerm
+from .features import FeatureVocabularies, Vocabulary
+
+INTEREST = "interest"
+LANGUAGE = "language"
+
+# connection.info key of terms interned by the open transaction
+_PENDING = "vocabulary_pending"
+_MAX_ATTEMPTS = 5
+
+def to_bytes(term_ids: Iterable[int]) -> Optional[bytes]:
+    """Little-endian uint64 bitset with the given bits set; None when empty"""
+    value = 0
+    for term_id in term_ids:
+        value |= 1 << term_id
+    if not value:
+        return None
+    words = (value.bit_length() + 63) // 64
+    return value.to_bytes(words * 8, "little")
+
+def bits_of(value: int) -> List[int]:
+    """Positions of the set bits of an integer, ascending"""
+    positions = []
+    while value:
+        low = value & -value
+        positions.append(low.bit_length() - 1)
+        value ^= low
+    return positions
+
+class InternedVocabulary:
+    """
+    In-process cache of the committed term <-> bit assignments of one kind.
+    Assignments never change once committed, so the cache is never invalidated;
+    terms interned by a transaction are only learned when it commits.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._bits: Dict[str, int] = {}
+        self._terms: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        # Built on demand and dropped whenever a new term is learned
+        self._snapshot: Optional[Vocabulary] = None
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    def get(self, term: str, default: int = -1) -> int:
+        return self._bits.get(term, default)
+
+    def term(self, bit: int) -> Optional[str]:
+        return self._terms.get(bit)
+
+    def learn(self, rows: Iterable) -> None:
+        with self._lock:
+            for term, bit in rows:
+                if self._bits.get(term) != bit:
+                    self._bits[term] = bit
+                    self._terms[bit] = term
+                    self._snapshot = None
+
+    def snapshot(self) -> Vocabulary:
+        """A Vocabulary whose ids are the interned bits; shared between callers, so never modify it"""
+        with self._lock:
+            if self._snapshot is None:
+                vocabulary = Vocabulary()
+                for bit in sorted(self._terms):
+                    vocabulary.reserve(bit)
+                    vocabulary.add(self._terms[bit])
+                self._snapshot = vocabulary
+            return self._snapshot
+
+# Bits are only meaningful within one database, so each engine gets its own vocabularies
+_registries: "weakref.WeakKeyDictionary[Engine, Dict[str, InternedVocabulary]]" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+# Engines whose committed terms were read by VocabularyService.load
+_loaded: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+def interned(bind: Engine) -> Dict[str, InternedVocabulary]:
+    """The in-process vocabularies of a database, by kind"""
+    with _registries_lock:
+        registry = _registries.get(bind)
+        if registry is None:
+            registry = _registries[bind] = {kind: InternedVocabulary(kind) for kind in (INTEREST, LANGUAGE)}
+        return registry
+
+@event.listens_for(Engine, "commit")
+def _learn_pending(connection):
+    pending = connection.info.pop(_PENDING, ())
+    if pending:
+        registry = interned(connection.engine)
+        for kind, term, bit in pending:
+            registry[kind].learn([(term, bit)])
+
+@event.listens_for(Engine, "rollback")
+def _forget_pending(connection):
+    connection.info.pop(_PENDING, None)
+
+class VocabularyService:
+    @staticmethod
+    def intern(connection: Connection, kind: str, terms: Sequence[str]) -> Dict[str, int]:
+        """Bits of the given terms, assigning the next free bit to new ones"""
+        vocabulary = interned(connection.engine)[kind]
+        bits = {term: vocabulary.get(term) for term in dict.fromkeys(terms)}
+        pending = {term: bit for pending_kind, term, bit in connection.info.get(_PENDING, ()) if pending_kind == kind}
+        missing = [term for term, bit in bits.items() if bit < 0 and term not in pending]
+        bits.update((term, pending[term]) for term in bits if term in pending)
+
+        table = VocabularyTerm.__table__
+        for _ in range(_MAX_ATTEMPTS):
+            if not missing:
+                return bits
+            # Committed by another process, or by this transaction before it learned them
+            found = connection.execute(
+                select(table.c.term, table.c.bit).where(table.c.kind == kind, table.c.term.in_(missing))
+            ).all()
+            vocabulary.learn(found)
+            bits.update(found)
+            missing = [term for term in missing if bits[term] < 0]
+            for term in missing:
+                bit = _insert_term(connection, kind, term)
+                if bit is not None:
+                    bits[term] = bit
+                    connection.info.setdefault(_PENDING, []).append((kind, term, bit))
+            missing = [term for term in missing if bits[term] < 0]
+        raise RuntimeError("could not intern %d %s terms" % (len(missing), kind))
+
+    @staticmethod
+    def encode(connection: Connection, kind: str, terms: Sequence[str]) -> Optional[bytes]:
+        """The bitset of a list of terms, interning new ones"""
+        bits = VocabularyService.intern(connection, kind, terms)
+        return to_bytes(bits[term] for term in terms)
+
+    @staticmethod
+    def load(db: Session) -> None:
+        """
+        Warm the in-process vocabularies with every committed term, once per engine.
+        Later terms are learned when the transaction interning them commits, or by
+        intern() when another process committed them first.
+        """
+        bind = db.get_bind()
+        if bind in _loaded:
+            return
+        # Terms interned by the session's open transaction are learned when it commits
+        pending = {(kind, term) for kind, term, _ in db.connection().info.get(_PENDING, ())}
+        registry = interned(bind)
+        for kind, term, bit in db.query(VocabularyTerm.kind, VocabularyTerm.term, VocabularyTerm.bit):
+            if (kind, term) not in pending:
+                registry[kind].learn([(term, bit)])
+        _loaded.add(bind)
+
+    @staticmethod
+    def feature_vocabularies(db: Session) -> FeatureVocabularies:
+        """
+        FeatureVocabularies that read the stored bitsets of users directly.
+        Users whose bitsets are not stored yet are encoded with the committed terms.
+        """
+        VocabularyService.load(db)
+        registry = interned(db.get_bind())
+        return FeatureVocabularies(registry[INTEREST].snapshot(), registry[LANGUAGE].snapshot(), interned=True)
+
+    @staticmethod
+    def shared_terms(kind: str, user1: User, user2: User) -> Optional[List[str]]:
+        """
+        Terms both users list, by ANDing their stored bitsets.
+        None when a bitset is not stored, the users are not attached to a session,
+        or a shared bit is not known in-process yet.
+        """
+        field = "interest_bits" if kind == INTEREST else "language_bits"
+        left, right = getattr(user1, field), getattr(user2, field)
+        session = object_session(user1)
+        if left is None or right is None or session is None:
+            return None
+        common = int.from_bytes(left, "little") & int.from_bytes(right, "little")
+        vocabulary = interned(session.get_bind())[kind]
+        terms = [vocabulary.term(bit) for bit in bits_of(common)]
+        if None in terms:
+            return None
+        return terms
+
+def _insert_term(connection: Connection, kind: str, term: str) -> Optional[int]:
+    """Insert a term at the next free bit; None when a concurrent writer took the term or bit"""
+    table = VocabularyTerm.__table__
+    next_bit = select(literal(kind), literal(term), func.coalesce(func.max(table.c.bit), -1) + 1).where(
+        table.c.kind == kind
+    )
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        statement = insert(table).from_select(["kind", "term", "bit"], next_bit).on_conflict_do_nothing()
+    else:
+        statement = table.insert().from_select(["kind", "term", "bit"], next_bit)
+    if connection.execute(statement).rowcount == 0:
+        return None
+    return connection.execute(
+        select(table.c.bit).where(table.c.kind == kind, table.c.term == term)
+    ).scalar_one()
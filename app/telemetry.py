@@ -0,0 +1,353 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import functools
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LIFETIME_BUCKETS = (1.0, 10.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 14400.0)
+# In-process operations run from microseconds (one compatibility score) to a bcrypt hash
+OPERATION_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+class Histogram:
+    """Cumulative-bucket histogram, in the Prometheus style"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._sum += value
+            self._counts[index] += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+class PoolTelemetry:
+    """Counters and histograms fed by the events of one connection pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.wait_seconds = Histogram()
+        self.checkout_seconds = Histogram()
+        self.lifetime_seconds = Histogram(LIFETIME_BUCKETS)
+        self.checkouts = 0
+        self.overflow_connections = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.peak_checked_out = 0
+
+    def snapshot(self) -> Dict[str, object]:
+        pool = self.pool
+        state = {}
+        if isinstance(pool, QueuePool):
+            state = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+            }
+        return {
+            "pool": type(pool).__name__ if pool is not None else None,
+            **state,
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "overflow_connections": self.overflow_connections,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "wait_seconds": self.wait_seconds.snapshot(),
+            "checkout_seconds": self.checkout_seconds.snapshot(),
+            "connection_lifetime_seconds": self.lifetime_seconds.snapshot(),
+        }
+
+class _TimedPoolMixin:
+    """Times how long checkouts wait for a connection, which pool events cannot see"""
+    telemetry: Optional[PoolTelemetry] = None
+
+    def connect(self):
+        telemetry = self.telemetry
+        overflow = self.overflow()
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if telemetry is not None:
+                telemetry.timeouts += 1
+                telemetry.wait_seconds.observe(time.perf_counter() - started)
+            raise
+        if telemetry is not None:
+            telemetry.wait_seconds.observe(time.perf_counter() - started)
+            if self.overflow() > max(overflow, 0):
+                telemetry.overflow_connections += 1
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        if self.telemetry is not None:
+            self.telemetry.pool = pool
+        return pool
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+# Telemetry of every instrumented engine, by name
+pools: Dict[str, PoolTelemetry] = {}
+
+def instrument_pool(engine: Engine, name: str) -> PoolTelemetry:
+    """Collect telemetry from an engine's pool (pass AsyncEngine.sync_engine for async engines)"""
+    telemetry = pools[name] = PoolTelemetry(name)
+    telemetry.pool = engine.pool
+    if isinstance(engine.pool, _TimedPoolMixin):
+        engine.pool.telemetry = telemetry
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        telemetry.connects += 1
+        connection_record.info["telemetry_connected_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        telemetry.checkouts += 1
+        connection_record.info["telemetry_checked_out_at"] = time.monotonic()
+        pool = telemetry.pool
+        if isinstance(pool, QueuePool):
+            telemetry.peak_checked_out = max(telemetry.peak_checked_out, pool.checkedout())
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("telemetry_checked_out_at", None)
+        if checked_out_at is not None:
+            telemetry.checkout_seconds.observe(time.monotonic() - checked_out_at)
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("telemetry_connected_at", None)
+        if connected_at is not None:
+            telemetry.lifetime_seconds.observe(time.monotonic() - connected_at)
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        telemetry.invalidations += 1
+
+    return telemetry
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    return {name: telemetry.snapshot() for name, telemetry in pools.items()}
+
+class RequestStats:
+    """Database work done on behalf of one request"""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Set by MetricsMiddleware for the duration of a request; run_sync greenlets and
+# threadpool calls inherit it, so their queries are attributed to the request
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+# Route label of requests that matched no route, so unknown paths cannot grow the label set
+UNMATCHED_ROUTE = "<unmatched>"
+
+class Metrics:
+    """Request, query and in-process operation metrics, keyed by their label values"""
+
+    def __init__(self):
+        self.in_flight: Dict[str, int] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        self.request_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.request_db_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.request_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.query_seconds = Histogram(OPERATION_BUCKETS)
+        self.operation_seconds: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, family: Dict, key, buckets: Sequence[float]) -> Histogram:
+        histogram = family.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = family.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def operation(self, name: str) -> Histogram:
+        return self._histogram(self.operation_seconds, name, OPERATION_BUCKETS)
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        self._histogram(self.request_seconds, key, LATENCY_BUCKETS).observe(seconds)
+        self._histogram(self.request_db_seconds, key, LATENCY_BUCKETS).observe(stats.db_seconds)
+        self._histogram(self.request_queries, key, QUERY_COUNT_BUCKETS).observe(stats.queries)
+        with self._lock:
+            self.responses[(method, route, status_code)] = self.responses.get((method, route, status_code), 0) + 1
+
+    def reset(self) -> None:
+        self.__init__()
+
+metrics = Metrics()
+
+def observe_call(name: str, function: Callable, *args, **kwargs):
+    """Call function and record its duration under operation `name`"""
+    histogram = metrics.operation(name)
+    started = perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        histogram.observe(perf_counter() - started)
+
+def timed(name: str):
+    """Decorator recording the duration of every call under operation `name`"""
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            histogram = metrics.operation(name)
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+    return decorate
+
+def instrument_queries(engine: Engine) -> None:
+    """Time every statement an engine executes (pass AsyncEngine.sync_engine for async engines)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # The execution context lives for one statement; conn.info is several lookups away
+        context._telemetry_started = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - context._telemetry_started
+        metrics.query_seconds.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status, DB time and query count of every
+    HTTP request, labelled by route template rather than by path. Written against
+    raw ASGI so the endpoint runs in the middleware's task and context.
+    """
+
+    def __init__(self, app, registry: Metrics = metrics):
+        self.app = app
+        self.metrics = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics, method = self.metrics, scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        metrics.in_flight[method] = metrics.in_flight.get(method, 0) + 1
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            metrics.in_flight[method] -= 1
+            current_request.reset(token)
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            route = getattr(route, "path", None) or UNMATCHED_ROUTE
+            metrics.observe_request(method, route, status_code, elapsed, stats)
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return ",".join('%s="%s"' % (name, escape(value)) for name, value in labels.items())
+
+def _histogram_lines(name: str, histogram: Histogram, labels: str, lines: List[str]) -> None:
+    state = histogram.snapshot()
+    prefix = labels + "," if labels else ""
+    for bound, count in state["buckets"].items():
+        lines.append('%s_bucket{%sle="%s"} %d' % (name, prefix, bound, count))
+    suffix = "{%s}" % labels if labels else ""
+    lines.append("%s_sum%s %r" % (name, suffix, state["sum"]))
+    lines.append("%s_count%s %d" % (name, suffix, state["count"]))
+
+def render_prometheus(registry: Metrics = metrics) -> str:
+    """Request, query, operation and pool metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+
+    def family(name: str, kind: str, help_text: str) -> None:
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, kind))
+
+    family("http_requests_in_flight", "gauge", "HTTP requests being served")
+    for method, count in sorted(registry.in_flight.items()):
+        lines.append("http_requests_in_flight{%s} %d" % (_labels(method=method), count))
+    family("http_requests_total", "counter", "HTTP responses by route template and status")
+    for (method, route, code), count in sorted(registry.responses.items()):
+        lines.append("http_requests_total{%s} %d" % (_labels(method=method, route=route, status=code), count))
+    for name, source, help_text in (
+        ("http_request_duration_seconds", registry.request_seconds, "Time to serve a request"),
+        ("http_request_db_seconds", registry.request_db_seconds, "Time spent executing SQL per request"),
+        ("http_request_db_queries", registry.request_queries, "SQL statements executed per request"),
+    ):
+        family(name, "histogram", help_text)
+        for (method, route), histogram in sorted(source.items()):
+            _histogram_lines(name, histogram, _labels(method=method, route=route), lines)
+    family("db_query_duration_seconds", "histogram", "Time to execute one SQL statement, including background work")
+    _histogram_lines("db_query_duration_seconds", registry.query_seconds, "", lines)
+    family("app_operation_duration_seconds", "histogram", "Time spent in instrumented in-process operations")
+    for operation, histogram in sorted(registry.operation_seconds.items()):
+        _histogram_lines("app_operation_duration_seconds", histogram, _labels(operation=operation), lines)
+
+    states = {name: telemetry.snapshot() for name, telemetry in pools.items()}
+    family("db_pool_checked_out", "gauge", "Connections currently checked out of the pool")
+    for name, state in sorted(states.items()):
+        if "checked_out" in state:
+            lines.append("db_pool_checked_out{%s} %d" % (_labels(pool=name), state["checked_out"]))
+    for metric, key, help_text in (
+        ("db_pool_checkouts_total", "checkouts", "Connection checkouts"),
+        ("db_pool_timeouts_total", "timeouts", "Checkouts that timed out waiting for a connection"),
+        ("db_pool_overflow_connections_total", "overflow_connections", "Connections opened beyond the pool size"),
+    ):
+        family(metric, "counter", help_text)
+        for name, state in sorted(states.items()):
+            lines.append("%s{%s} %d" % (metric, _labels(pool=name), state[key]))
+    family("db_pool_wait_seconds", "histogram", "Time a checkout waited for a connection")
+    for name, telemetry in sorted(pools.items()):
+        _histogram_lines("db_pool_wait_seconds", telemetry.wait_seconds, _labels(pool=name), lines)
+    return "\n".join(lines) + "\n"
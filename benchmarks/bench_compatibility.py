@@ -0,0 +1,77 @@
+"""
+Benchmark one-vs-many compatibility scoring.
+
+Compares CompatibilityService.calculate_compatibility called in a loop with
+CompatibilityService.calculate_compatibility_batch over ProfileFeatures.
+
+Usage: python -m benchmarks.bench_compatibility [--sizes 10000 100000 1000000]
+"""
+import argparse
+import random
+import time
+import numpy as np
+
+from app.models.user import User
+from app.schemas.user import PersonalityTrait
+from app.services.compatibility import CompatibilityService
+from app.services.features import ProfileFeatures
+
+INTERESTS = ["interest-%d" % i for i in range(150)]
+LANGUAGES = ["english", "spanish", "french", "german", "mandarin", "hindi", "arabic", "portuguese"]
+TRAITS = [trait.value for trait in PersonalityTrait]
+GOALS = ["casual", "serious", "friendship", "marriage", None]
+HABITS = ["never", "sometimes", "regularly", None]
+EDUCATION = ["high school", "bachelor", "master", "phd", None]
+
+def make_users(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        User(
+            id=user_id,
+            interests=rng.sample(INTERESTS, rng.randint(0, 10)),
+            personality_traits=rng.sample(TRAITS, rng.randint(0, 4)),
+            languages=rng.sample(LANGUAGES, rng.randint(1, 3)),
+            relationship_goals=rng.choice(GOALS),
+            smoking=rng.choice(HABITS),
+            drinking=rng.choice(HABITS),
+            education=rng.choice(EDUCATION),
+            wants_children=rng.choice([None, True, False]),
+        )
+        for user_id in range(1, count + 1)
+    ]
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--pool", type=int, default=10_000, help="distinct synthetic profiles tiled up to each size")
+    parser.add_argument("--scalar-limit", type=int, default=100_000, help="skip the scalar loop above this size")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pool = make_users(args.pool)
+    source = pool[0]
+    pool_features = ProfileFeatures.from_users(pool)
+
+    print("%10s %14s %14s %10s" % ("candidates", "scalar (s)", "batch (s)", "speedup"))
+    for size in args.sizes:
+        rows = np.arange(size) % len(pool)
+        candidates = pool_features.take(rows)
+        batch = best_of(args.repeat, lambda: CompatibilityService.calculate_compatibility_batch(source, candidates))
+
+        if size <= args.scalar_limit:
+            users = [pool[row] for row in rows]
+            scalar = best_of(1, lambda: [CompatibilityService.calculate_compatibility(source, user) for user in users])
+            print("%10d %14.4f %14.4f %9.1fx" % (size, scalar, batch, scalar / batch))
+        else:
+            print("%10d %14s %14.4f %10s" % (size, "-", batch, "-"))
+
+if __name__ == "__main__":
+    main()
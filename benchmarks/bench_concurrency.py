@@ -0,0 +1,225 @@
+"""
+Benchmark requests per second under concurrent clients: the previous synchronous
+database layer versus the async one.
+
+"legacy" rebuilds the old request path: a sync Session from get_db, with the async
+get_current_user running its blocking query on the event loop and the sync
+/messages endpoint in the threadpool. "async" serves the current app.
+
+Each variant runs in its own uvicorn process. --db-latency-ms adds a simulated
+database round trip to every statement. SQLite answers in microseconds, which would
+hide the difference a networked database makes. The delay runs on whichever thread
+executes the statement: the event loop for the legacy dependency, aiosqlite's
+worker thread for the async layer.
+
+Usage: python -m benchmarks.bench_concurrency [--users 2000] [--clients 100 500 1000] [--duration 10] [--db-latency-ms 2]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timezone
+
+def install_latency(sync_engine, seconds):
+    """Sleep once per statement inside SQLite itself, on the thread running the statement"""
+    from sqlalchemy import event
+
+    if seconds <= 0:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        state = connection_record.info["bench_latency"] = {"pending": False}
+
+        def handler():
+            if state["pending"]:
+                state["pending"] = False
+                time.sleep(seconds)
+            return 0
+
+        if hasattr(dbapi_connection, "run_async"):
+            dbapi_connection.run_async(lambda connection: connection.set_progress_handler(handler, 1))
+        else:
+            dbapi_connection.set_progress_handler(handler, 1)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_latency"]["pending"] = True
+
+def pool_options():
+    # Both variants get the same pool; a short timeout turns pool starvation into errors instead of a hang
+    return {
+        "pool_size": int(os.environ["BENCH_POOL_SIZE"]),
+        "max_overflow": int(os.environ["BENCH_POOL_SIZE"]),
+        "pool_timeout": float(os.environ["BENCH_POOL_TIMEOUT"]),
+    }
+
+def create_app():
+    """uvicorn --factory entry point; BENCH_VARIANT picks the implementation"""
+    latency = float(os.environ.get("BENCH_DB_LATENCY_MS", "0")) / 1000
+    if os.environ["BENCH_VARIANT"] == "async":
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        from app.database import AsyncSessionLocal, SQLALCHEMY_DATABASE_URL, async_database_url
+        from app.main import app
+        async_engine = create_async_engine(
+            async_database_url(SQLALCHEMY_DATABASE_URL), poolclass=AsyncAdaptedQueuePool, **pool_options()
+        )
+        AsyncSessionLocal.configure(bind=async_engine)
+        install_latency(async_engine.sync_engine, latency)
+        return app
+    return create_legacy_app(latency)
+
+def create_legacy_app(latency):
+    from typing import List
+    from fastapi import Depends, FastAPI, HTTPException
+    from jose import jwt
+    from sqlalchemy import create_engine, or_
+    from sqlalchemy.orm import sessionmaker
+    from app import models, schemas
+    from app.auth import ALGORITHM, SECRET_KEY, oauth2_scheme
+    from app.database import SQLALCHEMY_DATABASE_URL
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, **pool_options())
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    install_latency(engine, latency)
+    legacy = FastAPI()
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_db)):
+        username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if user is None:
+            raise HTTPException(status_code=401)
+        return user
+
+    @legacy.get("/users/me", response_model=schemas.User)
+    async def read_users_me(current_user=Depends(get_current_user)):
+        return current_user
+
+    @legacy.get("/messages", response_model=List[schemas.Message])
+    def get_messages(current_user=Depends(get_current_user), db=Depends(get_db)):
+        return db.query(models.Message).filter(
+            or_(models.Message.sender_id == current_user.id, models.Message.receiver_id == current_user.id)
+        ).all()
+
+    return legacy
+
+def populate(count):
+    from sqlalchemy import insert
+    from app import auth
+    from app.database import Base, engine
+    from app.models.user import Message, User
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{
+            "id": index + 1, "email": "user%d@example.com" % index, "username": "user%d" % index,
+            "hashed_password": "x", "first_name": "User", "last_name": str(index),
+            "date_of_birth": date(1990, 1, 1), "gender": "male", "looking_for": "female", "is_active": True,
+        } for index in range(count)])
+        connection.execute(insert(Message), [{
+            "content": "hello", "sender_id": rng.randint(1, count), "receiver_id": rng.randint(1, count),
+            "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc), "is_read": False,
+        } for _ in range(count * 5)])
+    return [auth.create_access_token({"sub": "user%d" % index}) for index in range(count)]
+
+async def drive(port, tokens, clients, duration, timeout):
+    """Run `clients` closed-loop clients for `duration` seconds; timeouts count as errors"""
+    import httpx
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url="http://127.0.0.1:%d" % port, limits=limits, timeout=timeout) as http:
+        async def client(index):
+            nonlocal errors
+            headers = {"Authorization": "Bearer " + tokens[index % len(tokens)]}
+            request = 0
+            while time.perf_counter() < deadline:
+                path = "/users/me" if request % 2 == 0 else "/messages"
+                request += 1
+                started = time.perf_counter()
+                try:
+                    response = await http.get(path, headers=headers)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client(index) for index in range(clients)))
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors
+
+def wait_for(port, process):
+    import httpx
+
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError("server exited with %s" % process.returncode)
+        try:
+            httpx.get("http://127.0.0.1:%d/docs" % port, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=10.0, help="client timeout per request")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    parser.add_argument("--pool-size", type=int, default=10, help="pool size, and again as overflow")
+    parser.add_argument("--pool-timeout", type=float, default=5.0)
+    parser.add_argument("--db", default="/tmp/bench_concurrency.db")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+    tokens = populate(args.users)
+
+    print("%-8s %8s %10s %10s %10s %7s" % ("variant", "clients", "ok req/s", "p50 ms", "p99 ms", "errors"))
+    for variant in ("legacy", "async"):
+        env = dict(os.environ, BENCH_VARIANT=variant, BENCH_DB_LATENCY_MS=str(args.db_latency_ms),
+                   BENCH_POOL_SIZE=str(args.pool_size), BENCH_POOL_TIMEOUT=str(args.pool_timeout))
+        for clients in args.clients:
+            # A fresh server per level, so a stalled level cannot leak into the next one
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.bench_concurrency:create_app",
+                 "--port", str(args.port), "--log-level", "critical", "--backlog", "4096"],
+                env=env,
+            )
+            try:
+                wait_for(args.port, server)
+                rate, latencies, errors = asyncio.run(drive(args.port, tokens, clients, args.duration, args.timeout))
+            finally:
+                server.kill()
+                server.wait()
+            ordered = sorted(latencies) or [float("nan")]
+            print("%-8s %8d %10.0f %10.1f %10.1f %7d" % (
+                variant, clients, rate, statistics.median(ordered) * 1000,
+                ordered[int(0.99 * (len(ordered) - 1))] * 1000, errors,
+            ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+End-to-end benchmark: a generated population, simulated users, and a JSON report.
+
+1. benchmarks.population loads a seeded population at the chosen scale. It is
+   generated once into <db>.pristine and copied for every run, so each run starts
+   from the same rows, as the scenario writes likes, passes and messages.
+2. benchmarks.scenarios drives the ASGI app in-process with concurrent virtual users.
+3. CompatibilityService is timed directly: scoring one pair, and ranking the
+   candidate pool of one user, which is what a feed rebuild does.
+
+Throughput and p50/p95/p99 latency per endpoint are written to --output as JSON
+with sorted keys, so two reports diff line by line. --compare prints the change
+of every endpoint against an earlier report.
+
+Usage: python -m benchmarks.bench_endpoints [--scale 10k|100k|1m] [--scenario mixed|swipe|chat]
+       [--clients 20] [--requests 2000 | --duration 30] [--output bench_endpoints.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def time_calls(function, calls):
+    samples = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - call_started)
+    return samples, time.perf_counter() - started
+
+def benchmark_services(calls, seed):
+    """Latency of CompatibilityService on the generated users, in the report's endpoint format"""
+    import random
+    from app.database import SessionLocal
+    from app.models.user import User
+    from app.services.compatibility import CompatibilityService
+    from app.services.features import ProfileFeatures
+    from app.services.feed import MatchFeedService
+    from app.services.vocabulary import VocabularyService
+    from benchmarks.scenarios import summarize
+
+    rng = random.Random(seed)
+    with SessionLocal() as db:
+        users = db.query(User).filter(User.is_active == True).order_by(User.id).limit(2000).all()
+        pairs = [tuple(rng.sample(users, 2)) for _ in range(calls)]
+        pair_samples, pair_elapsed = time_calls(lambda: CompatibilityService.calculate_compatibility(*pairs.pop()), calls)
+
+        viewer = users[0]
+        candidates = MatchFeedService.candidate_pool(db, viewer.gender, viewer.looking_for).all()
+        pool = ProfileFeatures.from_users(candidates, VocabularyService.feature_vocabularies(db))
+        rank_calls = max(1, calls // 100)
+        rank_samples, rank_elapsed = time_calls(lambda: CompatibilityService.rank_candidates(viewer, pool, 100), rank_calls)
+    return {
+        "CompatibilityService.calculate_compatibility": summarize(pair_samples, 0, pair_elapsed),
+        "CompatibilityService.rank_candidates (%d candidates)" % len(pool): summarize(rank_samples, 0, rank_elapsed),
+    }
+
+def compare(report, baseline):
+    """Print each endpoint's throughput and latency next to a baseline report's"""
+    print("%-40s %22s %22s %22s" % ("vs " + baseline["meta"].get("git_commit", "?"), "req/s", "p50 ms", "p99 ms"))
+    sections = [("endpoints", name) for name in report["endpoints"]] + [("services", name) for name in report["services"]]
+    for section, name in sections:
+        now, before = report[section][name], baseline.get(section, {}).get(name)
+        if before is None:
+            continue
+        cells = []
+        for key in ("throughput_rps", "p50_ms", "p99_ms"):
+            if key in now and key in before and before[key]:
+                change = (now[key] - before[key]) / before[key] * 100
+                cells.append("%9.1f -> %-7.1f%+4.0f%%" % (before[key], now[key], change))
+            else:
+                cells.append("%22s" % "-")
+        print("%-40s %s" % (name[:40], " ".join(cells)))
+
+def main():
+    from benchmarks.population import SCALES, PopulationSpec
+    from benchmarks.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of --requests")
+    parser.add_argument("--service-calls", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="default: /tmp/bench_endpoints-<scale>.db")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the pristine population")
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    db_path = args.db or "/tmp/bench_endpoints-%s.db" % args.scale
+    pristine = db_path + ".pristine"
+    spec = PopulationSpec(SCALES[args.scale], seed=args.seed)
+    # app.database reads DATABASE_URL on first import, which generating the population does
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    if args.regenerate or not os.path.exists(pristine):
+        from sqlalchemy import create_engine
+        from benchmarks.population import generate
+
+        if os.path.exists(pristine):
+            os.remove(pristine)
+        engine = create_engine("sqlite:///" + pristine)
+        population = generate(engine, spec)
+        engine.dispose()
+        for table, rows in population.rows.items():
+            print("generated %-22s %10d rows %8.1fs" % (table, rows, population.seconds[table]))
+    shutil.copyfile(pristine, db_path)
+
+    from sqlalchemy import select
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models.user import User
+    from benchmarks.scenarios import run
+
+    with SessionLocal() as db:
+        active = list(db.execute(select(User.id).where(User.is_active == True)).scalars())
+
+    result = asyncio.run(run(
+        app, active, spec.users, SCENARIOS[args.scenario], clients=args.clients,
+        requests=None if args.duration else args.requests, duration=args.duration, seed=args.seed,
+    ))
+    report = {
+        "meta": {
+            "scale": args.scale, "users": spec.users, "seed": args.seed, "scenario": args.scenario,
+            "clients": args.clients, "elapsed_s": result["elapsed"], "git_commit": git_commit(),
+            "python": sys.version.split()[0], "platform": platform.platform(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "endpoints": result["endpoints"],
+        "total": result["total"],
+        "services": benchmark_services(args.service_calls, args.seed),
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+        output.write("\n")
+
+    print("%-40s %8s %7s %9s %9s %9s" % ("endpoint", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms"))
+    for name, stats in list(report["endpoints"].items()) + [("total", report["total"])] + list(report["services"].items()):
+        print("%-40s %8.1f %7d %9.2f %9.2f %9.2f" % (
+            name[:40], stats["throughput_rps"], stats["errors"],
+            stats.get("p50_ms", float("nan")), stats.get("p95_ms", float("nan")), stats.get("p99_ms", float("nan")),
+        ))
+    print("report written to %s" % args.output)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(report, json.load(baseline))
+
+if __name__ == "__main__":
+    main()
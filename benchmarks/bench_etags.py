@@ -0,0 +1,94 @@
+"""
+Benchmark conditional requests by replaying clients that poll their profile and feed.
+
+A fixed set of clients each re-fetches GET /users/me and GET /matches, while
+every --edit-every-th step one random client edits its bio (which changes its
+own profile and every feed page it appears on). The same replay runs twice:
+  unconditional   every poll downloads the full payload
+  conditional     clients send back the last ETag of each URL as If-None-Match
+and reports response bytes, 304s, and the process CPU time and wall time of the
+replay. One warm-up pass builds every client's feed first and is not measured.
+
+Usage: python -m benchmarks.bench_etags [--scale 10k] [--clients 200] [--steps 5000] [--edit-every 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+
+async def replay(http, clients, steps, edit_every, conditional, seed):
+    rng = random.Random(seed)
+    etags = {}
+    sent = Counter()
+    cpu, wall = time.process_time(), time.perf_counter()
+    for step in range(steps):
+        user_id, headers = clients[rng.randrange(len(clients))]
+        if edit_every and step % edit_every == 0:
+            await http.put("/users/profile", headers=headers, json={"bio": "Edited at step %d" % step})
+        for path in ("/users/me", "/matches"):
+            request_headers = dict(headers)
+            if conditional and (user_id, path) in etags:
+                request_headers["If-None-Match"] = etags[user_id, path]
+            response = await http.get(path, headers=request_headers)
+            sent["requests"] += 1
+            sent["bytes"] += len(response.content)
+            sent[response.status_code] += 1
+            if "etag" in response.headers:
+                etags[user_id, path] = response.headers["etag"]
+    return sent, time.process_time() - cpu, time.perf_counter() - wall
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "100k", "1m"], default="10k")
+    parser.add_argument("--db", default="/tmp/bench_etags.db")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--edit-every", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    # app.database reads DATABASE_URL on first import
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+
+    import httpx
+    from sqlalchemy import create_engine, select
+    from benchmarks.population import SCALES, PopulationSpec, generate
+    from app import auth
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models.user import User
+
+    engine = create_engine("sqlite:///" + args.db)
+    generate(engine, PopulationSpec(SCALES[args.scale]))
+    engine.dispose()
+    with SessionLocal() as db:
+        active = list(db.execute(select(User.id, User.username).where(User.is_active == True).order_by(User.id)))
+    rng = random.Random(args.seed)
+    clients = [
+        (user_id, {"Authorization": "Bearer " + auth.create_access_token({"sub": username})})
+        for user_id, username in rng.sample(active, min(args.clients, len(active)))
+    ]
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        # The lifespan disposes the async engine, whose connection threads would keep the process alive
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+                for _, headers in clients:
+                    await http.get("/matches", headers=headers)
+                return [
+                    (label, await replay(http, clients, args.steps, args.edit_every, conditional, args.seed))
+                    for label, conditional in (("unconditional", False), ("conditional", True))
+                ]
+
+    print("%-14s %9s %7s %14s %10s %10s" % ("replay", "requests", "304s", "bytes", "cpu s", "wall s"))
+    for label, (sent, cpu, wall) in asyncio.run(run()):
+        print("%-14s %9d %7d %14s %10.2f %10.2f" % (
+            label, sent["requests"], sent[304], "{:,}".format(sent["bytes"]), cpu, wall))
+
+if __name__ == "__main__":
+    main()
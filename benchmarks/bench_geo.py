@@ -0,0 +1,106 @@
+"""
+Benchmark "active users within R km" radius queries.
+
+Compares a full vectorized haversine scan, the in-process GeoIndex and the SQL
+prefilter (indexed geo_cell ranges + bounding box) followed by haversine refinement.
+
+Usage: python -m benchmarks.bench_geo [--users 1000000] [--db /tmp/bench_geo.db] [--no-sql]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+import numpy as np
+
+CITIES = [
+    (40.71, -74.00), (34.05, -118.24), (51.51, -0.13), (48.86, 2.35), (52.52, 13.40),
+    (35.68, 139.69), (-33.87, 151.21), (19.43, -99.13), (-23.55, -46.63), (28.61, 77.21),
+    (55.76, 37.62), (1.35, 103.82), (-1.29, 36.82), (41.01, 28.98), (37.77, -122.42),
+]
+
+def make_points(count, seed=42):
+    rng = np.random.default_rng(seed)
+    centers = np.array(CITIES)[rng.integers(0, len(CITIES), count)]
+    # Most users cluster around a city, the rest are spread over land-ish latitudes
+    spread = np.where(rng.random(count) < 0.9, 0.6, 8.0)
+    latitudes = np.clip(centers[:, 0] + rng.normal(0, 1, count) * spread, -85, 85)
+    longitudes = ((centers[:, 1] + rng.normal(0, 1, count) * spread + 180) % 360) - 180
+    return np.arange(1, count + 1), latitudes, longitudes
+
+def timed(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--radii", type=float, nargs="+", default=[5, 25, 100, 500])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--db", default="/tmp/bench_geo.db")
+    parser.add_argument("--no-sql", action="store_true", help="skip loading the users into SQLite")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+
+    from sqlalchemy import insert
+    from app.database import Base, SessionLocal, engine
+    from app.models.user import User, geo_cell
+    from app.services.geo import GeoIndex, GeoService, haversine_km
+
+    ids, latitudes, longitudes = make_points(args.users)
+    rng = random.Random(7)
+    origins = [(lat + rng.uniform(-0.3, 0.3), lon + rng.uniform(-0.3, 0.3))
+               for lat, lon in (rng.choice(CITIES) for _ in range(args.queries))]
+
+    start = time.perf_counter()
+    index = GeoIndex.from_rows(zip(ids.tolist(), latitudes.tolist(), longitudes.tolist()))
+    print("GeoIndex built over %d users in %.2fs" % (len(index), time.perf_counter() - start))
+
+    db = None
+    if not args.no_sql:
+        Base.metadata.create_all(bind=engine)
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            batch = []
+            for user_id, latitude, longitude in zip(ids.tolist(), latitudes.tolist(), longitudes.tolist()):
+                batch.append({"id": user_id, "latitude": latitude, "longitude": longitude,
+                              "geo_cell": geo_cell(latitude, longitude), "is_active": True})
+                if len(batch) == 50_000:
+                    connection.execute(insert(User), batch)
+                    batch = []
+            if batch:
+                connection.execute(insert(User), batch)
+        print("loaded %d users into SQLite in %.1fs" % (args.users, time.perf_counter() - start))
+        db = SessionLocal()
+
+    print("%8s %10s %14s %14s %14s" % ("radius", "matches", "full scan ms", "GeoIndex ms", "SQL ms"))
+    for radius in args.radii:
+        scan, index_times, sql_times, matches = [], [], [], []
+        for latitude, longitude in origins:
+            elapsed, distances = timed(lambda: haversine_km(latitude, longitude, latitudes, longitudes), 1)
+            scan.append(elapsed)
+            expected = int((distances <= radius).sum())
+            elapsed, (found, _) = timed(lambda: index.within(latitude, longitude, radius), 3)
+            index_times.append(elapsed)
+            assert len(found) == expected
+            matches.append(expected)
+            if db is not None:
+                elapsed, (found, _) = timed(lambda: GeoService.users_within(db, latitude, longitude, radius), 1)
+                sql_times.append(elapsed)
+                assert len(found) == expected
+        print("%8g %10d %14.2f %14.2f %14s" % (
+            radius, statistics.median(matches), statistics.median(scan) * 1000,
+            statistics.median(index_times) * 1000,
+            "%.2f" % (statistics.median(sql_times) * 1000) if sql_times else "-",
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark like ingestion: one transaction per like versus the write-behind LikeBuffer.
+
+Concurrent clients each submit likes back to back, as the like endpoint would.
+"per-request" commits every like through MatchService.record_like in its own
+session; "write-behind" hands them to LikeBuffer, which commits batches and answers
+every caller once its batch is durable. Both paths detect mutual matches.
+
+Usage: python -m benchmarks.bench_likes [--likes 20000] [--clients 200] [--flush-rows 500] [--flush-interval-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+async def ingest(submit, likes, clients):
+    latencies = []
+    queue = list(likes)
+
+    async def client():
+        while queue:
+            liker, liked = queue.pop()
+            started = time.perf_counter()
+            await submit(liker, liked)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - started, latencies
+
+async def run(args):
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+    from app.database import Base
+    from app.models.user import User
+    from app.services.like_buffer import AppendLog, LikeBuffer
+    from app.services.matches import MatchService
+
+    rng = random.Random(42)
+    likes = list({(rng.randint(1, args.users), rng.randint(1, args.users)) for _ in range(args.likes * 2)})
+    likes = [pair for pair in likes if pair[0] != pair[1]][:args.likes]
+    print("%d likes among %d users, %d clients" % (len(likes), args.users, args.clients))
+    print("%-13s %9s %9s %12s %12s" % ("path", "likes/s", "commits", "p50 ms", "p99 ms"))
+
+    for variant in ("per-request", "write-behind"):
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        engine = create_async_engine("sqlite+aiosqlite:///" + args.db, poolclass=AsyncAdaptedQueuePool,
+                                     pool_size=10, max_overflow=10, pool_timeout=60)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.execute(insert(User), [
+                {"id": index, "email": "u%d@example.com" % index, "username": "user%d" % index, "hashed_password": "x"}
+                for index in range(1, args.users + 1)
+            ])
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+        if variant == "per-request":
+            async def submit(liker, liked):
+                async with sessions() as db:
+                    return await db.run_sync(MatchService.record_like, liker, liked)
+            elapsed, latencies = await ingest(submit, likes, args.clients)
+            commits = len(likes)
+        else:
+            buffer = LikeBuffer(sessions, flush_rows=args.flush_rows, flush_interval_ms=args.flush_interval_ms,
+                                log=AppendLog(args.db + ".log"))
+            await buffer.start()
+            elapsed, latencies = await ingest(buffer.add, likes, args.clients)
+            await buffer.stop()
+            commits = buffer.flushes
+        await engine.dispose()
+
+        ordered = sorted(latencies)
+        print("%-13s %9.0f %9d %12.1f %12.1f" % (
+            variant, len(likes) / elapsed, commits,
+            statistics.median(ordered) * 1000, ordered[int(0.99 * (len(ordered) - 1))] * 1000,
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--likes", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--flush-rows", type=int, default=500)
+    parser.add_argument("--flush-interval-ms", type=float, default=20)
+    parser.add_argument("--db", default="/tmp/bench_likes.db")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark a login flood: bcrypt on the event loop versus the bounded password hasher.
+
+Login clients hammer POST /token while reader clients call GET /users/me. "inline"
+verifies passwords directly on the event loop, as the app originally did; "hasher"
+uses the bounded worker pool, which answers 503 once workers and queue are full.
+Reports login throughput, shed logins, and the latency of the unrelated endpoint.
+
+Usage: python -m benchmarks.bench_login [--logins 50] [--readers 20] [--rounds 12] [--workers 2] [--queue 8]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_concurrency import populate, wait_for
+
+def create_app():
+    """uvicorn --factory entry point; BENCH_VARIANT picks where bcrypt runs"""
+    from app.main import app
+    from app.services.passwords import password_hasher
+
+    if os.environ["BENCH_VARIANT"] == "inline":
+        def inline(fn, *args):
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(fn(*args))
+            return future
+        password_hasher._submit = inline
+    return app
+
+async def flood(port, tokens, logins, readers, duration, timeout):
+    import httpx
+
+    login_codes = {}
+    read_latencies = []
+    read_errors = 0
+    limits = httpx.Limits(max_connections=logins + readers, max_keepalive_connections=logins + readers)
+    async with httpx.AsyncClient(base_url="http://127.0.0.1:%d" % port, limits=limits, timeout=timeout) as http:
+        async def login(index):
+            while time.perf_counter() < deadline:
+                try:
+                    response = await http.post("/token", data={"username": "user%d" % index, "password": "password"})
+                    code = response.status_code
+                except httpx.HTTPError:
+                    code = "timeout"
+                login_codes[code] = login_codes.get(code, 0) + 1
+
+        async def read(index):
+            nonlocal read_errors
+            headers = {"Authorization": "Bearer " + tokens[index % len(tokens)]}
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await http.get("/users/me", headers=headers)
+                except httpx.HTTPError:
+                    read_errors += 1
+                    continue
+                if response.status_code == 200:
+                    read_latencies.append(time.perf_counter() - started)
+                else:
+                    read_errors += 1
+                # Readers pace themselves, so their latency reflects the server rather than their own queueing
+                await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[login(i) for i in range(logins)], *[read(i) for i in range(readers)])
+        elapsed = time.perf_counter() - started
+    return elapsed, login_codes, read_latencies, read_errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=50, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=20, help="concurrent /users/me clients")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--db", default="/tmp/bench_login.db")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ.update(DATABASE_URL="sqlite:///" + args.db, BCRYPT_ROUNDS=str(args.rounds),
+                      PASSWORD_HASH_WORKERS=str(args.workers), PASSWORD_HASH_QUEUE=str(args.queue))
+    from sqlalchemy import update
+    from app.database import engine
+    from app.models.user import User
+    from app.services.passwords import pwd_context
+
+    tokens = populate(args.users)
+    with engine.begin() as connection:
+        connection.execute(update(User).values(hashed_password=pwd_context.hash("password")))
+
+    print("%-7s %9s %6s %6s %8s %12s %12s %7s" % (
+        "variant", "logins/s", "shed", "other", "reads/s", "read p50 ms", "read p99 ms", "errors"))
+    for variant in ("inline", "hasher"):
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.bench_login:create_app",
+             "--port", str(args.port), "--log-level", "critical", "--backlog", "4096"],
+            env=dict(os.environ, BENCH_VARIANT=variant),
+        )
+        try:
+            wait_for(args.port, server)
+            elapsed, codes, latencies, errors = asyncio.run(
+                flood(args.port, tokens, args.logins, args.readers, args.duration, args.timeout))
+        finally:
+            server.kill()
+            server.wait()
+        ordered = sorted(latencies) or [float("nan")]
+        other = sum(count for code, count in codes.items() if code not in (200, 503))
+        print("%-7s %9.1f %6d %6d %8.0f %12.1f %12.1f %7d" % (
+            variant, codes.get(200, 0) / elapsed, codes.get(503, 0), other, len(latencies) / elapsed,
+            statistics.median(ordered) * 1000, ordered[int(0.99 * (len(ordered) - 1))] * 1000, errors,
+        ))
+
+if __name__ == "__main__":
+    main()
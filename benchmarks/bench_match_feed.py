@@ -0,0 +1,137 @@
+"""
+Benchmark /matches latency: live scoring versus the materialized match feed.
+
+The live path is what /matches used to do: load every eligible user and score each
+one with CompatibilityService.calculate_compatibility. The feed path is the current
+/matches endpoint, driven in-process through the ASGI app.
+
+Usage: python -m benchmarks.bench_match_feed [--users 200000] [--db /tmp/bench_feed.db]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def report(label, samples):
+    print("%-18s n=%-5d p50=%9.2f ms  p99=%9.2f ms  mean=%9.2f ms" % (
+        label, len(samples),
+        percentile(samples, 0.50) * 1000,
+        percentile(samples, 0.99) * 1000,
+        statistics.mean(samples) * 1000,
+    ))
+
+def populate(engine, count, seed=42):
+    from sqlalchemy import insert
+    from app.models.user import User
+
+    rng = random.Random(seed)
+    interests = ["interest-%d" % i for i in range(150)]
+    languages = ["english", "spanish", "french", "german", "mandarin"]
+    traits = ["introvert", "extrovert", "adventurous", "cautious", "spontaneous",
+              "planned", "analytical", "creative", "traditional", "modern"]
+    rows = []
+    with engine.begin() as connection:
+        for index in range(count):
+            gender = "male" if index % 2 else "female"
+            rows.append({
+                "email": "user%d@example.com" % index,
+                "username": "user%d" % index,
+                "hashed_password": "x",
+                "first_name": "User",
+                "last_name": str(index),
+                "date_of_birth": date(1980 + index % 20, 1 + index % 12, 1 + index % 28),
+                "gender": gender,
+                "looking_for": "female" if gender == "male" else "male",
+                "interests": rng.sample(interests, rng.randint(0, 8)),
+                "personality_traits": rng.sample(traits, rng.randint(0, 3)),
+                "languages": rng.sample(languages, rng.randint(1, 2)),
+                "relationship_goals": rng.choice(["casual", "serious", "friendship", None]),
+                "smoking": rng.choice(["never", "sometimes", "regularly", None]),
+                "drinking": rng.choice(["never", "sometimes", "regularly", None]),
+                "education": rng.choice(["bachelor", "master", "phd", None]),
+                "wants_children": rng.choice([None, True, False]),
+                "is_active": True,
+            })
+            if len(rows) == 10_000:
+                connection.execute(insert(User), rows)
+                rows = []
+        if rows:
+            connection.execute(insert(User), rows)
+
+def live_matches(db, user):
+    """The pre-feed behaviour: score every eligible candidate on demand"""
+    from app import schemas
+    from app.services.compatibility import CompatibilityService
+    from app.services.feed import FEED_SIZE, MatchFeedService
+
+    candidates = MatchFeedService.eligible_candidates(db, user)
+    scored = sorted(
+        ((CompatibilityService.calculate_compatibility(user, candidate)[0], candidate.id, candidate)
+         for candidate in candidates),
+        key=lambda item: (-item[0], item[1]),
+    )[:FEED_SIZE]
+    return [schemas.User.model_validate(candidate).model_dump(mode="json") for _, _, candidate in scored]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--db", default="/tmp/bench_match_feed.db")
+    parser.add_argument("--viewers", type=int, default=50)
+    parser.add_argument("--live-requests", type=int, default=10)
+    parser.add_argument("--feed-requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+
+    from fastapi.testclient import TestClient
+    from app import auth
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.models.user import User
+    from app.services.feed import MatchFeedService
+
+    start = time.perf_counter()
+    populate(engine, args.users)
+    print("populated %d users in %.1fs" % (args.users, time.perf_counter() - start))
+
+    db = SessionLocal()
+    viewers = db.query(User).filter(User.id <= args.viewers).all()
+
+    live = []
+    for request in range(args.live_requests):
+        viewer = viewers[request % len(viewers)]
+        started = time.perf_counter()
+        live_matches(db, viewer)
+        live.append(time.perf_counter() - started)
+        db.expunge_all()
+
+    viewers = db.query(User).filter(User.id <= args.viewers).all()
+    start = time.perf_counter()
+    MatchFeedService.rebuild_feeds(db, viewers)
+    db.commit()
+    print("built %d feeds in %.1fs" % (len(viewers), time.perf_counter() - start))
+
+    client = TestClient(app)
+    headers = [{"Authorization": "Bearer " + auth.create_access_token({"sub": viewer.username})} for viewer in viewers]
+    db.close()
+
+    feed = []
+    for request in range(args.feed_requests):
+        started = time.perf_counter()
+        response = client.get("/matches", headers=headers[request % len(headers)])
+        feed.append(time.perf_counter() - started)
+        assert response.status_code == 200
+
+    report("live scoring", live)
+    report("materialized feed", feed)
+
+if __name__ == "__main__":
+    main()
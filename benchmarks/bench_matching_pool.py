@@ -0,0 +1,69 @@
+"""
+Benchmark ranking throughput of the matching worker pool at 1, 2, 4 and 8 processes.
+
+Builds the profile store of a generated population, then ranks the full candidate
+pool of `--jobs` users, as a feed rebuild does, in process and on MatchingPool
+workers. Workers map one shared snapshot, so each job ships only candidate ids.
+Throughput can only scale up to the number of cores of the machine.
+
+Usage: python -m benchmarks.bench_matching_pool [--scale 10k|100k|1m] [--jobs 400] [--processes 1,2,4,8]
+"""
+import argparse
+import os
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "100k", "1m"], default="100k")
+    parser.add_argument("--db", default="/tmp/bench_matching_pool.db")
+    parser.add_argument("--jobs", type=int, default=400)
+    parser.add_argument("--processes", default="1,2,4,8")
+    args = parser.parse_args()
+
+    import numpy as np
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from benchmarks.population import SCALES, PopulationSpec, generate
+    from app.models.user import User
+    from app.services.candidates import CandidateFilter
+    from app.services.matching_pool import MatchingPool, rank_in
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    generate(engine, PopulationSpec(SCALES[args.scale]))
+
+    from app.services.profile_store import ProfileStore
+
+    db = Session(engine)
+    store = ProfileStore.build(db)
+    owners = db.execute(select(User.id, User.gender, User.looking_for).where(User.is_active == True)
+                        .order_by(User.id).limit(args.jobs)).all()
+    today = CandidateFilter.today()
+    jobs = [(owner.id, store.candidates(owner.gender, owner.looking_for, today)[0].ids) for owner in owners]
+    db.close()
+    print("%d jobs, %.0f candidates per job on average, %d cores" % (
+        len(jobs), np.mean([len(ids) for _, ids in jobs]), os.cpu_count() or 1))
+
+    _, features = store.snapshot()
+    started = time.perf_counter()
+    for user_id, candidate_ids in jobs:
+        rank_in(features, user_id, candidate_ids, 100)
+    baseline = len(jobs) / (time.perf_counter() - started)
+    print("%-12s %8.1f jobs/s" % ("in process", baseline))
+
+    for processes in [int(count) for count in args.processes.split(",")]:
+        pool = MatchingPool(processes)
+        # Start the workers and map the snapshot before timing
+        for future in [pool.rank(store, jobs[0][0], jobs[0][1], 100) for _ in range(processes * 2)]:
+            future.result()
+        started = time.perf_counter()
+        for future in [pool.rank(store, user_id, candidate_ids, 100) for user_id, candidate_ids in jobs]:
+            future.result()
+        throughput = len(jobs) / (time.perf_counter() - started)
+        pool.shutdown()
+        print("%-12s %8.1f jobs/s  %.2fx in process" % ("%d process%s" % (processes, "es" if processes > 1 else ""),
+                                                      throughput, throughput / baseline))
+
+if __name__ == "__main__":
+    main()
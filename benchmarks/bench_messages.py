@@ -0,0 +1,84 @@
+"""
+Benchmark conversation paging on a single conversation of 1M messages.
+
+Compares the keyset pages served by MessageService.conversation, at the newest
+end and deep into the history, against OFFSET paging to the same depth and
+against loading and sorting the whole conversation as /messages did.
+
+Usage: python -m benchmarks.bench_messages [--messages 1000000] [--page 50]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default="/tmp/bench_messages.db")
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine, insert, or_, select
+    from sqlalchemy.orm import Session
+    from app.database import Base
+    from app.models.user import Message, User
+    from app.services.messages import MessageService
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {"id": 1, "email": "a@example.com", "username": "alice", "hashed_password": "x"},
+            {"id": 2, "email": "b@example.com", "username": "bob", "hashed_password": "x"},
+        ])
+        chunk = 50_000
+        for offset in range(0, args.messages, chunk):
+            connection.execute(insert(Message), [{
+                # Several messages share each second, so ordering relies on the id tiebreak too
+                "content": "message %d" % index, "sender_id": 1 + index % 2, "receiver_id": 2 - index % 2,
+                "timestamp": start + timedelta(seconds=index // 4), "is_read": False,
+            } for index in range(offset, min(offset + chunk, args.messages))])
+    print("conversation of %d messages, page of %d" % (args.messages, args.page))
+
+    db = Session(engine)
+    depth = args.messages * 9 // 10
+    anchor = db.execute(
+        select(Message).order_by(Message.timestamp.desc(), Message.id.desc()).offset(depth - 1).limit(1)
+    ).scalar_one()
+    cursor = MessageService.encode_cursor(anchor)
+    conversation = or_(
+        (Message.sender_id == 1) & (Message.receiver_id == 2),
+        (Message.sender_id == 2) & (Message.receiver_id == 1),
+    )
+
+    cases = [
+        ("keyset, newest page", lambda: MessageService.conversation(db, 1, 2, args.page)[0]),
+        ("keyset, %d deep" % depth, lambda: MessageService.conversation(db, 1, 2, args.page, cursor)[0]),
+        ("offset, %d deep" % depth, lambda: db.execute(
+            select(Message).where(conversation).order_by(Message.timestamp.desc(), Message.id.desc())
+            .offset(depth).limit(args.page)
+        ).scalars().all()),
+        ("whole history", lambda: db.execute(
+            select(Message).where(conversation).order_by(Message.timestamp.desc(), Message.id.desc())
+        ).scalars().all()),
+    ]
+    for name, fn in cases:
+        db.expunge_all()
+        elapsed, rows = timed(fn, args.repeat if name.startswith("keyset") else 1)
+        print("%-24s %10.2f ms  (%d rows)" % (name, elapsed * 1000, len(rows)))
+
+if __name__ == "__main__":
+    main()
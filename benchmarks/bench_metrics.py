@@ -0,0 +1,129 @@
+"""
+Benchmark the cost of the request metrics, to show they can stay on in production.
+
+Each recording path is timed with and without instrumentation:
+- Histogram.observe, which every other path ends in
+- a @timed function (CompatibilityService, bcrypt) against the bare function
+- a SQL statement on an engine with and without the cursor-execute listeners; the
+  cost is split between SQLAlchemy's event dispatch (any listener pays it, measured
+  with no-op listeners) and the timing done by the listeners themselves
+- an ASGI request through MetricsMiddleware against the bare application
+
+Usage: python -m benchmarks.bench_metrics [--calls 200000] [--queries 20000] [--requests 50000]
+"""
+import argparse
+import asyncio
+import time
+
+def best_of(function, calls, repeat=7):
+    """Fastest of `repeat` runs, in nanoseconds per call"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(calls)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1e9 / calls
+
+def compare(bare, instrumented, calls, rounds=3):
+    """best_of both variants, alternating so that drift in machine speed hits both alike"""
+    results = [(best_of(bare, calls), best_of(instrumented, calls)) for _ in range(rounds)]
+    return min(result[0] for result in results), min(result[1] for result in results)
+
+def report(name, bare, instrumented):
+    print("%-28s %12.0f %14.0f %12.0f" % (name, bare, instrumented, instrumented - bare))
+
+def bench_histogram(calls):
+    from app.telemetry import Histogram
+
+    histogram = Histogram()
+    values = [(index % 1000) / 10000 for index in range(calls)]
+
+    def run(count):
+        for value in values[:count]:
+            histogram.observe(value)
+    return best_of(run, calls)
+
+def bench_timed(calls):
+    from app.telemetry import timed
+
+    def score(value):
+        return value + 1
+    instrumented = timed("benchmark.score")(score)
+
+    def loop(function):
+        def run(count):
+            for value in range(count):
+                function(value)
+        return run
+    return compare(loop(score), loop(instrumented), calls)
+
+def bench_queries(queries):
+    """(bare, no-op listeners, instrumented) per statement: the first step is SQLAlchemy's event dispatch"""
+    from sqlalchemy import create_engine, event, text
+    from app.telemetry import RequestStats, current_request, instrument_queries
+
+    def run_on(engine):
+        def run(count):
+            with engine.connect() as connection:
+                for _ in range(count):
+                    connection.execute(text("select 1")).fetchall()
+        return run
+
+    bare, noop, instrumented = create_engine("sqlite://"), create_engine("sqlite://"), create_engine("sqlite://")
+    for name in ("before_cursor_execute", "after_cursor_execute"):
+        event.listen(noop, name, lambda *args: None)
+    instrument_queries(instrumented)
+    token = current_request.set(RequestStats())
+    try:
+        dispatch = compare(run_on(bare), run_on(noop), queries)
+        listeners = compare(run_on(noop), run_on(instrumented), queries)
+        return dispatch, listeners
+    finally:
+        current_request.reset(token)
+        for engine in (bare, noop, instrumented):
+            engine.dispose()
+
+def bench_middleware(requests):
+    from app.telemetry import Metrics, MetricsMiddleware
+
+    class Route:
+        path = "/users/{username}"
+
+    async def application(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def run_with(app):
+        def run(count):
+            async def requests_():
+                for _ in range(count):
+                    await app({"type": "http", "method": "GET", "path": "/users/alice"}, receive, send)
+            asyncio.run(requests_())
+        return run
+
+    return compare(run_with(application), run_with(MetricsMiddleware(application, Metrics())), requests)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print("%-28s %12s %14s %12s" % ("ns per call", "bare", "instrumented", "overhead"))
+    report("Histogram.observe", 0, bench_histogram(args.calls))
+    report("@timed function", *bench_timed(args.calls))
+    dispatch, listeners = bench_queries(args.queries)
+    report("SQL: cursor event dispatch", *dispatch)
+    report("SQL: timing listeners", *listeners)
+    report("ASGI request (middleware)", *bench_middleware(args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Load test showing connection pool saturation through /metrics/pool.
+
+Serves the app with a deliberately small pool (DB_POOL_SIZE / DB_MAX_OVERFLOW /
+DB_POOL_TIMEOUT) and raises the number of concurrent clients. After each level the
+pool telemetry is read back: once clients outnumber size + overflow, requests queue
+for a connection, the wait-time p99 climbs toward the pool timeout and checkouts
+start failing with timeouts.
+
+Usage: python -m benchmarks.bench_pool [--clients 5 20 50 200] [--pool-size 2] [--max-overflow 2] [--db-latency-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.bench_concurrency import drive, install_latency, populate, wait_for
+
+def create_app():
+    """uvicorn --factory entry point; the pool itself is configured by the DB_POOL_* variables"""
+    from app.database import async_engine
+    from app.main import app
+    install_latency(async_engine.sync_engine, float(os.environ.get("BENCH_DB_LATENCY_MS", "0")) / 1000)
+    return app
+
+def quantile(histogram, fraction):
+    """Upper bound of the bucket holding the given fraction of observations"""
+    target = fraction * histogram["count"]
+    for bound, count in histogram["buckets"].items():
+        if count >= target:
+            return bound
+    return "+Inf"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--clients", type=int, nargs="+", default=[5, 20, 50, 200])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=10.0, help="client timeout per request")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-overflow", type=int, default=2)
+    parser.add_argument("--pool-timeout", type=float, default=1.0)
+    parser.add_argument("--db", default="/tmp/bench_pool.db")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    import httpx
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+    tokens = populate(args.users)
+    env = dict(os.environ, BENCH_DB_LATENCY_MS=str(args.db_latency_ms), DB_POOL_SIZE=str(args.pool_size),
+               DB_MAX_OVERFLOW=str(args.max_overflow), DB_POOL_TIMEOUT=str(args.pool_timeout))
+
+    print("pool: size %d, overflow %d, timeout %.1fs" % (args.pool_size, args.max_overflow, args.pool_timeout))
+    print("%8s %9s %8s %6s %7s %9s %9s %9s %8s" % (
+        "clients", "ok req/s", "p50 ms", "errors", "peak", "overflow", "wait p50", "wait p99", "timeouts"))
+    for clients in args.clients:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.bench_pool:create_app",
+             "--port", str(args.port), "--log-level", "critical", "--backlog", "4096"],
+            env=env,
+        )
+        try:
+            wait_for(args.port, server)
+            rate, latencies, errors = asyncio.run(drive(args.port, tokens, clients, args.duration, args.timeout))
+            pool = httpx.get("http://127.0.0.1:%d/metrics/pool" % args.port, timeout=30).json()["async"]
+        finally:
+            server.kill()
+            server.wait()
+        ordered = sorted(latencies) or [float("nan")]
+        print("%8d %9.0f %8.1f %6d %7d %9d %9s %9s %8d" % (
+            clients, rate, statistics.median(ordered) * 1000, errors, pool["peak_checked_out"],
+            pool["overflow_connections"], quantile(pool["wait_seconds"], 0.5),
+            quantile(pool["wait_seconds"], 0.99), pool["timeouts"],
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the columnar profile store against ORM users.
+
+Builds the store from a generated population and reports its load time and
+memory per user. For comparison it measures the Python heap that ORM User
+instances of the same users take (tracemalloc), and the time to assemble one
+candidate pool (features, coordinates and ages) from each source.
+
+Usage: python -m benchmarks.bench_profile_store [--scale 10k|100k|1m] [--db /tmp/bench_profile_store.db]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+def best_of(runs, fn, *args):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def orm_bytes_per_user(db, sample):
+    """Heap allocated by loading `sample` full User instances, per user"""
+    from sqlalchemy import select
+    from app.models.user import User
+
+    db.expunge_all()
+    tracemalloc.start()
+    users = db.execute(select(User).limit(sample)).scalars().all()
+    for user in users:
+        user.interests, user.languages, user.personality_traits  # decoded JSON lists
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(users)
+    db.expunge_all()
+    return allocated / max(count, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "100k", "1m"], default="100k")
+    parser.add_argument("--db", default="/tmp/bench_profile_store.db")
+    parser.add_argument("--sample", type=int, default=20_000, help="ORM users measured for memory")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from benchmarks.population import SCALES, PopulationSpec, generate
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    generate(engine, PopulationSpec(SCALES[args.scale]))
+
+    from app.services import profile_store
+    from app.services.candidates import CandidateFilter
+    from app.services.feed import MatchFeedService
+
+    db = Session(engine)
+    started = time.perf_counter()
+    store = profile_store.ProfileStore.build(db)
+    report = profile_store.memory_report(store, time.perf_counter() - started)
+    print("profile store        %(users)d users in %(load_seconds).2fs, %(bytes_per_user).0f bytes/user" % report)
+    print("ORM users            %.0f bytes/user (sample of %d)" % (orm_bytes_per_user(db, args.sample), args.sample))
+
+    today = CandidateFilter.today()
+    orm = best_of(args.runs, lambda: (MatchFeedService._load_pool(db, "female", "male", today), db.expunge_all()))
+    columnar = best_of(args.runs, store.candidates, "female", "male", today)
+    size = len(store.candidates("female", "male", today)[0].ids)
+    print("candidate pool       %d users: ORM %.1f ms, store %.1f ms" % (size, orm * 1000, columnar * 1000))
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark User column loading at 500-profile pages.
+
+Compares, for the same page of 500 profiles:
+  every column     select(User) with every group undeferred (what list queries loaded before)
+  card             select(User): the default, non-deferred columns
+  card + detail    USER_CARDS, what schemas.User serializes
+  matching         MATCHING, what candidate pools, feed rebuilds and scoring read
+  projection       USER_CARD, the SQL projection behind the list endpoints
+reporting the bytes of the column values fetched per page (text and blobs by
+length, numbers and dates as 8 bytes) and the best time to load the page.
+
+Usage: python -m benchmarks.bench_projection [--scale 10k] [--rounds 20]
+"""
+import argparse
+import os
+import time
+
+PAGE = 500
+
+def best_of(rounds, fn):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 8
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "100k", "1m"], default="10k")
+    parser.add_argument("--db", default="/tmp/bench_projection.db")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session, undefer
+    from benchmarks.population import SCALES, PopulationSpec, generate
+    from app.models.loading import MATCHING, USER_CARDS, load_options
+    from app.models.user import User
+    from app.serialization import USER_CARD
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    generate(engine, PopulationSpec(SCALES[args.scale]))
+    db = Session(engine)
+    page = User.id.between(1001, 1000 + PAGE)
+
+    def fetched(statement):
+        # The SQL the ORM would emit, run on the raw connection to count what comes back
+        sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(sql).fetchall()
+        return len(rows), len(rows[0]), sum(value_bytes(value) for row in rows for value in row)
+
+    def entities(options):
+        statement = select(User).options(*options).where(page)
+
+        def load():
+            db.expunge_all()
+            return db.execute(statement).scalars().all()
+        return statement, load
+
+    paths = [
+        ("every column", *entities(load_options(User) + (undefer("*"),))),
+        ("card", *entities(load_options(User))),
+        ("card + detail", *entities(USER_CARDS)),
+        ("matching", *entities(MATCHING)),
+        ("projection", USER_CARD.select().where(page),
+         lambda: USER_CARD.dicts(db.execute(USER_CARD.select().where(page)))),
+    ]
+    print("%-14s %8s %12s %10s" % ("per %d users" % PAGE, "columns", "bytes", "latency"))
+    for label, statement, load in paths:
+        rows, columns, size = fetched(statement)
+        assert rows == PAGE and len(load()) == PAGE
+        print("%-14s %8d %12s %7.2f ms" % (label, columns, "{:,}".format(size), best_of(args.rounds, load) * 1000))
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark profile text search over a million bios.
+
+Generates --users profiles with bios, occupations and interests drawn from a
+Zipf-distributed vocabulary, inserted through the users table so the FTS5
+triggers index them. Compares, for single-word and two-word queries, the top
+20 results of:
+  like scan        every LIKE '%word%' match over the three columns, single words only
+  fts5             MATCH on profile_search ordered by bm25, as services.search runs it
+  memory           services.search.InvertedIndex (BM25) built from the same rows
+Eligibility filters are left out: they are the same for every method.
+
+Usage: python -m benchmarks.bench_search [--users 1000000] [--db /tmp/bench_search.db] [--no-like]
+"""
+import argparse
+import os
+import statistics
+import time
+import numpy as np
+
+OCCUPATIONS = ["nurse", "teacher", "engineer", "chef", "designer", "lawyer", "musician", "pilot", "barista", "doctor"]
+INTERESTS = ["hiking", "jazz", "travel", "cooking", "yoga", "photography", "reading", "climbing", "salsa", "gaming"]
+QUERIES = ["music", "travel", "sailing", "jazz hiking", "coffee books", "astronomy"]
+
+def vocabulary(size, rng):
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "an", "el", "or", "un", "is"]
+    words = {"music", "travel", "sailing", "coffee", "books", "astronomy", "dogs", "wine", "art", "running"}
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables, rng.integers(2, 5))))
+    return sorted(words)
+
+def make_rows(count, seed):
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary(5000, rng))
+    # Zipf-like word frequencies, with the named words spread over the ranks
+    ranks = np.arange(1, len(words) + 1)
+    weights = 1 / ranks ** 1.07
+    rng.shuffle(weights)
+    weights /= weights.sum()
+    lengths = rng.integers(0, 40, count)
+    picks = rng.choice(len(words), int(lengths.sum()), p=weights)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    for index in range(count):
+        bio = " ".join(words[picks[offsets[index]:offsets[index + 1]]]) or None
+        interests = list(rng.choice(INTERESTS, rng.integers(0, 4), replace=False))
+        yield {
+            "id": index + 1, "username": "user%d" % (index + 1), "bio": bio,
+            "occupation": OCCUPATIONS[rng.integers(len(OCCUPATIONS))] if rng.random() < 0.8 else None,
+            "interests": interests, "is_active": True,
+        }
+
+def timed(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/bench_search.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-like", action="store_true", help="skip the LIKE scan baseline")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine, insert, text
+    from sqlalchemy.orm import Session
+    from app.database import Base
+    from app.models.search import FTS_COLUMNS, FTS_TABLE
+    from app.models.user import User
+    from app.services.search import WEIGHTS, InvertedIndex, terms
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    Base.metadata.create_all(bind=engine)
+    users = User.__table__
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        batch = []
+        for row in make_rows(args.users, args.seed):
+            batch.append(row)
+            if len(batch) == 20000:
+                connection.execute(insert(users), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(users), batch)
+    print("inserted %d users with FTS5 triggers in %.1fs" % (args.users, time.perf_counter() - started))
+
+    db = Session(engine)
+    started = time.perf_counter()
+    index = InvertedIndex.build(db)
+    print("built InvertedIndex of %d users in %.1fs" % (len(index), time.perf_counter() - started))
+    weights = ", ".join(str(WEIGHTS[field]) for field in FTS_COLUMNS)
+    fts_sql = text("SELECT rowid FROM %s WHERE %s MATCH :query ORDER BY bm25(%s, %s), rowid LIMIT 20"
+                   % (FTS_TABLE, FTS_TABLE, FTS_TABLE, weights))
+    # Every match, since ranking them needs all of them; LIMIT 20 would stop early on common words
+    like_sql = text("SELECT id FROM users WHERE bio LIKE :pattern OR occupation LIKE :pattern OR interests LIKE :pattern")
+
+    print("%-16s %8s %12s %12s %12s" % ("query", "matches", "like ms", "fts5 ms", "memory ms"))
+    for query in QUERIES:
+        words = terms(query)
+        fts_query = " ".join('"%s"' % word for word in words)
+        matches = db.execute(text("SELECT count(*) FROM %s WHERE %s MATCH :query" % (FTS_TABLE, FTS_TABLE)),
+                             {"query": fts_query}).scalar()
+        fts_ms, _ = timed(lambda: db.execute(fts_sql, {"query": fts_query}).all(), args.repeat)
+        memory_ms, _ = timed(lambda: index.search(words)[:20], args.repeat)
+        like_ms = float("nan")
+        if not args.no_like and len(words) == 1:
+            like_ms, _ = timed(lambda: db.execute(like_sql, {"pattern": "%" + words[0] + "%"}).all(), 1)
+        print("%-16s %8d %12.2f %12.2f %12.2f" % (query, matches, like_ms * 1000, fts_ms * 1000, memory_ms * 1000))
+    print("database with FTS5 index: %.1f MB" % (os.path.getsize(args.db) / 1e6))
+    db.close()
+
+if __name__ == "__main__":
+    main()
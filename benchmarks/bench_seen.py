@@ -0,0 +1,82 @@
+"""
+Benchmark per-user seen-sets: memory, false-positive rate and lookup cost at 10k swipes.
+
+For each target rate, one user swipes --swipes candidates. The report gives the
+serialized filter size (what the seen_filters row and the cache entry hold), the
+false-positive rate measured over unseen ids, and the cost of checking a deck of
+--deck candidates. The same deck is then filtered in SQL with an anti-join against
+the user's likes, which is what the filter replaces.
+
+Usage: python -m benchmarks.bench_seen [--swipes 10000] [--deck 5000] [--probes 1000000]
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+def best_of(function, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def anti_join(args, seen_ids, deck):
+    from datetime import date
+    from sqlalchemy import create_engine, insert, select
+    from app.database import Base
+    from app.models.user import Like, User
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    Base.metadata.create_all(bind=engine)
+    ids = sorted(set(seen_ids.tolist()) | set(deck.tolist()) | {0})
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"id": user_id, "username": "user%d" % user_id} for user_id in ids])
+        connection.execute(insert(Like), [
+            {"liker_id": 0, "liked_id": liked_id, "timestamp": date(2024, 1, 1)} for liked_id in seen_ids.tolist()
+        ])
+    query = select(User.id).where(
+        User.id.in_(deck.tolist()),
+        ~select(Like.id).where(Like.liker_id == 0, Like.liked_id == User.id).exists(),
+    )
+    with engine.connect() as connection:
+        elapsed = best_of(lambda: connection.execute(query).fetchall())
+    engine.dispose()
+    return elapsed
+
+def main():
+    from app.services.seen import ScalableBloomFilter
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--swipes", type=int, default=10_000)
+    parser.add_argument("--deck", type=int, default=5000)
+    parser.add_argument("--probes", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/bench_seen.db")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    # Even ids were swiped on, odd ids never were
+    seen_ids = rng.choice(10**8, args.swipes, replace=False) * 2
+    probes = rng.choice(10**8, args.probes, replace=False) * 2 + 1
+    deck = np.concatenate([seen_ids[:args.deck // 2], probes[:args.deck - args.deck // 2]])
+
+    print("%d swipes per user, deck of %d candidates" % (args.swipes, args.deck))
+    print("%-8s %7s %10s %12s %10s %14s" % ("target", "stages", "bytes", "bytes/swipe", "measured", "deck check"))
+    for error_rate in (0.01, 0.001, 0.0001):
+        bloom = ScalableBloomFilter(error_rate=error_rate)
+        bloom.add(seen_ids)
+        assert bloom.contains(seen_ids).all()
+        measured = bloom.contains(probes).mean()
+        size = len(bloom.to_bytes())
+        elapsed = best_of(lambda: bloom.contains(deck))
+        print("%-8g %7d %10d %12.2f %10.5f %11.0f us (%.0f ns/candidate)" % (
+            error_rate, len(bloom.stages), size, size / args.swipes, measured, elapsed * 1e6, elapsed * 1e9 / len(deck)))
+
+    elapsed = anti_join(args, seen_ids, deck)
+    print("SQL anti-join over likes: %.0f us (%.0f ns/candidate)" % (elapsed * 1e6, elapsed * 1e9 / len(deck)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark list-endpoint serialization per 1,000 users.
+
+Compares, for the same 1,000 profiles:
+  fastapi default   ORM users -> response_model validation -> jsonable_encoder -> json.dumps
+  pydantic json     ORM users -> response_model validation -> pydantic dump_json
+  projection        SQL tuples -> Projection dicts -> orjson (the current list endpoints)
+once for encoding alone (rows already loaded) and once including the query.
+
+Usage: python -m benchmarks.bench_serialization [--scale 10k] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import time
+
+def best_of(rounds, fn):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=["10k", "100k", "1m"], default="10k")
+    parser.add_argument("--db", default="/tmp/bench_serialization.db")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from benchmarks.population import SCALES, PopulationSpec, generate
+    from app import schemas
+    from app.models.loading import USER_CARDS
+    from app.models.user import User
+    from app.serialization import USER_CARD, dumps
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    generate(engine, PopulationSpec(SCALES[args.scale]))
+    adapter = TypeAdapter(List[schemas.User])
+    db = Session(engine)
+
+    def load_users():
+        db.expunge_all()
+        return db.execute(select(User).options(*USER_CARDS).where(User.id <= 1000)).scalars().all()
+
+    def load_rows():
+        return USER_CARD.dicts(db.execute(USER_CARD.select().where(User.id <= 1000)))
+
+    def fastapi_default(users):
+        return json.dumps(jsonable_encoder(adapter.validate_python(users)), ensure_ascii=False,
+                          allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+    def pydantic_json(users):
+        return adapter.dump_json(adapter.validate_python(users))
+
+    users, rows = load_users(), load_rows()
+    assert json.loads(fastapi_default(users)) == json.loads(dumps(rows))
+    paths = [
+        ("fastapi default", lambda: fastapi_default(users), lambda: fastapi_default(load_users())),
+        ("pydantic json", lambda: pydantic_json(users), lambda: pydantic_json(load_users())),
+        ("projection", lambda: dumps(rows), lambda: dumps(load_rows())),
+    ]
+    print("%-16s %14s %18s" % ("per 1,000 users", "encoding", "query + encoding"))
+    for label, encode, end_to_end in paths:
+        print("%-16s %11.2f ms %15.2f ms" % (label, best_of(args.rounds, encode) * 1000,
+                                             best_of(args.rounds, end_to_end) * 1000))
+    db.close()
+
+if __name__ == "__main__":
+    main()
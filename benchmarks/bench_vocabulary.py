@@ -0,0 +1,87 @@
+"""
+Benchmark interned interest/language bitsets against the JSON string lists.
+
+Reports the memory a cached profile spends on its interests and languages, the
+cost of the scalar set intersection, and the time to build ProfileFeatures
+from strings versus from the stored bitsets.
+
+Usage: python -m benchmarks.bench_vocabulary [--users 100000]
+"""
+import argparse
+import random
+import sys
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+def deep_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--pairs", type=int, default=200_000)
+    args = parser.parse_args()
+
+    from app.database import Base
+    from app.models.user import User
+    from app.services.features import ProfileFeatures
+    from app.services.vocabulary import INTEREST, LANGUAGE, VocabularyService, to_bytes
+
+    rng = random.Random(42)
+    interests = ["interest-%d" % i for i in range(300)]
+    languages = ["english", "spanish", "french", "german", "mandarin", "hindi", "arabic", "portuguese"]
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = Session(engine)
+    with engine.begin() as connection:
+        interest_bits = VocabularyService.intern(connection, INTEREST, interests)
+        language_bits = VocabularyService.intern(connection, LANGUAGE, languages)
+    feature_vocabularies = VocabularyService.feature_vocabularies(db)
+
+    users = []
+    for index in range(args.users):
+        # Strings are rebuilt per user, as they are when rows are loaded from the database
+        user = User(
+            id=index + 1,
+            interests=[str(term) for term in rng.sample(interests, rng.randint(1, 10))],
+            languages=[str(term) for term in rng.sample(languages, rng.randint(1, 3))],
+        )
+        user.interest_bits = to_bytes(interest_bits[term] for term in user.interests)
+        user.language_bits = to_bytes(language_bits[term] for term in user.languages)
+        users.append(user)
+
+    strings = sum(deep_size(u.interests) + deep_size(u.languages) for u in users) / len(users)
+    bitsets = sum(deep_size(u.interest_bits) + deep_size(u.language_bits) for u in users) / len(users)
+    print("per profile: string lists %.0f B, bitsets %.0f B (%.1fx smaller)" % (strings, bitsets, strings / bitsets))
+
+    pairs = [(rng.choice(users), rng.choice(users)) for _ in range(args.pairs)]
+    start = time.perf_counter()
+    for left, right in pairs:
+        len(set(left.interests) & set(right.interests))
+        bool(set(left.languages) & set(right.languages))
+    string_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for left, right in pairs:
+        (int.from_bytes(left.interest_bits, "little") & int.from_bytes(right.interest_bits, "little")).bit_count()
+        bool(int.from_bytes(left.language_bits, "little") & int.from_bytes(right.language_bits, "little"))
+    bitset_time = time.perf_counter() - start
+    print("scalar intersection: strings %.0f ns/pair, bitsets %.0f ns/pair" % (
+        string_time / args.pairs * 1e9, bitset_time / args.pairs * 1e9))
+
+    start = time.perf_counter()
+    ProfileFeatures.from_users(users)
+    string_build = time.perf_counter() - start
+    start = time.perf_counter()
+    ProfileFeatures.from_users(users, feature_vocabularies)
+    bitset_build = time.perf_counter() - start
+    print("ProfileFeatures for %d users: from strings %.2fs, from bitsets %.2fs" % (
+        len(users), string_build, bitset_build))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark real-time delivery over /ws with many concurrent sockets on one worker.
+
+Opens one socket per user (10k by default), then has a few senders POST messages to
+their matched partner. Every push carries the send time in its content, so the
+receiving socket measures end-to-end delivery latency. Also reports the worker's
+resident memory with all sockets open.
+
+Needs `ulimit -n` above the socket count, for both this process and the server.
+
+Usage: python -m benchmarks.bench_websockets [--sockets 10000] [--senders 50] [--duration 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_concurrency import populate, wait_for
+
+def resident_mb(pid):
+    with open("/proc/%d/status" % pid) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+def match_pairs(count):
+    """Mutual likes between users 2k and 2k+1, so each may message the other"""
+    from datetime import date
+    from sqlalchemy import insert
+    from app.database import engine
+    from app.models.user import Like, Match
+
+    pairs = [(liker, liked) for first in range(1, count, 2) for liker, liked in ((first, first + 1), (first + 1, first))]
+    with engine.begin() as connection:
+        connection.execute(insert(Like), [
+            {"liker_id": liker, "liked_id": liked, "timestamp": date(2024, 1, 1)} for liker, liked in pairs
+        ])
+        connection.execute(insert(Match), [{"user_id": liker, "matched_user_id": liked} for liker, liked in pairs])
+
+async def run(port, tokens, sockets, senders, duration):
+    import httpx
+    import websockets
+
+    latencies = []
+    connected = 0
+
+    async def listen(index, ready):
+        nonlocal connected
+        url = "ws://127.0.0.1:%d/ws?token=%s" % (port, tokens[index])
+        async with websockets.connect(url, open_timeout=60, ping_interval=None) as socket:
+            connected += 1
+            ready.set_result(None)
+            async for raw in socket:
+                sent = float(raw.split('"content":"', 1)[1].split('"', 1)[0])
+                latencies.append(time.time() - sent)
+
+    opened = time.perf_counter()
+    listeners, readies = [], []
+    for index in range(sockets):
+        ready = asyncio.get_running_loop().create_future()
+        readies.append(ready)
+        listeners.append(asyncio.create_task(listen(index, ready)))
+        if index % 500 == 499:
+            await asyncio.gather(*readies[-500:])
+    await asyncio.gather(*readies)
+    open_time = time.perf_counter() - opened
+
+    sent = 0
+    async with httpx.AsyncClient(base_url="http://127.0.0.1:%d" % port, timeout=30) as http:
+        async def sender(index):
+            nonlocal sent
+            # User index + 1 sends to its partner, which holds one of the open sockets
+            partner = index + 1 if index % 2 == 0 else index - 1
+            headers = {"Authorization": "Bearer " + tokens[index]}
+            while time.perf_counter() < deadline:
+                response = await http.post("/messages/user%d" % partner, json={"content": repr(time.time())}, headers=headers)
+                if response.status_code == 201:
+                    sent += 1
+
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(sender(index) for index in range(senders)))
+    await asyncio.sleep(1)
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    return connected, open_time, sent, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=10_000)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--db", default="/tmp/bench_websockets.db")
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = "sqlite:///" + args.db
+    tokens = populate(args.sockets)
+    match_pairs(args.sockets)
+
+    server = subprocess.Popen(
+        # Per-message deflate keeps zlib state per socket, nearly tripling memory for short JSON pushes
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--ws", "websockets",
+         "--ws-per-message-deflate", "false", "--log-level", "critical", "--backlog", "4096"],
+    )
+    try:
+        wait_for(args.port, server)
+        idle = resident_mb(server.pid)
+        connected, open_time, sent, latencies = asyncio.run(run(args.port, tokens, args.sockets, args.senders, args.duration))
+        loaded = resident_mb(server.pid)
+    finally:
+        server.kill()
+        server.wait()
+
+    ordered = sorted(latencies) or [float("nan")]
+    print("sockets open: %d in %.1fs" % (connected, open_time))
+    print("worker RSS: %.0f MB idle, %.0f MB with sockets (%.1f KB per socket)" % (
+        idle, loaded, (loaded - idle) * 1024 / max(connected, 1)))
+    print("messages: %d sent (%.0f/s), %d pushed" % (sent, sent / args.duration, len(latencies)))
+    print("delivery latency: p50 %.1f ms, p99 %.1f ms" % (
+        statistics.median(ordered) * 1000, ordered[int(0.99 * (len(ordered) - 1))] * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Seeded generator of realistic populations for the benchmarks.
+
+Bulk-loads users, likes, matches, messages and compatibility reports with the
+skew of a real dating app: users cluster around a few cities, a minority of
+profiles attracts most likes, interests follow a long tail, only some likes are
+returned, and conversations happen between matched users only. The same seed
+always yields the same rows, so runs against separately generated databases are
+comparable.
+
+Scales are user counts; the other tables grow with them (about 4 likes per
+user at the defaults, and 10M+ rows in total at 1m).
+
+Usage: python -m benchmarks.population [--scale 10k|100k|1m] [--db /tmp/bench_population.db] [--seed 42]
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Every generated user logs in with this password
+PASSWORD = "benchmark"
+
+# Rows per INSERT statement
+BATCH_SIZE = 10_000
+
+# Ages and like dates are relative to this day, not to today, so runs are repeatable
+REFERENCE_DATE = date(2026, 1, 1)
+
+# (name, latitude, longitude, share of users)
+CITIES = [
+    ("New York", 40.71, -74.01, 0.22), ("Los Angeles", 34.05, -118.24, 0.15), ("Chicago", 41.88, -87.63, 0.10),
+    ("Houston", 29.76, -95.37, 0.08), ("Miami", 25.76, -80.19, 0.07), ("Seattle", 47.61, -122.33, 0.07),
+    ("Boston", 42.36, -71.06, 0.07), ("Austin", 30.27, -97.74, 0.06), ("Denver", 39.74, -104.99, 0.06),
+    ("Madrid", 40.42, -3.70, 0.05), ("Paris", 48.86, 2.35, 0.04), ("Berlin", 52.52, 13.40, 0.03),
+]
+CITY_LANGUAGES = {"Madrid": "spanish", "Paris": "french", "Berlin": "german"}
+SECOND_LANGUAGES = ["english", "spanish", "french", "german", "mandarin", "portuguese", "italian"]
+INTERESTS = [
+    "travel", "music", "movies", "hiking", "cooking", "reading", "fitness", "photography", "coffee", "yoga",
+    "art", "dancing", "gaming", "running", "wine", "dogs", "cats", "festivals", "camping", "cycling",
+    "fashion", "technology", "theatre", "podcasts", "surfing", "skiing", "climbing", "volunteering", "baking",
+    "gardening", "board games", "anime", "poetry", "karaoke", "meditation", "museums", "football", "basketball",
+    "tennis", "swimming",
+] + ["niche-interest-%d" % index for index in range(160)]
+TRAITS = ["introvert", "extrovert", "adventurous", "cautious", "spontaneous",
+          "planned", "analytical", "creative", "traditional", "modern"]
+ZODIAC = ["capricorn", "aquarius", "pisces", "aries", "taurus", "gemini",
+          "cancer", "leo", "virgo", "libra", "scorpio", "sagittarius"]
+OCCUPATIONS = ["engineer", "teacher", "nurse", "designer", "student", "lawyer", "chef",
+               "marketing", "sales", "doctor", "artist", "accountant", None]
+PHRASES = ["hey!", "how was your weekend?", "haha that's great", "want to grab coffee sometime?",
+           "I love that place", "what are you up to tonight?", "sounds good", "see you there",
+           "that trail looks amazing", "no way, me too"]
+
+@dataclass
+class PopulationSpec:
+    """Shape of a generated population; every rate is an average"""
+    users: int
+    likes_per_user: float = 4.0
+    like_back_rate: float = 0.15
+    messages_per_match: float = 6.0
+    active_rate: float = 0.95
+    seed: int = 42
+
+@dataclass
+class Population:
+    """What was generated: row counts and load seconds per table"""
+    spec: PopulationSpec
+    rows: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+def username(user_id: int) -> str:
+    return "user%d" % user_id
+
+def _insert(engine, model, rows: Iterable[dict]) -> int:
+    """Insert rows in BATCH_SIZE statements, without materializing them all; returns the count"""
+    from sqlalchemy import insert
+
+    count = 0
+    rows = iter(rows)
+    with engine.begin() as connection:
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                return count
+            connection.execute(insert(model), batch)
+            count += len(batch)
+
+class _Profiles:
+    """Column-wise user attributes; rows are only materialized in insert-sized batches"""
+
+    def __init__(self, spec: PopulationSpec, rng: np.random.Generator):
+        count = spec.users
+        self.count = count
+        self.ids = np.arange(1, count + 1)
+
+        self.gender = rng.choice(3, count, p=[0.48, 0.48, 0.04])  # female, male, non-binary
+        same_sex = rng.random(count) < 0.1
+        self.looking_for = np.where(self.gender == 2, rng.choice(3, count),
+                                    np.where(same_sex, self.gender, 1 - self.gender))
+        self.active = rng.random(count) < spec.active_rate
+        # Attractiveness skews who receives likes; activity skews who sends them
+        self.popularity = rng.lognormal(0.0, 1.0, count)
+        self.activity = rng.lognormal(0.0, 0.8, count)
+
+        self.age = np.clip(18 + rng.gamma(2.2, 5.5, count), 18, 70).astype(int)
+        self.birth_offset = rng.integers(0, 365, count)
+        shares = np.array([city[3] for city in CITIES])
+        self.city = np.where(rng.random(count) < 0.1, -1, rng.choice(len(CITIES), count, p=shares / shares.sum()))
+        self.latitude = np.array([CITIES[c][1] if c >= 0 else np.nan for c in self.city]) + rng.normal(0, 0.15, count)
+        self.longitude = np.array([CITIES[c][2] if c >= 0 else np.nan for c in self.city]) + rng.normal(0, 0.15, count)
+        self.max_distance = rng.choice([0, 25, 50, 100, 200], count, p=[0.3, 0.2, 0.25, 0.15, 0.1])
+        self.height = np.where(self.gender == 1, rng.normal(178, 7, count), rng.normal(165, 7, count)).astype(int)
+
+        # Interests: a Zipf-weighted draw without replacement (Gumbel top-k), 0 to 12 per user
+        weights = np.log(1.0 / np.arange(1, len(INTERESTS) + 1) ** 1.1)
+        counts = np.clip(rng.poisson(5, count), 0, 12)
+        self.interests: List[List[str]] = []
+        for start in range(0, count, BATCH_SIZE):
+            size = min(BATCH_SIZE, count - start)
+            keys = weights + rng.gumbel(size=(size, len(INTERESTS)))
+            top = np.argsort(-keys, axis=1)[:, :12]
+            self.interests.extend([INTERESTS[term] for term in row[:k]] for row, k in zip(top, counts[start:start + size]))
+        self.traits = [[TRAITS[t] for t in rng.choice(len(TRAITS), k, replace=False)] for k in rng.integers(0, 4, count)]
+        second = rng.choice(len(SECOND_LANGUAGES), count)
+        bilingual = rng.random(count) < 0.35
+        self.languages = []
+        for index in range(count):
+            city = self.city[index]
+            languages = [CITY_LANGUAGES.get(CITIES[city][0], "english") if city >= 0 else "english"]
+            if bilingual[index] and SECOND_LANGUAGES[second[index]] not in languages:
+                languages.append(SECOND_LANGUAGES[second[index]])
+            self.languages.append(languages)
+        self.goals = rng.choice(4, count, p=[0.3, 0.4, 0.1, 0.2])
+        self.smoking = rng.choice(4, count, p=[0.65, 0.15, 0.1, 0.1])
+        self.drinking = rng.choice(4, count, p=[0.2, 0.5, 0.2, 0.1])
+        self.education = rng.choice(5, count, p=[0.15, 0.4, 0.2, 0.05, 0.2])
+        self.children = rng.choice(3, count, p=[0.4, 0.3, 0.3])
+        self.has_children = rng.random(count) < 0.2
+        self.occupation = rng.choice(len(OCCUPATIONS), count)
+        self.has_bio = rng.random(count) < 0.7
+        self.last_active = rng.integers(0, 60, count)
+
+    def scored(self, index: int) -> dict:
+        """The fields CompatibilityService reads"""
+        from app.models.user import SCORED_FIELDS
+
+        row = self.row(index, None, None, None)
+        return {key: row[key] for key in SCORED_FIELDS}
+
+    def row(self, index: int, hashed_password, interest_bits, language_bits) -> dict:
+        from app.models.user import geo_cell
+
+        user_id = int(self.ids[index])
+        birthday = REFERENCE_DATE - timedelta(days=int(self.age[index]) * 365 + int(self.birth_offset[index]))
+        located = self.city[index] >= 0
+        latitude = float(self.latitude[index]) if located else None
+        longitude = float(self.longitude[index]) if located else None
+        age = int(self.age[index])
+        return {
+            "id": user_id,
+            "email": "%s@example.com" % username(user_id),
+            "username": username(user_id),
+            "hashed_password": hashed_password,
+            "first_name": "User",
+            "last_name": str(user_id),
+            "date_of_birth": birthday,
+            "gender": ("female", "male", "non-binary")[self.gender[index]],
+            "looking_for": ("female", "male", "non-binary")[self.looking_for[index]],
+            "bio": "Into %s." % ", ".join(self.interests[index][:3]) if self.has_bio[index] and self.interests[index] else None,
+            "interests": self.interests[index],
+            "interest_bits": interest_bits,
+            "personality_traits": self.traits[index],
+            "location": CITIES[self.city[index]][0] if located else None,
+            "latitude": latitude,
+            "longitude": longitude,
+            "geo_cell": geo_cell(latitude, longitude),
+            "profile_picture": "https://example.com/photos/%d.jpg" % user_id,
+            "min_age_preference": max(18, age - 8),
+            "max_age_preference": min(100, age + 8),
+            "max_distance": int(self.max_distance[index]) or None,
+            "relationship_goals": ("casual", "serious", "friendship", None)[self.goals[index]],
+            "languages": self.languages[index],
+            "language_bits": language_bits,
+            "height": int(self.height[index]),
+            "zodiac_sign": ZODIAC[birthday.month - 1],
+            "education": ("high school", "bachelor", "master", "phd", None)[self.education[index]],
+            "occupation": OCCUPATIONS[self.occupation[index]],
+            "smoking": ("never", "sometimes", "regularly", None)[self.smoking[index]],
+            "drinking": ("never", "sometimes", "regularly", None)[self.drinking[index]],
+            "has_children": bool(self.has_children[index]),
+            "wants_children": (True, False, None)[self.children[index]],
+            "is_active": bool(self.active[index]),
+            "last_active": REFERENCE_DATE - timedelta(days=int(self.last_active[index])),
+            "profile_revision": 1,
+        }
+
+def _likes(spec: PopulationSpec, profiles: _Profiles, rng: np.random.Generator):
+    """(liker ids, liked ids, days before REFERENCE_DATE), each pair once"""
+    sent = rng.poisson(spec.likes_per_user * profiles.activity / profiles.activity.mean())
+    sent[~profiles.active] = 0
+    # Likes stay within the city and the reciprocal gender/looking_for group
+    groups: Dict[tuple, np.ndarray] = {}
+    keys = list(zip(profiles.city.tolist(), profiles.gender.tolist(), profiles.looking_for.tolist()))
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    groups = {key: np.array(members) for key, members in groups.items()}
+
+    likers, liked = [], []
+    for (city, gender, looking_for), members in groups.items():
+        targets = groups.get((city, looking_for, gender))
+        if targets is None:
+            continue
+        targets = targets[profiles.active[targets]]
+        counts = np.minimum(sent[members], len(targets))
+        if not len(targets) or not counts.sum():
+            continue
+        # Popularity-weighted draws, vectorized over the whole group
+        cumulative = np.cumsum(profiles.popularity[targets])
+        draws = np.searchsorted(cumulative, rng.random(counts.sum()) * cumulative[-1])
+        likers.append(np.repeat(members, counts))
+        liked.append(targets[np.minimum(draws, len(targets) - 1)])
+    likers = profiles.ids[np.concatenate(likers)]
+    liked = profiles.ids[np.concatenate(liked)]
+
+    # Some likes are returned, which is where matches come from
+    back = rng.random(len(likers)) < spec.like_back_rate
+    likers, liked = np.concatenate([likers, liked[back]]), np.concatenate([liked, likers[back]])
+    keep = likers != liked
+    key = np.unique(likers[keep].astype(np.int64) * (spec.users + 1) + liked[keep])
+    likers, liked = key // (spec.users + 1), key % (spec.users + 1)
+    days = rng.integers(1, 180, len(likers))
+    return likers, liked, days
+
+def generate(engine, spec: PopulationSpec) -> Population:
+    """Create the schema and load a population into an empty database"""
+    from app.database import Base
+    from app.models.user import CompatibilityReport, Like, Match, Message, User
+    from app.services.compatibility import CompatibilityService
+    from app.services.passwords import pwd_context
+    from app.services.vocabulary import INTEREST, LANGUAGE, VocabularyService, to_bytes
+
+    rng = np.random.default_rng(spec.seed)
+    population = Population(spec)
+    Base.metadata.create_all(bind=engine)
+
+    def load(table, rows):
+        started = time.perf_counter()
+        population.rows[table] = _insert(engine, models[table], rows)
+        population.seconds[table] = time.perf_counter() - started
+
+    models = {"users": User, "likes": Like, "matches": Match, "messages": Message,
+              "compatibility_reports": CompatibilityReport}
+
+    profiles = _Profiles(spec, rng)
+    hashed_password = pwd_context.hash(PASSWORD)
+    # Terms are interned up front, so the stored bitsets match what the app would write
+    with engine.begin() as connection:
+        interest_ids = VocabularyService.intern(connection, INTEREST, INTERESTS)
+        language_ids = VocabularyService.intern(connection, LANGUAGE, SECOND_LANGUAGES)
+    load("users", (
+        profiles.row(index, hashed_password, to_bytes(interest_ids[term] for term in profiles.interests[index]),
+                     to_bytes(language_ids[term] for term in profiles.languages[index]))
+        for index in range(spec.users)
+    ))
+
+    likers, liked, days = _likes(spec, profiles, rng)
+    load("likes", (
+        {"liker_id": a, "liked_id": b, "timestamp": REFERENCE_DATE - timedelta(days=d)}
+        for a, b, d in zip(likers.tolist(), liked.tolist(), days.tolist())
+    ))
+
+    # A pair matched when both liked each other, on the day of the later like.
+    # Pair keys come out of np.unique sorted, so the reverse likes are found by bisection.
+    modulus = spec.users + 1
+    keys = likers * modulus + liked
+    reverse = liked * modulus + likers
+    mutual = np.isin(reverse, keys) & (likers < liked)
+    first, second = likers[mutual], liked[mutual]
+    matched_days = np.minimum(days[mutual], days[np.searchsorted(keys, reverse[mutual])])
+    midnight = datetime.combine(REFERENCE_DATE, datetime.min.time(), timezone.utc)
+    matched_at = [midnight - timedelta(days=day) for day in matched_days.tolist()]
+    load("matches", (
+        {"user_id": user_id, "matched_user_id": other_id, "created_at": created_at}
+        for a, b, created_at in zip(first.tolist(), second.tolist(), matched_at)
+        for user_id, other_id in ((a, b), (b, a))
+    ))
+
+    # Conversations: a geometric number of messages per match, about an hour apart,
+    # inserted in time order so message ids grow with timestamps as in production
+    counts = rng.geometric(1.0 / (spec.messages_per_match + 1), len(first)) - 1
+    pair = np.repeat(np.arange(len(first)), counts)
+    gaps = rng.exponential(3600.0, len(pair))
+    offsets = np.cumsum(gaps)
+    talking = counts > 0
+    starts = (np.cumsum(counts) - counts)[talking]
+    offsets -= np.repeat((offsets - gaps)[starts], counts[talking])
+    sent_at = np.array([moment.timestamp() for moment in matched_at])[pair] + offsets
+    from_first = rng.random(len(pair)) < 0.5
+    senders = np.where(from_first, first[pair], second[pair])
+    receivers = np.where(from_first, second[pair], first[pair])
+    phrases = rng.integers(0, len(PHRASES), len(pair))
+    read_before = midnight.timestamp() - 86400
+    order = np.argsort(sent_at, kind="stable")
+    load("messages", (
+        {
+            "content": PHRASES[phrases[row]],
+            "sender_id": int(senders[row]),
+            "receiver_id": int(receivers[row]),
+            "timestamp": datetime.fromtimestamp(sent_at[row], timezone.utc),
+            "is_read": bool(sent_at[row] < read_before),
+        }
+        for row in order.tolist()
+    ))
+
+    # The like endpoint scores a pair when it matches: one report per match
+    def reports():
+        for a, b, created_at in zip(first.tolist(), second.tolist(), matched_at):
+            user, target = User(**profiles.scored(a - 1)), User(**profiles.scored(b - 1))
+            score, common, personality, issues = CompatibilityService.calculate_compatibility(user, target)
+            yield {
+                "user_id": a, "target_id": b, "compatibility_score": score, "common_interests": common,
+                "personality_match": personality, "potential_issues": issues, "timestamp": created_at.date(),
+                "user_revision": 1, "target_revision": 1,
+            }
+    load("compatibility_reports", reports())
+    return population
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--db", default="/tmp/bench_population.db")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine("sqlite:///" + args.db)
+    population = generate(engine, PopulationSpec(SCALES[args.scale], seed=args.seed))
+    for table, rows in population.rows.items():
+        print("%-22s %10d rows %8.1fs" % (table, rows, population.seconds[table]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Scenario runner: simulated users driving the ASGI app in-process.
+
+Each virtual user logs in as a generated user (see benchmarks.population) and
+repeatedly picks a weighted action: browsing the match feed, liking or passing
+on what it saw, reading and sending messages to its matches, editing its
+profile. Requests go through httpx's ASGI transport, so routing, dependencies,
+validation and serialization are all measured without a socket in between.
+Latencies are recorded per route template, e.g. "GET /messages/{username}".
+"""
+import asyncio
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Action weights per scenario; "mixed" approximates the traffic of a dating app
+SCENARIOS: Dict[str, Dict[str, float]] = {
+    "mixed": {
+        "browse": 25, "like": 15, "pass": 15, "me": 10, "matches": 5,
+        "conversation": 12, "send": 10, "inbox": 2, "profile": 5, "login": 1,
+    },
+    "swipe": {"browse": 30, "like": 35, "pass": 35},
+    "chat": {"matches": 10, "conversation": 50, "send": 40},
+}
+
+class Recorder:
+    """Latency samples and error counts per endpoint label"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, label: str, seconds: float, ok: bool) -> None:
+        self.samples.setdefault(label, [])
+        self.errors.setdefault(label, 0)
+        if ok:
+            self.samples[label].append(seconds)
+        else:
+            self.errors[label] += 1
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(samples: Sequence[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (in ms) of one endpoint over a run of `elapsed` seconds"""
+    ordered = sorted(samples)
+    summary = {"requests": len(ordered), "errors": errors, "throughput_rps": round(len(ordered) / elapsed, 2)}
+    if ordered:
+        summary.update({
+            "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        })
+    return summary
+
+class VirtualUser:
+    """One simulated client: a generated user, its token, and what it has seen so far"""
+
+    def __init__(self, user_id: int, token: str, rng: random.Random, user_count: int):
+        self.user_id = user_id
+        self.headers = {"Authorization": "Bearer " + token}
+        self.rng = rng
+        self.user_count = user_count
+        self.candidates: List[str] = []
+        self.partners: List[str] = []
+
+    def stranger(self) -> str:
+        other = self.rng.randint(1, self.user_count - 1)
+        return "user%d" % (other + (other >= self.user_id))
+
+    def candidate(self) -> str:
+        return self.candidates.pop() if self.candidates else self.stranger()
+
+async def _browse(user, http):
+    response = await http.get("/matches", params={"limit": 20}, headers=user.headers)
+    if response.status_code == 200:
+        user.candidates = [candidate["username"] for candidate in reversed(response.json())]
+    return "GET /matches", response
+
+async def _like(user, http):
+    return "POST /users/like/{username}", await http.post("/users/like/" + user.candidate(), headers=user.headers)
+
+async def _pass(user, http):
+    return "POST /users/pass/{username}", await http.post("/users/pass/" + user.candidate(), headers=user.headers)
+
+async def _me(user, http):
+    return "GET /users/me", await http.get("/users/me", headers=user.headers)
+
+async def _matches(user, http):
+    response = await http.get("/users/me/matches", params={"limit": 100}, headers=user.headers)
+    if response.status_code == 200:
+        user.partners = [partner["username"] for partner in response.json()]
+    return "GET /users/me/matches", response
+
+async def _conversation(user, http):
+    if not user.partners:
+        return await _matches(user, http)
+    partner = user.rng.choice(user.partners)
+    return "GET /messages/{username}", await http.get("/messages/" + partner, params={"limit": 50}, headers=user.headers)
+
+async def _send(user, http):
+    if not user.partners:
+        return await _matches(user, http)
+    partner = user.rng.choice(user.partners)
+    response = await http.post("/messages/" + partner, json={"content": "benchmark message"}, headers=user.headers)
+    return "POST /messages/{username}", response
+
+async def _inbox(user, http):
+    return "GET /messages", await http.get("/messages", headers=user.headers)
+
+async def _profile(user, http):
+    update = {"bio": "bio revision %d" % user.rng.randint(0, 10**6)}
+    if user.rng.random() < 0.2:
+        # Scored fields also refresh the match feeds the user appears in
+        update["smoking"] = user.rng.choice(["never", "sometimes", "regularly"])
+    return "PUT /users/profile", await http.put("/users/profile", json=update, headers=user.headers)
+
+async def _login(user, http):
+    from benchmarks.population import PASSWORD
+    response = await http.post("/token", data={"username": "user%d" % user.user_id, "password": PASSWORD})
+    return "POST /token", response
+
+ACTIONS: Dict[str, Callable] = {
+    "browse": _browse, "like": _like, "pass": _pass, "me": _me, "matches": _matches,
+    "conversation": _conversation, "send": _send, "inbox": _inbox, "profile": _profile, "login": _login,
+}
+
+async def run(
+    app,
+    user_ids: Sequence[int],
+    user_count: int,
+    weights: Dict[str, float],
+    clients: int = 20,
+    requests: Optional[int] = 2000,
+    duration: Optional[float] = None,
+    seed: int = 42,
+) -> Dict[str, object]:
+    """
+    Drive `app` with `clients` concurrent virtual users until `requests` requests were
+    sent or `duration` seconds passed; returns {"elapsed", "endpoints", "total"}.
+    Each client has its own seeded random stream, so the requests it makes are the
+    same from one run to the next.
+    """
+    import httpx
+    from app import auth
+
+    rng = random.Random(seed)
+    users = [
+        VirtualUser(user_id, auth.create_access_token({"sub": "user%d" % user_id}), random.Random(rng.random()), user_count)
+        for user_id in rng.sample(list(user_ids), min(clients, len(user_ids)))
+    ]
+    names, shares = zip(*weights.items())
+    recorder = Recorder()
+    remaining = requests
+    deadline = None
+
+    async def client(user, http):
+        nonlocal remaining
+        while (remaining is None or remaining > 0) and (deadline is None or time.perf_counter() < deadline):
+            if remaining is not None:
+                remaining -= 1
+            action = ACTIONS[user.rng.choices(names, shares)[0]]
+            started = time.perf_counter()
+            try:
+                label, response = await action(user, http)
+            except httpx.HTTPError:
+                recorder.record(action.__name__.lstrip("_"), time.perf_counter() - started, False)
+                continue
+            # A 404 or 400 is an expected answer here (e.g. liking an inactive user), not a failure
+            recorder.record(label, time.perf_counter() - started, response.status_code < 500)
+
+    # Unhandled exceptions become 500 responses, counted as errors of their endpoint
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+            started = time.perf_counter()
+            if duration is not None:
+                deadline = started + duration
+            await asyncio.gather(*(client(user, http) for user in users))
+            elapsed = time.perf_counter() - started
+
+    endpoints = {
+        label: summarize(recorder.samples[label], recorder.errors[label], elapsed) for label in sorted(recorder.samples)
+    }
+    every = [sample for samples in recorder.samples.values() for sample in samples]
+    return {
+        "elapsed": round(elapsed, 3),
+        "endpoints": endpoints,
+        "total": summarize(every, sum(recorder.errors.values()), elapsed),
+    }
@@ -1,36 +1,54 @@
 import os
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 
 # Set test environment before importing app
 os.environ["DATABASE_URL"] = "sqlite:///./test.db"
 os.environ["SECRET_KEY"] = "test-secret-key"
 os.environ["ACCESS_TOKEN_EXPIRE_MINUTES"] = "30"
+# Any relationship lazy load during an API test is an error
+os.environ["QUERY_AUDIT"] = "strict"
 
 from app.main import app
 from app.database import Base, get_db
+from app.query_audit import instrument
+from app.services.principal import principal_cache
+from app.services.revisions import revision_index
+from app.services.seen import seen_cache
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient may run each request on a fresh event loop, so async connections are not pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+instrument(async_engine.sync_engine)
+
+@pytest.fixture(autouse=True)
+def clear_seen_cache():
+    # Seen-sets are cached by user id, and every test database reuses the same ids
+    yield
+    seen_cache.clear()
 
 @pytest.fixture
 def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    # Cached principals and revisions point at rows of the dropped tables
+    principal_cache.clear()
+    revision_index.clear()
 
 @pytest.fixture
 def client(test_db):
-    def override_get_db():
-        try:
-            db = TestingSessionLocal()
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
             yield db
-        finally:
-            db.close()
     
     app.dependency_overrides[get_db] = override_get_db
     yield TestClient(app)
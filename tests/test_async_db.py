@@ -0,0 +1,43 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import auth
+from app.database import Base, async_database_url
+from app.models.user import User
+from app.services.compatibility import CompatibilityService
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, autoflush=False, expire_on_commit=False)() as session:
+        session.add_all([
+            User(id=1, username="alice", hashed_password=auth.get_password_hash("secret"), interests=["music"]),
+            User(id=2, username="bob", interests=["music", "art"]),
+        ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("postgresql://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+    assert async_database_url("postgresql+asyncpg://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+
+@pytest.mark.asyncio
+async def test_get_user_and_authenticate(db):
+    assert (await auth.get_user(db, "alice")).id == 1
+    assert await auth.get_user(db, "nobody") is None
+    assert (await auth.authenticate_user(db, "alice", "secret")).id == 1
+    assert await auth.authenticate_user(db, "alice", "wrong") is False
+
+@pytest.mark.asyncio
+async def test_compatibility_report_async(db):
+    report = await CompatibilityService.get_compatibility_report_async(db, 1, 2)
+    assert report.common_interests == ["music"]
+    again = await CompatibilityService.get_compatibility_report_async(db, 1, 2)
+    assert again.compatibility_score == report.compatibility_score
+    assert await CompatibilityService.create_compatibility_report_async(db, 1, 99) is None
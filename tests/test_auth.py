@@ -88,4 +88,19 @@ def test_get_current_user(client):
     assert response.status_code == 200
     data = response.json()
     assert data["email"] == "test@example.com"
-    assert data["username"] == "testuser" 
\ No newline at end of file
+    assert data["username"] == "testuser"
+
+
+def test_hashing_is_shed_with_503_when_hasher_is_saturated(client, monkeypatch):
+    from app.services.passwords import password_hasher
+    monkeypatch.setattr(password_hasher, "limit", 0)
+    response = client.post("/users/", json={
+        "email": "test@example.com", "password": "testpassword123", "username": "testuser",
+        "first_name": "Test", "last_name": "User", "date_of_birth": "1990-01-01",
+        "gender": "male", "looking_for": "female",
+    })
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # Unknown users never reach bcrypt
+    response = client.post("/token", data={"username": "nobody", "password": "x"})
+    assert response.status_code == 401
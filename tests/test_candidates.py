@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+import os
+import random
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import User
+from app.services.candidates import CandidateFilter, age_columns, age_on, birth_date_range
+
+TODAY = date(2026, 3, 15)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    rng = random.Random(5)
+    for user_id in range(1, 401):
+        low = rng.choice([None, 18, 25, 30])
+        session.add(User(
+            id=user_id, username="user%d" % user_id,
+            gender=rng.choice(["male", "female"]), looking_for=rng.choice(["male", "female"]),
+            date_of_birth=None if user_id % 50 == 0 else TODAY - timedelta(days=rng.randint(18 * 365, 60 * 365)),
+            min_age_preference=low,
+            max_age_preference=rng.choice([None, 30, 40]) if low is None or low < 30 else None,
+            is_active=user_id % 9 != 0,
+        ))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+def plan(db, query):
+    sql = str(query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    return " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+
+@pytest.mark.parametrize("today", [TODAY, date(2024, 2, 29), date(2025, 2, 28), date(2025, 3, 1)])
+def test_birth_date_range_matches_age_on(today):
+    earliest, latest = birth_date_range(25, 30, today)
+    born = earliest - timedelta(days=800)
+    while born <= latest + timedelta(days=800):
+        assert (earliest <= born <= latest) == (25 <= age_on(born, today) <= 30)
+        born += timedelta(days=1)
+    assert birth_date_range(None, None, today) == (None, None)
+
+def test_for_user_matches_the_symmetric_definition(db):
+    users = db.query(User).all()
+    ages = {user.id: age_on(user.date_of_birth, TODAY) for user in users}
+
+    def accepts(user, other):
+        age = ages[other.id]
+        if user.min_age_preference is not None and (age is None or age < user.min_age_preference):
+            return False
+        return user.max_age_preference is None or (age is not None and age <= user.max_age_preference)
+
+    columns = age_columns(users, TODAY)
+    for user in users[:60]:
+        expected = {
+            other.id for other in users
+            if other.id != user.id and other.is_active and other.gender == user.looking_for
+            and other.looking_for == user.gender and accepts(user, other) and accepts(other, user)
+        }
+        assert {other.id for other in CandidateFilter.for_user(db, user, TODAY)} == expected
+        mask = CandidateFilter.age_mask(user, TODAY, *columns)
+        pool = CandidateFilter.pool(db, user.gender, user.looking_for).all()
+        in_mask = {other.id for other, keep in zip(users, mask) if keep}
+        assert {other.id for other in pool if other.id != user.id} & in_mask == expected
+
+def test_group_range_covers_every_window():
+    owners = [User(min_age_preference=25, max_age_preference=30), User(min_age_preference=40, max_age_preference=50)]
+    assert CandidateFilter.group_range(owners, TODAY) == (birth_date_range(None, 50, TODAY)[0], birth_date_range(25, None, TODAY)[1])
+    assert CandidateFilter.group_range(owners + [User()], TODAY) == (None, None)
+
+def test_candidate_queries_use_the_composite_index_on_sqlite(db):
+    user = db.get(User, 1)
+    user.min_age_preference, user.max_age_preference = 25, 35
+    queries = [
+        CandidateFilter.for_user(db, user, TODAY),
+        CandidateFilter.pool(db, "male", "female"),
+        CandidateFilter.pool(db, "male", "female", *birth_date_range(25, 35, TODAY)),
+    ]
+    for query in queries:
+        details = plan(db, query)
+        assert "USING INDEX ix_users_candidates (gender=? AND looking_for=? AND is_active=?" in details
+        assert "SCAN users" not in details
+    assert "date_of_birth>? AND date_of_birth<?" in plan(db, queries[0])
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set")
+def test_candidate_queries_use_the_composite_index_on_postgres():
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    Base.metadata.create_all(bind=engine)
+    try:
+        with Session(engine) as db:
+            # The planner prefers a sequential scan of a small table; disallow it to see the usable path
+            db.connection().exec_driver_sql("SET LOCAL enable_seqscan = off")
+            user = User(id=1, gender="female", looking_for="male", date_of_birth=date(1995, 1, 1),
+                        min_age_preference=25, max_age_preference=35)
+            query = CandidateFilter.for_user(db, user, TODAY)
+            sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            details = " ".join(row[0] for row in db.connection().exec_driver_sql("EXPLAIN " + sql))
+            assert "ix_users_candidates" in details
+            assert "Seq Scan" not in details
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
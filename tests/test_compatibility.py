@@ -0,0 +1,105 @@
+import random
+import numpy as np
+import pytest
+
+from app.models.user import User
+from app.schemas.user import PersonalityTrait
+from app.services.compatibility import CompatibilityService
+from app.services.features import FeatureVocabularies, ProfileFeatures
+
+INTERESTS = ["reading", "travel", "music", "hiking", "cooking", "gaming", "yoga", "art", "movies", "running"]
+LANGUAGES = ["english", "spanish", "french", "german", "mandarin"]
+TRAITS = [trait.value for trait in PersonalityTrait]
+GOALS = ["casual", "serious", "friendship", "marriage"]
+HABITS = ["never", "sometimes", "regularly"]
+EDUCATION = ["high school", "bachelor", "master", "phd"]
+
+def random_list(rng, values, max_size=5):
+    choice = rng.random()
+    if choice < 0.1:
+        return None
+    if choice < 0.15:
+        return []
+    # Duplicates are allowed on purpose: the scalar scorer divides by len(list)
+    return [rng.choice(values) for _ in range(rng.randint(1, max_size))]
+
+def random_value(rng, values):
+    choice = rng.random()
+    if choice < 0.15:
+        return None
+    if choice < 0.2:
+        return ""
+    return rng.choice(values)
+
+def random_user(rng, user_id):
+    traits = random_list(rng, TRAITS, 4)
+    if traits and rng.random() < 0.5:
+        traits = [PersonalityTrait(trait) for trait in traits]
+    return User(
+        id=user_id,
+        interests=random_list(rng, INTERESTS + ["rare-%d" % rng.randint(0, 200)], 8),
+        personality_traits=traits,
+        languages=random_list(rng, LANGUAGES, 3),
+        relationship_goals=random_value(rng, GOALS),
+        smoking=random_value(rng, HABITS),
+        drinking=random_value(rng, HABITS),
+        education=random_value(rng, EDUCATION),
+        wants_children=rng.choice([None, True, False]),
+    )
+
+@pytest.fixture
+def population():
+    rng = random.Random(1234)
+    return [random_user(rng, user_id) for user_id in range(1, 601)]
+
+def test_batch_scores_match_scalar_scores(population):
+    candidates = ProfileFeatures.from_users(population)
+    for user in population[:60]:
+        expected = [CompatibilityService.calculate_compatibility(user, other)[0] for other in population]
+        scores = CompatibilityService.calculate_compatibility_batch(user, candidates)
+        assert scores.tolist() == expected
+
+def test_batch_handles_source_terms_unknown_to_the_vocabulary(population):
+    candidates = ProfileFeatures.from_users(population[:100])
+    user = User(
+        id=0,
+        interests=["unseen", "reading"],
+        personality_traits=["mystery", PersonalityTrait.INTROVERT],
+        languages=["klingon"],
+        relationship_goals="unknown",
+        smoking="unknown",
+        drinking="never",
+        education="unknown",
+        wants_children=True,
+    )
+    expected = [CompatibilityService.calculate_compatibility(user, other)[0] for other in population[:100]]
+    assert CompatibilityService.calculate_compatibility_batch(user, candidates).tolist() == expected
+
+def test_batch_on_empty_and_taken_features(population):
+    vocabularies = FeatureVocabularies()
+    candidates = ProfileFeatures.from_users(population, vocabularies)
+    assert len(CompatibilityService.calculate_compatibility_batch(population[0], candidates.take(slice(0, 0)))) == 0
+
+    subset = candidates.take(np.arange(10, 50))
+    expected = [CompatibilityService.calculate_compatibility(population[0], other)[0] for other in population[10:50]]
+    assert CompatibilityService.calculate_compatibility_batch(population[0], subset).tolist() == expected
+
+def test_rank_candidates_orders_by_score_then_id(population):
+    user = population[0]
+    candidates = ProfileFeatures.from_users(population[1:])
+    expected = sorted(
+        ((CompatibilityService.calculate_compatibility(user, other)[0], other.id) for other in population[1:]),
+        key=lambda item: (-item[0], item[1]),
+    )[:25]
+
+    ids, scores = CompatibilityService.rank_candidates(user, candidates, limit=25)
+    assert list(zip(scores.tolist(), ids.tolist())) == expected
+
+    ids, _ = CompatibilityService.rank_candidates(user, candidates)
+    assert len(ids) == len(population) - 1
+
+def test_reverse_scores_match_scalar_scores(population):
+    sources = ProfileFeatures.from_users(population)
+    for target in population[:40]:
+        expected = [CompatibilityService.calculate_compatibility(user, target)[0] for user in population]
+        assert CompatibilityService.calculate_compatibility_reverse(sources, target).tolist() == expected
@@ -0,0 +1,124 @@
+import random
+from datetime import date
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import User, MatchFeedEntry
+from app.services import feed, profile_store
+from app.services.compatibility import CompatibilityService
+from app.services.feed import MatchFeedService
+
+INTERESTS = ["reading", "travel", "music", "hiking", "cooking", "gaming", "yoga", "art"]
+GOALS = ["casual", "serious", "friendship", None]
+HABITS = ["never", "sometimes", "regularly", None]
+
+@pytest.fixture(params=[False, True], ids=["orm", "profile_store"])
+def db(request, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_SIZE", 5)
+    # Candidate pools come from ORM queries or from the columnar store, with identical results
+    monkeypatch.setattr(profile_store, "ENABLED", request.param)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+def randomize_profile(rng, user):
+    user.interests = rng.sample(INTERESTS, rng.randint(0, 4))
+    user.relationship_goals = rng.choice(GOALS)
+    user.smoking = rng.choice(HABITS)
+    user.drinking = rng.choice(HABITS)
+    user.wants_children = rng.choice([None, True, False])
+    user.languages = rng.sample(["english", "spanish", "french"], rng.randint(0, 2))
+    if rng.random() < 0.8:
+        user.latitude = 40.0 + rng.uniform(-1.5, 1.5)
+        user.longitude = -74.0 + rng.uniform(-1.5, 1.5)
+    else:
+        user.latitude = user.longitude = None
+    user.max_distance = rng.choice([None, 50, 100, 200])
+
+def add_user(db, rng, index):
+    gender = rng.choice(["male", "female"])
+    user = User(
+        email="user%d@example.com" % index,
+        username="user%d" % index,
+        hashed_password="x",
+        first_name="User",
+        last_name=str(index),
+        date_of_birth=date(1990, 1, 1),
+        gender=gender,
+        looking_for=rng.choice(["male", "female"]),
+        is_active=True,
+    )
+    randomize_profile(rng, user)
+    db.add(user)
+    db.commit()
+    return user
+
+def expected_feed(db, user):
+    candidates = MatchFeedService.eligible_candidates(db, user)
+    ranked = sorted(
+        ((CompatibilityService.calculate_compatibility(user, candidate)[0], candidate.id) for candidate in candidates),
+        key=lambda item: (-item[0], item[1]),
+    )
+    return [(candidate_id, score, rank) for rank, (score, candidate_id) in enumerate(ranked[:feed.FEED_SIZE], start=1)]
+
+def materialized_feed(db, user):
+    def rows():
+        return [
+            (entry.candidate_id, entry.score, entry.rank)
+            for entry in db.query(MatchFeedEntry).filter(MatchFeedEntry.user_id == user.id).order_by(MatchFeedEntry.rank)
+        ]
+    # Feeds without rows are not maintained incrementally: readers rebuild them lazily
+    if user.is_active and not rows():
+        MatchFeedService.get_feed_cards(db, user)
+    return rows()
+
+def test_incremental_maintenance_matches_full_rebuild(db):
+    rng = random.Random(7)
+    users = []
+    for index in range(40):
+        user = add_user(db, rng, index)
+        MatchFeedService.refresh_user(db, user)
+        users.append(user)
+    for user in users:
+        MatchFeedService.get_feed_cards(db, user)
+
+    # Later refreshes can hide a wrong incremental step, so check after every change
+    for _ in range(80):
+        user = rng.choice(users)
+        if rng.random() < 0.6:
+            randomize_profile(rng, user)
+        else:
+            user.is_active = not user.is_active
+        db.commit()
+        MatchFeedService.refresh_user(db, user)
+
+        for owner in users:
+            if owner.is_active:
+                assert materialized_feed(db, owner) == expected_feed(db, owner)
+            else:
+                assert materialized_feed(db, owner) == []
+                assert db.query(MatchFeedEntry).filter(MatchFeedEntry.candidate_id == owner.id).count() == 0
+
+def test_feed_builds_lazily_and_pages_by_rank(db):
+    rng = random.Random(3)
+    users = [add_user(db, rng, index) for index in range(30)]
+    viewer = users[0]
+    assert MatchFeedService.feed_page(db, viewer.id) == []
+    assert db.query(MatchFeedEntry).count() == 0
+
+    page = MatchFeedService.get_feed_cards(db, viewer, skip=1, limit=2)
+    full = expected_feed(db, viewer)
+    assert [(card["id"], card["compatibility_score"]) for card in page] == [(row[0], row[1]) for row in full[1:3]]
+    assert MatchFeedService.feed_page(db, viewer.id, skip=1, limit=2) == [(row[0], row[1]) for row in full[1:3]]
+
+def test_unbuilt_feeds_are_left_for_lazy_rebuild(db):
+    rng = random.Random(5)
+    users = [add_user(db, rng, index) for index in range(10)]
+    MatchFeedService.refresh_user(db, users[0])
+    owners = {owner_id for (owner_id,) in db.query(MatchFeedEntry.user_id).distinct()}
+    assert owners <= {users[0].id}
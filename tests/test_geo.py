@@ -0,0 +1,116 @@
+import random
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import GEO_CELL_COLUMNS, User, geo_cell
+from app.services.geo import GeoIndex, GeoService, bounding_box, haversine_km
+
+QUERIES = [
+    (40.7, -74.0, 25),
+    (51.5, -0.1, 300),
+    (0.0, 179.9, 150),      # crosses the antimeridian
+    (-33.9, -179.5, 400),   # crosses it westwards
+    (89.5, 10.0, 200),      # contains the north pole
+    (-10.0, 20.0, 1000),
+]
+
+@pytest.fixture
+def points():
+    rng = random.Random(11)
+    rows = []
+    for user_id in range(1, 3001):
+        latitude, longitude, radius = rng.choice(QUERIES)
+        spread = radius / 60.0
+        rows.append((
+            user_id,
+            max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread))),
+            ((longitude + rng.uniform(-spread, spread) + 180) % 360) - 180,
+        ))
+    return rows
+
+@pytest.fixture
+def db(points):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    for user_id, latitude, longitude in points:
+        session.add(User(id=user_id, username="user%d" % user_id, latitude=latitude, longitude=longitude,
+                         is_active=user_id % 10 != 0))
+    session.add(User(id=5000, username="nowhere", is_active=True))
+    session.commit()
+    yield session
+    session.close()
+
+def brute_force(points, latitude, longitude, radius_km, active_only=False):
+    ids = np.array([row[0] for row in points])
+    distances = haversine_km(latitude, longitude, np.array([row[1] for row in points]), np.array([row[2] for row in points]))
+    inside = distances <= radius_km
+    if active_only:
+        inside &= ids % 10 != 0
+    return set(ids[inside].tolist())
+
+def test_haversine_known_distance():
+    # London to Paris is about 343.5 km
+    assert haversine_km(51.5074, -0.1278, np.array([48.8566]), np.array([2.3522]))[0] == pytest.approx(343.5, abs=1.0)
+
+def test_bounding_box_splits_at_antimeridian():
+    _, _, longitudes = bounding_box(0.0, 179.9, 150)
+    assert len(longitudes) == 2
+    _, _, longitudes = bounding_box(89.5, 10.0, 200)
+    assert longitudes == [(-180.0, 180.0)]
+
+def test_geo_cell_is_kept_in_sync(db):
+    user = db.query(User).filter(User.id == 1).first()
+    user.latitude, user.longitude = 10.0, 10.0
+    db.commit()
+    assert user.geo_cell == geo_cell(10.0, 10.0)
+    assert db.query(User).filter(User.id == 5000).first().geo_cell is None
+
+@pytest.mark.parametrize("latitude,longitude,radius_km", QUERIES)
+def test_sql_radius_query_matches_brute_force(db, points, latitude, longitude, radius_km):
+    ids, distances = GeoService.users_within(db, latitude, longitude, radius_km)
+    assert set(ids.tolist()) == brute_force(points, latitude, longitude, radius_km, active_only=True)
+    assert np.all(np.diff(distances) >= 0)
+
+@pytest.mark.parametrize("latitude,longitude,radius_km", QUERIES)
+def test_in_memory_index_matches_brute_force(points, latitude, longitude, radius_km):
+    index = GeoIndex.from_rows(points)
+    ids, distances = index.within(latitude, longitude, radius_km)
+    assert set(ids.tolist()) == brute_force(points, latitude, longitude, radius_km)
+    assert np.all(distances <= radius_km)
+
+def test_in_memory_index_updates(points):
+    index = GeoIndex.from_rows(points)
+    index.update(1, 0.0, 0.0)
+    index.update(2, None, None)
+    ids, _ = index.within(0.0, 0.0, 1)
+    assert ids.tolist() == [1]
+    assert 2 not in set(index.within(points[1][1], points[1][2], 50)[0].tolist())
+    index.remove(1)
+    assert len(index.within(0.0, 0.0, 1)[0]) == 0
+    assert len(index) == len(points) - 2
+
+def test_longitude_180_stays_in_the_easternmost_column(db):
+    assert geo_cell(0.0, 180.0) % GEO_CELL_COLUMNS == GEO_CELL_COLUMNS - 1
+    assert geo_cell(0.0, 180.0) == geo_cell(0.0, 179.9)
+    assert geo_cell(0.0, -180.0) % GEO_CELL_COLUMNS == 0
+    db.add(User(id=6000, username="antimeridian", latitude=0.0, longitude=180.0, is_active=True))
+    db.commit()
+    for origin in (179.8, -179.8):
+        assert 6000 in GeoService.users_within(db, 0.0, origin, 50)[0]
+    index = GeoIndex.from_rows([(6000, 0.0, 180.0)])
+    assert index.within(0.0, 179.8, 50)[0].tolist() == index.within(0.0, -179.8, 50)[0].tolist() == [6000]
+
+def test_distance_mask_honors_both_max_distances():
+    user = User(latitude=0.0, longitude=0.0, max_distance=100)
+    latitudes = np.array([0.0, 0.0, 0.0, np.nan])
+    longitudes = np.array([0.5, 1.5, 0.5, np.nan])  # ~56 km, ~167 km, ~56 km, unknown
+    max_distances = np.array([np.nan, np.nan, 30.0, 10.0])
+    assert GeoService.distance_mask(user, latitudes, longitudes, max_distances).tolist() == [True, False, False, True]
+
+    nowhere = User(latitude=None, longitude=None, max_distance=5)
+    assert GeoService.distance_mask(nowhere, latitudes, longitudes, max_distances).all()
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models.user import Like, Match, User
+from app.services.like_buffer import AppendLog, LikeBuffer
+
+@pytest_asyncio.fixture
+async def sessions(tmp_path):
+    engine = create_async_engine("sqlite+aiosqlite:///%s" % (tmp_path / "likes.db"))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all([User(id=index, username="user%d" % index) for index in range(1, 11)])
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+async def count(sessions, model):
+    async with sessions() as db:
+        return (await db.execute(select(func.count()).select_from(model))).scalar_one()
+
+@pytest.mark.asyncio
+async def test_concurrent_likes_share_one_flush(sessions):
+    buffer = LikeBuffer(sessions, flush_rows=100, flush_interval_ms=20)
+    await buffer.start()
+    results = await asyncio.gather(*(buffer.add(1, other) for other in range(2, 11)), buffer.add(5, 1))
+    await buffer.stop()
+    # The reciprocal like in the same batch completes the match
+    assert results == [other == 5 for other in range(2, 11)] + [True]
+    assert buffer.flushes == 1 and buffer.flushed_likes == 10
+    assert await count(sessions, Like) == 10
+    assert await count(sessions, Match) == 2
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_before_the_interval(sessions):
+    buffer = LikeBuffer(sessions, flush_rows=3, flush_interval_ms=60_000)
+    await buffer.start()
+    await asyncio.wait_for(asyncio.gather(*(buffer.add(1, other) for other in (2, 3, 4))), 5)
+    await buffer.stop()
+    assert buffer.flushes == 1
+
+@pytest.mark.asyncio
+async def test_stop_flushes_what_is_buffered(sessions, tmp_path):
+    buffer = LikeBuffer(sessions, flush_rows=100, flush_interval_ms=60_000, log=AppendLog(str(tmp_path / "log")))
+    await buffer.start()
+    pending = asyncio.ensure_future(buffer.add(1, 2))
+    await asyncio.sleep(0)
+    await buffer.stop()
+    assert await pending is False
+    assert await count(sessions, Like) == 1
+    assert os.listdir(tmp_path / "log") == []
+
+@pytest.mark.asyncio
+async def test_batches_are_logged_before_they_commit(sessions, tmp_path):
+    log_dir = tmp_path / "log"
+    buffer = LikeBuffer(sessions, flush_rows=100, flush_interval_ms=1, log=AppendLog(str(log_dir), fsync=True))
+    write = buffer._write
+    logged = []
+
+    async def checked(pairs):
+        logged.extend(pair for path in AppendLog(str(log_dir)).segments() for pair in AppendLog.read(path))
+        return await write(pairs)
+    buffer._write = checked
+    await buffer.start()
+    assert await asyncio.gather(buffer.add(1, 2), buffer.add(2, 1)) == [True, True]
+    await buffer.stop()
+    assert logged == [(1, 2), (2, 1)]
+    assert os.listdir(log_dir) == []
+
+@pytest.mark.asyncio
+async def test_segments_left_by_a_crash_are_replayed(sessions, tmp_path):
+    log_dir = tmp_path / "log"
+    AppendLog(str(log_dir)).write([(1, 2), (2, 1)])
+    with open(log_dir / "likes-000000000002.log", "w") as segment:
+        # The crash tore the last line
+        segment.write("3 4\n5")
+
+    buffer = LikeBuffer(sessions, log=AppendLog(str(log_dir)))
+    await buffer.start()
+    await buffer.stop()
+    assert await count(sessions, Like) == 3
+    assert await count(sessions, Match) == 2
+    assert os.listdir(log_dir) == []
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_then_answered_once(sessions, tmp_path):
+    buffer = LikeBuffer(sessions, flush_interval_ms=1, log=AppendLog(str(tmp_path / "log")),
+                        flush_retries=2, retry_delay_ms=1)
+    write = buffer._write
+    failures = {"left": 2}
+
+    async def flaky(pairs):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise OSError("database unavailable")
+        return await write(pairs)
+    buffer._write = flaky
+    await buffer.start()
+    assert await buffer.add(1, 2) is False
+
+    failures["left"] = 3
+    with pytest.raises(OSError):
+        await buffer.add(2, 3)
+    # The failed like was answered, so it is not replayed on the next start either
+    assert os.listdir(tmp_path / "log") == []
+    assert await buffer.add(3, 4) is False
+    await buffer.stop()
+    assert await count(sessions, Like) == 2
+
+@pytest.mark.asyncio
+async def test_flusher_survives_log_errors(sessions, tmp_path):
+    log = AppendLog(str(tmp_path / "log"))
+    buffer = LikeBuffer(sessions, flush_interval_ms=1, log=log)
+    write = log.write
+    failures = {"left": 1}
+
+    def vanishing_write(pairs):
+        path = write(pairs)
+        if failures["left"]:
+            # Removing the segment after the commit then fails
+            failures["left"] -= 1
+            os.remove(path)
+        return path
+    log.write = vanishing_write
+    await buffer.start()
+    await asyncio.wait_for(buffer.add(1, 2), 5)
+    assert await asyncio.wait_for(buffer.add(2, 1), 5) is True
+    await buffer.stop()
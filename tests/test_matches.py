@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import Like, Match, User
+from app.services.matches import MatchService, _lock_pairs
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add_all([User(id=index, username="user%d" % index) for index in range(1, 5)])
+    session.commit()
+    yield session
+    session.close()
+
+def count(db, model):
+    return db.execute(select(func.count()).select_from(model)).scalar_one()
+
+def plan(db, statement):
+    sql = str(statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    return " ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+
+def test_reciprocal_like_creates_the_match(db):
+    assert MatchService.record_like(db, 1, 2) is False
+    assert not MatchService.is_matched(db, 1, 2)
+    assert MatchService.record_like(db, 2, 1) is True
+    assert MatchService.is_matched(db, 1, 2) and MatchService.is_matched(db, 2, 1)
+    assert count(db, Match) == 2
+
+def test_repeated_likes_are_ignored(db):
+    for _ in range(3):
+        MatchService.record_like(db, 1, 2)
+        MatchService.record_like(db, 2, 1)
+    assert count(db, Like) == 2
+    assert count(db, Match) == 2
+
+def test_pair_locks_use_both_ids_as_int4_keys():
+    class PostgresSession:
+        def __init__(self):
+            self.locks = []
+
+        def get_bind(self):
+            return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+        def execute(self, statement, params):
+            self.locks.append((str(statement), params))
+
+    db = PostgresSession()
+    top = 2 ** 31 - 1
+    _lock_pairs(db, [(top, 5), (5, top), (3, 1)])
+    # One lock per unordered pair, taken in key order
+    assert db.locks == [
+        ("SELECT pg_advisory_xact_lock(:low, :high)", {"low": 1, "high": 3}),
+        ("SELECT pg_advisory_xact_lock(:low, :high)", {"low": 5, "high": top}),
+    ]
+
+def test_list_matches_in_id_order(db):
+    for other in (4, 2, 3):
+        MatchService.record_like(db, 1, other)
+        MatchService.record_like(db, other, 1)
+    assert [card["username"] for card in MatchService.list_match_cards(db, 1)] == ["user2", "user3", "user4"]
+    assert [card["id"] for card in MatchService.list_match_cards(db, 1, after=2, limit=1)] == [3]
+    assert [card["id"] for card in MatchService.list_match_cards(db, 2)] == [1]
+
+def test_lookups_are_index_only(db):
+    lookups = [
+        select(Match.matched_user_id).where(Match.user_id == 1, Match.matched_user_id == 2),
+        select(Match.matched_user_id).where(Match.user_id == 1, Match.matched_user_id > 0).order_by(Match.matched_user_id),
+        select(Like.liker_id).where(Like.liker_id == 1, Like.liked_id == 2),
+    ]
+    for statement in lookups:
+        assert "COVERING INDEX" in plan(db, statement)
+
+def test_match_endpoints(client):
+    tokens = {}
+    for name in ("alice", "bob"):
+        client.post("/users/", json={
+            "email": "%s@example.com" % name, "password": "secret123", "username": name,
+            "first_name": name, "last_name": "Test", "date_of_birth": "1990-01-01",
+            "gender": "male", "looking_for": "female",
+        })
+        token = client.post("/token", data={"username": name, "password": "secret123"}).json()["access_token"]
+        tokens[name] = {"Authorization": "Bearer " + token}
+
+    assert client.post("/users/like/bob", headers=tokens["alice"]).json()["match"] is False
+    assert client.post("/users/like/bob", headers=tokens["alice"]).json()["match"] is False
+    assert client.get("/users/me/matches/bob", headers=tokens["alice"]).json()["match"] is False
+    assert client.post("/users/like/alice", headers=tokens["bob"]).json()["match"] is True
+
+    assert client.get("/users/me/matches/bob", headers=tokens["alice"]).json()["user"]["username"] == "bob"
+    assert [user["username"] for user in client.get("/users/me/matches", headers=tokens["bob"]).json()] == ["alice"]
+    assert client.get("/users/me/matches/nobody", headers=tokens["bob"]).status_code == 404
@@ -0,0 +1,96 @@
+import os
+import random
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import MatchFeedEntry, User
+from app.services import feed, profile_store
+from app.services.compatibility import CompatibilityService
+from app.services.features import ProfileFeatures
+from app.services.feed import MatchFeedService
+from app.services.matching_pool import MatchingPool, map_snapshot, rank_in, write_snapshot
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(profile_store, "ENABLED", True)
+    monkeypatch.setattr(feed, "FEED_SIZE", 5)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    rng = random.Random(11)
+    for index in range(1, 61):
+        session.add(User(
+            id=index, username="user%d" % index, gender=rng.choice(["male", "female"]),
+            looking_for=rng.choice(["male", "female"]), is_active=True,
+            interests=rng.sample(["reading", "travel", "music", "hiking", "cooking", "yoga"], rng.randint(0, 4)),
+            personality_traits=rng.sample(["introvert", "extrovert", "creative", "analytical"], rng.randint(0, 2)),
+            languages=rng.sample(["english", "spanish", "french"], rng.randint(0, 2)),
+            smoking=rng.choice(["never", "sometimes", None]), wants_children=rng.choice([None, True, False]),
+        ))
+    session.commit()
+    yield session
+    session.close()
+    profile_store._reset()
+    engine.dispose()
+
+@pytest.fixture(scope="module")
+def pool(tmp_path_factory):
+    matching = MatchingPool(2, str(tmp_path_factory.mktemp("snapshots")))
+    yield matching
+    matching.shutdown()
+
+def test_snapshots_map_read_only_and_rank_like_rank_candidates(db, tmp_path):
+    _, features = profile_store.profile_store(db).snapshot()
+    path = str(tmp_path / "profiles.snapshot")
+    write_snapshot(path, features)
+    mapped = map_snapshot(path)
+    for name in ProfileFeatures.ARRAYS:
+        np.testing.assert_array_equal(getattr(mapped, name), getattr(features, name))
+        assert not getattr(mapped, name).flags.writeable
+
+    users = db.query(User).order_by(User.id).all()
+    for user in users[:10]:
+        candidates = [other for other in users if other.id != user.id]
+        expected = CompatibilityService.rank_candidates(user, mapped.take(np.flatnonzero(mapped.ids != user.id)), 7)
+        ids, scores = rank_in(mapped, user.id, [other.id for other in candidates] + [10_000], 7)
+        assert ids.tolist() == expected[0].tolist() and scores.tolist() == expected[1].tolist()
+    with pytest.raises(KeyError):
+        rank_in(mapped, 10_000, [1, 2])
+
+def test_pool_ranks_on_workers_and_replaces_stale_snapshots(db, pool):
+    store = profile_store.profile_store(db)
+    user = db.get(User, 1)
+    candidate_ids = list(range(2, 61))
+    first = pool.publish(store)
+    assert pool.publish(store) == first
+    ids, scores = pool.rank(store, user.id, candidate_ids, 10).result()
+    _, features = store.snapshot()
+    expected = rank_in(features, user.id, candidate_ids, 10)
+    assert ids.tolist() == expected[0].tolist() and scores.tolist() == expected[1].tolist()
+
+    user.interests = ["reading", "travel", "music", "hiking"]
+    db.commit()
+    ids, _ = pool.rank(store, user.id, candidate_ids, 10).result()
+    assert pool.publish(store) != first and not os.path.exists(first)
+    _, features = store.snapshot()
+    assert ids.tolist() == rank_in(features, user.id, candidate_ids, 10)[0].tolist()
+
+def test_feed_rebuilds_rank_on_the_pool(db, pool, monkeypatch):
+    users = db.query(User).order_by(User.id).all()
+
+    def feeds():
+        return [
+            (entry.user_id, entry.candidate_id, entry.score, entry.rank)
+            for entry in db.query(MatchFeedEntry).order_by(MatchFeedEntry.user_id, MatchFeedEntry.rank)
+        ]
+
+    MatchFeedService.rebuild_feeds(db, users)
+    in_process = feeds()
+    monkeypatch.setattr(feed, "matching_pool", pool)
+    monkeypatch.setattr(feed, "MATCHING_MIN_JOBS", 1)
+    MatchFeedService.rebuild_feeds(db, users)
+    assert feeds() == in_process and in_process
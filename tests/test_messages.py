@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import Message, User
+from app.services.messages import InvalidCursor, MessageService
+
+START = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add_all([User(id=1, username="alice"), User(id=2, username="bob"), User(id=3, username="carol")])
+    # Alternating directions, several messages per timestamp, and noise from another conversation
+    session.add_all([
+        Message(id=index + 1, content=str(index), sender_id=1 + index % 2, receiver_id=2 - index % 2,
+                timestamp=START + timedelta(seconds=index // 3))
+        for index in range(25)
+    ])
+    session.add(Message(id=100, content="other", sender_id=1, receiver_id=3, timestamp=START))
+    session.commit()
+    yield session
+    session.close()
+
+def test_timestamps_are_timezone_aware(db):
+    message = db.get(Message, 1)
+    db.expire(message)
+    assert message.timestamp == START
+    assert message.timestamp.tzinfo is not None
+
+def test_pages_walk_the_whole_conversation_newest_first(db):
+    seen, cursor = [], None
+    while True:
+        page, cursor = MessageService.conversation(db, 2, 1, 4, cursor)
+        assert len(page) <= 4
+        seen.extend(message.id for message in page)
+        if cursor is None:
+            break
+    assert seen == list(range(25, 0, -1))
+
+def test_last_full_page_has_no_cursor(db):
+    page, cursor = MessageService.conversation(db, 1, 2, 25)
+    assert len(page) == 25 and cursor is None
+
+def test_invalid_cursor(db):
+    with pytest.raises(InvalidCursor):
+        MessageService.conversation(db, 1, 2, 10, "not-a-cursor")
+
+def test_conversation_reads_the_composite_index(db):
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM messages WHERE sender_id = 1 AND receiver_id = 2 "
+        "AND timestamp < '2024-01-02' ORDER BY timestamp DESC, id DESC LIMIT 10"
+    )).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_messages_conversation" in details
+    assert "TEMP B-TREE" not in details
+
+def test_conversation_endpoint(client):
+    for name in ("alice", "bob"):
+        client.post("/users/", json={
+            "email": "%s@example.com" % name, "password": "secret123", "username": name,
+            "first_name": name, "last_name": "Test", "date_of_birth": "1990-01-01",
+            "gender": "male", "looking_for": "female",
+        })
+    token = client.post("/token", data={"username": "alice", "password": "secret123"}).json()["access_token"]
+    headers = {"Authorization": "Bearer " + token}
+
+    response = client.get("/messages/bob", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"messages": [], "next_cursor": None}
+    assert client.get("/messages/nobody", headers=headers).status_code == 404
+    assert client.get("/messages/bob?before=garbage", headers=headers).status_code == 400
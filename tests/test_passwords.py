@@ -0,0 +1,46 @@
+import asyncio
+import time
+import pytest
+from passlib.context import CryptContext
+
+from app.services.passwords import PasswordHasher, PasswordHasherBusy
+
+def context(rounds):
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, queue_depth=1, context=context(4))
+    yield hasher
+    hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_hash_and_verify(hasher):
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert hasher.pending == 0
+
+@pytest.mark.asyncio
+async def test_rehash_when_cost_changes(hasher):
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify_and_update("secret", hashed) == (True, None)
+
+    raised = PasswordHasher(workers=1, queue_depth=0, context=context(5))
+    try:
+        verified, new_hash = await raised.verify_and_update("secret", hashed)
+        assert verified and new_hash.startswith("$2b$05$")
+        assert await raised.verify_and_update("wrong", hashed) == (False, None)
+    finally:
+        raised.shutdown()
+
+@pytest.mark.asyncio
+async def test_rejects_beyond_workers_plus_queue(hasher):
+    running = hasher._submit(time.sleep, 0.2)
+    queued = hasher._submit(time.sleep, 0)
+    with pytest.raises(PasswordHasherBusy):
+        await hasher.hash("secret")
+    assert hasher.rejected == 1
+    await asyncio.gather(running, queued)
+    assert hasher.pending == 0
+    assert await hasher.hash("secret")
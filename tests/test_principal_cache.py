@@ -0,0 +1,72 @@
+import dataclasses
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import User
+from app.services.principal import Principal, PrincipalCache, principal_cache
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add(User(id=1, username="alice", email="alice@example.com", is_active=True))
+    session.commit()
+    principal_cache.clear()
+    yield session
+    session.close()
+    principal_cache.clear()
+
+def principal(user_id=1, is_active=True):
+    return Principal(id=user_id, username="alice", email=None, is_active=is_active)
+
+def test_principal_is_immutable():
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        principal().is_active = False
+
+def test_entries_expire_with_the_token():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put("live", principal(), time.time() + 30, cache.epoch)
+    cache.put("expired", principal(), time.time() - 1, cache.epoch)
+    assert cache.get("live") == principal()
+    assert cache.get("expired") is None
+    assert cache.get("unknown") is None
+
+def test_lru_eviction():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    for token in ("a", "b", "c"):
+        cache.put(token, principal(), None, cache.epoch)
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+def test_invalidation_retires_every_token_of_the_user():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put("one", principal(1), None, cache.epoch)
+    cache.put("two", principal(1), None, cache.epoch)
+    cache.put("other", principal(2), None, cache.epoch)
+    cache.invalidate(1)
+    assert cache.get("one") is None and cache.get("two") is None
+    assert cache.get("other") is not None
+
+def test_lookup_racing_an_invalidation_is_not_cached():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    epoch = cache.epoch
+    cache.invalidate(1)
+    cache.put("token", principal(), None, epoch)
+    assert cache.get("token") is None
+
+def test_user_update_invalidates_on_flush_and_commit(db):
+    user = db.get(User, 1)
+    principal_cache.put("token", Principal.from_user(user), None, principal_cache.epoch)
+    user.is_active = False
+    db.flush()
+    assert principal_cache.get("token") is None
+
+    # A request that read the old row before the commit cached a stale principal
+    principal_cache.put("token", principal(), None, principal_cache.epoch)
+    db.commit()
+    assert principal_cache.get("token") is None
@@ -1,31 +1,39 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app.main import app
 from app.database import Base, get_db
+from app.services.principal import principal_cache
+from app.services.revisions import revision_index
 from app.models.user import User
+from app.services.feed import MatchFeedService
 
 # Test database setup
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient may run each request on a fresh event loop, so async connections are not pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture
 def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    # Cached principals and revisions point at rows of the dropped tables
+    principal_cache.clear()
+    revision_index.clear()
 
 @pytest.fixture
 def client(test_db):
-    def override_get_db():
-        try:
-            db = TestingSessionLocal()
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
             yield db
-        finally:
-            db.close()
     
     app.dependency_overrides[get_db] = override_get_db
     return TestClient(app)
@@ -75,6 +83,49 @@ def test_update_profile(client, auth_headers):
     assert data["location"] == "New York"
     assert data["profile_picture"] == "https://example.com/picture.jpg"
 
+def test_display_only_edits_leave_feeds_alone(client, auth_headers, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(MatchFeedService, "refresh_user", lambda db, user: refreshed.append(user.id))
+    response = client.put("/users/profile", headers=auth_headers,
+                          json={"bio": "Another bio", "profile_picture": "https://example.com/2.jpg"})
+    assert response.status_code == 200 and refreshed == []
+    response = client.put("/users/profile", headers=auth_headers, json={"bio": "Third bio", "interests": ["art"]})
+    assert response.status_code == 200 and len(refreshed) == 1
+
+def test_profile_etags(client, auth_headers):
+    first = client.get("/users/me", headers=auth_headers)
+    etag = first.headers["ETag"]
+    unchanged = client.get("/users/me", headers={**auth_headers, "If-None-Match": etag})
+    assert unchanged.status_code == 304 and unchanged.headers["ETag"] == etag and not unchanged.content
+
+    # A stale If-Match is refused; the current one applies the edit and yields a new ETag
+    edited = client.put("/users/profile", headers={**auth_headers, "If-Match": etag}, json={"bio": "Edited"})
+    assert edited.status_code == 200 and edited.headers["ETag"] != etag
+    stale = client.put("/users/profile", headers={**auth_headers, "If-Match": etag}, json={"bio": "Lost update"})
+    assert stale.status_code == 412
+
+    changed = client.get("/users/me", headers={**auth_headers, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["bio"] == "Edited"
+    assert changed.headers["ETag"] == edited.headers["ETag"]
+
+def test_feed_page_etags_follow_member_edits(client, auth_headers):
+    client.post("/users/", json={
+        "email": "match@example.com", "password": "testpassword123", "username": "matchuser",
+        "first_name": "Match", "last_name": "User", "date_of_birth": "1992-01-01",
+        "gender": "female", "looking_for": "male",
+    })
+    # The request that builds the feed has no ETag to offer yet
+    assert "ETag" not in client.get("/matches", headers=auth_headers).headers
+    page = client.get("/matches", headers=auth_headers)
+    etag = page.headers["ETag"]
+    assert client.get("/matches", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+    assert client.get("/matches?skip=1", headers={**auth_headers, "If-None-Match": etag}).status_code == 200
+
+    token = client.post("/token", data={"username": "matchuser", "password": "testpassword123"}).json()["access_token"]
+    client.put("/users/profile", headers={"Authorization": "Bearer " + token}, json={"occupation": "Chef"})
+    changed = client.get("/matches", headers={**auth_headers, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()[0]["occupation"] == "Chef"
+
 def test_get_matches(client, auth_headers):
     # Create another user for matching
     client.post(
@@ -0,0 +1,79 @@
+from datetime import date
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import User
+from app.services import profile_store
+from app.services.candidates import CandidateFilter, age_columns
+from app.services.features import ProfileFeatures
+from app.services.geo import coordinates
+from app.services.vocabulary import VocabularyService
+
+TODAY = date(2026, 3, 15)
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(profile_store, "ENABLED", True)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    for user_id in range(1, 41):
+        session.add(User(
+            id=user_id, username="user%d" % user_id,
+            gender="female" if user_id % 2 else "male", looking_for="male" if user_id % 2 else "female",
+            date_of_birth=date(1980 + user_id % 20, 1 + user_id % 12, 1 + user_id % 28) if user_id % 10 else None,
+            min_age_preference=25 if user_id % 3 == 0 else None,
+            interests=["hiking", "music"] if user_id % 4 else ["chess"], languages=["en"],
+            latitude=40.0 + user_id / 100, longitude=-74.0, max_distance=50 if user_id % 5 == 0 else None,
+            is_active=user_id % 7 != 0,
+        ))
+    session.commit()
+    yield session
+    session.close()
+    profile_store._reset()
+    engine.dispose()
+
+def assert_matches_orm(db, store, gender="female", looking_for="male"):
+    features, locations, ages = store.candidates(gender, looking_for, TODAY)
+    users = CandidateFilter.pool(db, gender, looking_for).order_by(User.id).all()
+    expected = ProfileFeatures.from_users(users, VocabularyService.feature_vocabularies(db))
+    order = np.argsort(features.ids)
+    assert features.ids[order].tolist() == [user.id for user in users]
+    for actual, wanted in zip(locations + ages, coordinates(users) + age_columns(users, TODAY)):
+        np.testing.assert_array_equal(actual[order], wanted)
+    for name in ("interest_bits", "language_bits"):
+        actual = getattr(features, name)[order]
+        wanted = getattr(expected, name)
+        width = max(actual.shape[1], wanted.shape[1])
+        np.testing.assert_array_equal(
+            profile_store._pad_columns(actual, width, 0), profile_store._pad_columns(wanted, width, 0))
+
+def test_build_streams_in_batches_and_matches_the_orm(db):
+    store = profile_store.ProfileStore.build(db, batch_size=7)
+    assert store.size == 40 and len(store) == 40 - 5
+    assert_matches_orm(db, store)
+    assert_matches_orm(db, store, "male", "female")
+    report = profile_store.memory_report(store, 0.5)
+    assert report["users"] == 40 and report["bytes"] == store.nbytes and report["load_seconds"] == 0.5
+
+def test_committed_changes_reach_the_store(db):
+    store = profile_store.profile_store(db)
+    user = db.get(User, 2)
+    user.gender, user.looking_for = "female", "male"
+    user.interests = ["sailing", "astronomy", "poetry"] + ["topic%d" % index for index in range(70)]
+    db.add(User(id=500, username="late", gender="female", looking_for="male", date_of_birth=date(1990, 2, 28)))
+    db.delete(db.get(User, 3))
+    db.commit()
+    assert profile_store.profile_store(db) is store
+    assert store.row_of[3] == -1 and store.row_of[500] >= 0
+    assert_matches_orm(db, store)
+
+    db.get(User, 5).is_active = False
+    db.flush()
+    db.rollback()
+    assert store.active[store.row_of[5]]
+    assert_matches_orm(db, store)
@@ -0,0 +1,92 @@
+from datetime import date
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.loading import MATCHING, USER_CARDS, load_options
+from app.models.user import Like, Message, User
+from app.query_audit import UnplannedLazyLoad, audit_queries, fingerprint, instrument
+from app.services.candidates import CandidateFilter
+from app.services.compatibility import CompatibilityService
+from app.services.matches import MatchService
+from app.services.messages import MessageService
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    instrument(engine)
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add_all([User(id=index, username="user%d" % index) for index in range(1, 9)])
+    session.add_all([Like(liker_id=index, liked_id=1, timestamp=date(2024, 1, 1)) for index in range(2, 9)])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+def test_fingerprint_ignores_literals_and_in_list_length():
+    assert fingerprint("SELECT * FROM users WHERE id = 7 AND name = 'it''s'") == \
+        fingerprint("SELECT * FROM users\n WHERE id = 12 AND name = 'bob'")
+    assert fingerprint("SELECT * FROM users WHERE id IN (?, ?, ?)") == fingerprint("SELECT * FROM users WHERE id IN (?)")
+    assert fingerprint("SELECT users_1.id FROM users AS users_1") == "SELECT users_1.id FROM users AS users_1"
+
+def test_lazy_loads_per_row_are_reported_as_n_plus_one(db):
+    with audit_queries() as audit:
+        users = db.execute(select(User).where(User.id > 1)).scalars().all()
+        assert all(len(user.sent_likes) == 1 for user in users)
+    assert audit.lazy_loads["User.sent_likes"] == 7
+    [(shape, count)] = audit.repeated().items()
+    assert count == 7 and shape.startswith("SELECT likes.")
+
+@pytest.mark.parametrize("strategy, queries", [("selectin", 2), ("joined", 1)])
+def test_eager_strategies_bound_the_query_count(db, strategy, queries):
+    with audit_queries() as audit:
+        options = load_options(User, sent_likes=strategy)
+        users = db.execute(select(User).options(*options).where(User.id > 1)).unique().scalars().all()
+        assert all(len(user.sent_likes) == 1 for user in users)
+    assert audit.queries == queries
+    assert not audit.lazy_loads and not audit.repeated()
+
+def test_strict_audit_raises_on_lazy_loads(db):
+    user = db.get(User, 2)
+    with audit_queries(strict=True):
+        with pytest.raises(UnplannedLazyLoad, match="User.sent_likes"):
+            user.sent_likes
+
+def test_list_queries_raise_instead_of_lazy_loading(db):
+    for other in range(2, 9):
+        MatchService.record_like(db, 1, other)
+    with audit_queries(strict=True) as audit:
+        matches = MatchService.list_match_cards(db, 1)
+    assert len(matches) == 7 and audit.queries == 1
+
+    db.add_all([Message(sender_id=1, receiver_id=2, content="hi %d" % index) for index in range(10)])
+    db.commit()
+    with audit_queries(strict=True) as audit:
+        messages, _ = MessageService.conversation(db, 1, 2, limit=5)
+    assert len(messages) == 5 and audit.queries == 1
+    with pytest.raises(InvalidRequestError):
+        messages[0].sender
+
+def test_user_cards_raise_on_any_relationship(db):
+    user = db.execute(select(User).options(*USER_CARDS).where(User.id == 3)).scalar_one()
+    with pytest.raises(InvalidRequestError):
+        user.compatibility_reports
+
+def test_matching_queries_never_select_secrets_or_display_columns(db):
+    with audit_queries(strict=True) as audit:
+        pool = CandidateFilter.pool(db, "male", "female").all()
+        CompatibilityService.create_compatibility_report(db, 2, 3)
+        owner = db.execute(select(User).options(*MATCHING).where(User.id == 4)).scalar_one()
+        assert owner.interests is None and pool == []
+    statements = " ".join(audit.shapes)
+    assert "users.hashed_password" not in statements and "users.bio" not in statements
+
+    # Deferred columns still load on access where nothing raises
+    user = db.get(User, 5)
+    assert "bio" not in user.__dict__ and "hashed_password" not in user.__dict__
+    user.bio = "hello"
+    db.commit()
+    assert db.get(User, 5).bio == "hello"
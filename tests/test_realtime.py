@@ -0,0 +1,60 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.services.realtime import _OVERFLOW, Connection, InMemoryBroker
+
+def signup(client, name):
+    client.post("/users/", json={
+        "email": "%s@example.com" % name, "password": "secret123", "username": name,
+        "first_name": name, "last_name": "Test", "date_of_birth": "1990-01-01",
+        "gender": "male", "looking_for": "female",
+    })
+    return client.post("/token", data={"username": name, "password": "secret123"}).json()["access_token"]
+
+@pytest.mark.asyncio
+async def test_in_memory_broker_fan_out():
+    broker = InMemoryBroker()
+    received = []
+    await broker.subscribe("user:1", received.append)
+    await broker.subscribe("user:1", lambda payload: received.append(("second", payload)))
+    await broker.publish("user:1", {"n": 1})
+    await broker.publish("user:2", {"n": 2})
+    assert len(received) == 2
+    assert {"n": 1} in received and ("second", {"n": 1}) in received
+
+    await broker.unsubscribe("user:1", received.append)
+    received.clear()
+    await broker.publish("user:1", {"n": 3})
+    assert received == [("second", {"n": 3})]
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_the_connection():
+    connection = Connection(websocket=None, user_id=1, queue_size=2)
+    for n in range(3):
+        connection.offer({"n": n})
+    assert connection.overflowed
+    assert connection.queue.qsize() == 1
+    assert connection.queue.get_nowait() is _OVERFLOW
+    connection.offer({"n": 4})
+    assert connection.queue.empty()
+
+def test_socket_rejects_bad_token(client):
+    with client:
+        with pytest.raises(WebSocketDisconnect) as error:
+            with client.websocket_connect("/ws?token=garbage") as socket:
+                socket.receive_json()
+        assert error.value.code == 1008
+
+def test_new_messages_are_pushed_to_the_receiver(client):
+    with client:
+        alice, bob = signup(client, "alice"), signup(client, "bob")
+        client.post("/users/like/bob", headers={"Authorization": "Bearer " + alice})
+        client.post("/users/like/alice", headers={"Authorization": "Bearer " + bob})
+
+        with client.websocket_connect("/ws", headers={"Authorization": "Bearer " + bob}) as socket:
+            response = client.post("/messages/bob", json={"content": "hi"}, headers={"Authorization": "Bearer " + alice})
+            assert response.status_code == 201
+            payload = socket.receive_json()
+        assert payload["type"] == "message"
+        assert payload["message"]["content"] == "hi"
+        assert payload["message"]["id"] == response.json()["id"]
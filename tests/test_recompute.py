@@ -0,0 +1,104 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models.user import CompatibilityReport, User
+from app.services import recompute
+from app.services.compatibility import CompatibilityService
+from app.services.recompute import RecomputeWorker
+
+@pytest_asyncio.fixture
+async def worker(tmp_path):
+    engine = create_async_engine("sqlite+aiosqlite:///%s" % (tmp_path / "recompute.db"))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all([
+            User(id=index, username="user%d" % index, interests=["hiking", "music"][:index % 3], smoking="never")
+            for index in range(1, 7)
+        ])
+        await db.commit()
+        for user_id in range(1, 7):
+            for target_id in (1, 2):
+                if user_id != target_id:
+                    await CompatibilityService.create_compatibility_report_async(db, user_id, target_id)
+    worker = RecomputeWorker(factory, engine.sync_engine, batch_size=3, delay_ms=0)
+    recompute.active = worker
+    await worker.start()
+    yield worker
+    recompute.active = None
+    await worker.stop()
+    await engine.dispose()
+
+async def reports(worker):
+    async with worker.session_factory() as db:
+        rows = (await db.execute(select(CompatibilityReport))).scalars().all()
+        return {(row.user_id, row.target_id): (row.compatibility_score, row.user_revision, row.target_revision)
+                for row in rows}
+
+async def settle(worker):
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if not worker.pending and not worker._wakeup.is_set():
+            return
+
+@pytest.mark.asyncio
+async def test_scored_edits_rescore_only_the_affected_pairs(worker):
+    before = await reports(worker)
+    async with worker.session_factory() as db:
+        user = await db.get(User, 1)
+        user.interests = ["hiking", "music", "travel"]
+        user.smoking = "regularly"
+        await db.commit()
+    await settle(worker)
+
+    after = await reports(worker)
+    affected = {pair for pair in before if 1 in pair}
+    assert len(affected) == 6 and worker.recomputed == 6 and worker.batches == 2
+    for pair, (score, user_revision, target_revision) in after.items():
+        if pair in affected:
+            assert (user_revision, target_revision) != before[pair][1:]
+        else:
+            assert after[pair] == before[pair]
+    async with worker.session_factory() as db:
+        fresh = await CompatibilityService.get_compatibility_report_async(db, 1, 2)
+    assert fresh.compatibility_score == after[(1, 2)][0]
+
+@pytest.mark.asyncio
+async def test_display_edits_and_rollbacks_queue_nothing(worker):
+    async with worker.session_factory() as db:
+        user = await db.get(User, 3)
+        user.bio = "new bio"
+        user.profile_picture = "https://example.com/3.jpg"
+        user.smoking = "never"  # unchanged
+        await db.commit()
+        user.interests = ["travel"]
+        await db.flush()
+        await db.rollback()
+    await settle(worker)
+    assert worker.recomputed == 0 and worker.batches == 0
+
+@pytest.mark.asyncio
+async def test_failing_drains_back_off_and_give_up(worker, monkeypatch):
+    worker.retry, worker.max_attempts = 0.02, 3
+    calls = []
+
+    def broken(db, user_ids):
+        calls.append(time.monotonic())
+        raise RuntimeError("database unavailable")
+    monkeypatch.setattr(recompute, "stale_pairs", broken)
+    worker.mark([1])
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if worker.abandoned:
+            break
+    assert len(calls) == 3 and worker.abandoned == 1 and worker.pending == 0
+    # Each retry waits twice as long as the one before
+    assert calls[1] - calls[0] >= 0.02 and calls[2] - calls[1] >= 0.04
+    await asyncio.sleep(0.1)
+    assert len(calls) == 3
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import CompatibilityReport, User
+from app.services import compatibility
+from app.services.cache import LRUCache
+from app.services.compatibility import CompatibilityService
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def db(engine, monkeypatch):
+    monkeypatch.setattr(compatibility, "report_cache", LRUCache(100))
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.add_all([
+        User(id=1, username="alice", interests=["music", "travel"], relationship_goals="serious"),
+        User(id=2, username="bob", interests=["music"], relationship_goals="serious"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def count_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_only_scored_fields_bump_profile_revision(db):
+    user = db.query(User).filter(User.id == 1).first()
+    assert user.profile_revision == 1
+    user.bio = "hello"
+    user.profile_picture = "me.png"
+    db.commit()
+    assert user.profile_revision == 1
+    user.interests = ["music"]
+    db.commit()
+    assert user.profile_revision == 2
+
+def test_report_is_cached_and_reused(db, engine):
+    first = CompatibilityService.get_compatibility_report(db, 1, 2)
+    assert first.compatibility_score > 0
+    assert (first.user_revision, first.target_revision) == (1, 1)
+
+    statements = count_statements(engine)
+    second = CompatibilityService.get_compatibility_report(db, 1, 2)
+    # Only the revision lookup reaches the database
+    assert len(statements) == 1
+    assert second.compatibility_score == first.compatibility_score
+    assert second is not first
+
+    compatibility.report_cache.clear()
+    statements.clear()
+    third = CompatibilityService.get_compatibility_report(db, 1, 2)
+    assert third.id == first.id
+    assert not any(statement.lstrip().upper().startswith(("INSERT", "UPDATE")) for statement in statements)
+
+def test_profile_edit_invalidates_report(db):
+    before = CompatibilityService.get_compatibility_report(db, 1, 2)
+    score = before.compatibility_score
+
+    target = db.query(User).filter(User.id == 2).first()
+    target.relationship_goals = "casual"
+    db.commit()
+
+    after = CompatibilityService.get_compatibility_report(db, 1, 2)
+    assert after.target_revision == 2
+    assert after.compatibility_score < score
+    assert after.compatibility_score == CompatibilityService.calculate_compatibility(
+        db.query(User).filter(User.id == 1).first(), target
+    )[0]
+    assert db.query(CompatibilityReport).count() == 1
+
+def test_upsert_keeps_one_row_per_pair(db):
+    for _ in range(3):
+        CompatibilityService.create_compatibility_report(db, 1, 2)
+    CompatibilityService.create_compatibility_report(db, 2, 1)
+    assert db.query(CompatibilityReport).count() == 2
+
+def test_missing_user_has_no_report(db):
+    assert CompatibilityService.get_compatibility_report(db, 1, 99) is None
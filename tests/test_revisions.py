@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import User
+from app.services.revisions import RevisionIndex, etag_matches, list_etag, revision_index, user_etag
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add_all([User(id=1, username="alice"), User(id=2, username="bob")])
+    session.commit()
+    revision_index.clear()
+    yield session
+    session.close()
+    revision_index.clear()
+
+def test_edits_bump_the_revision_and_drop_the_indexed_one(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert revision_index.revisions(db, [1, 2, 3]) == {1: 1, 2: 1}
+    assert revision_index.revisions(db, [1, 2]) == {1: 1, 2: 1} and len(statements) == 1
+
+    alice = db.get(User, 1)
+    alice.bio = "hi"
+    alice.username = "alice"  # unchanged
+    db.commit()
+    assert alice.revision == 2 and revision_index.get(1) is None
+    db.get(User, 2).username = "bob"
+    db.commit()
+    assert revision_index.revisions(db, [1, 2]) == {1: 2, 2: 1}
+
+def test_read_racing_an_invalidation_is_not_indexed():
+    index = RevisionIndex(maxsize=10, ttl=60)
+    epoch = index.epoch
+    index.invalidate(1)
+    index.put(1, 3, epoch)
+    assert index.get(1) is None
+    index.put(1, 4, index.epoch)
+    assert index.get(1) == 4
+
+def test_etags():
+    assert user_etag(1, 2) != user_etag(1, 3) != user_etag(2, 2)
+    members = [(2, 81.5), (3, 80.0)]
+    etag = list_etag("feed", members, {2: 1, 3: 1})
+    assert etag == list_etag("feed", members, {2: 1, 3: 1, 4: 7})
+    assert etag != list_etag("feed", members, {2: 1, 3: 2})
+    assert etag != list_etag("feed", members[::-1], {2: 1, 3: 1})
+    assert list_etag("feed", members, {2: 1}) is None
+    assert etag_matches('"a", W/%s' % etag, etag) and etag_matches("*", etag)
+    assert not etag_matches('"a"', etag) and not etag_matches(None, etag)
@@ -0,0 +1,106 @@
+from datetime import date
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import User
+from app.services import search
+from app.services.matches import MatchService
+from app.services.search import InvertedIndex, ProfileSearch, terms
+
+PROFILES = {
+    2: dict(bio="Jazz pianist who loves hiking", occupation="Musician", interests=["jazz", "hiking"]),
+    3: dict(bio="Weekend hiking, weekday café hopping", occupation="Nurse", interests=["travel"]),
+    4: dict(bio="Into jazz records", occupation=None, interests=None),
+    5: dict(bio=None, occupation="Jazz teacher", interests=["jazz"]),
+    6: dict(bio="Jazz and hiking", occupation="Chef", interests=[], gender="male"),  # not looking for the searcher
+    7: dict(bio="NOT a jazz fan OR \"hiker\"*", occupation=None, interests=None),
+}
+
+@pytest.fixture(params=["fts", "memory"])
+def db(request, monkeypatch):
+    monkeypatch.setattr(search, "BACKEND", request.param)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add(User(id=1, username="searcher", gender="male", looking_for="female", is_active=True,
+                     date_of_birth=date(1990, 1, 1)))
+    for user_id, profile in PROFILES.items():
+        fields = dict(gender="female", looking_for="male", is_active=True, date_of_birth=date(1992, 1, 1))
+        fields.update(profile)
+        session.add(User(id=user_id, username="user%d" % user_id, **fields))
+    session.commit()
+    search._reset()
+    yield session
+    session.close()
+    search._reset()
+
+def test_terms_fold_case_and_diacritics():
+    assert terms("Café-HOPPING, naïve_fan!") == ["cafe", "hopping", "naive", "fan"]
+    assert terms(None) == []
+
+def test_every_word_must_match_and_eligibility_applies(db):
+    searcher = db.get(User, 1)
+    assert set(ProfileSearch.search_ids(db, searcher, "jazz")) == {2, 4, 5, 7}
+    assert ProfileSearch.search_ids(db, searcher, "jazz hiking") == [2]
+    assert ProfileSearch.search_ids(db, searcher, "cafe") == [3]
+    assert ProfileSearch.search_ids(db, searcher, "NOT OR \"*") == [7]
+    assert ProfileSearch.search_ids(db, searcher, "???") == []
+
+    # Liked users leave the results like they leave the feed
+    MatchService.record_like(db, 1, 4)
+    db.commit()
+    assert set(ProfileSearch.search_ids(db, searcher, "jazz")) == {2, 5, 7}
+
+def test_short_fields_outrank_a_passing_mention(db):
+    searcher = db.get(User, 1)
+    ranked = ProfileSearch.search_ids(db, searcher, "jazz")
+    assert ranked.index(5) < ranked.index(4) and ranked.index(5) < ranked.index(7)
+    assert ProfileSearch.search_ids(db, searcher, "jazz", skip=1, limit=2) == ranked[1:3]
+    cards = ProfileSearch.search_cards(db, searcher, "jazz", limit=2)
+    assert [card["id"] for card in cards] == ranked[:2] and cards[0]["username"] == "user%d" % ranked[0]
+
+def test_edits_and_deletes_are_searchable_after_commit(db):
+    searcher = db.get(User, 1)
+    assert set(ProfileSearch.search_ids(db, searcher, "hiking")) == {2, 3}
+    user = db.get(User, 3)
+    user.bio = "Climbing"
+    user.interests = ["salsa", "hiking"]
+    db.commit()
+    assert set(ProfileSearch.search_ids(db, searcher, "hiking")) == {2, 3}
+    assert ProfileSearch.search_ids(db, searcher, "climbing salsa") == [3]
+    assert ProfileSearch.search_ids(db, searcher, "cafe") == []
+
+    db.delete(db.get(User, 2))
+    db.commit()
+    assert ProfileSearch.search_ids(db, searcher, "hiking") == [3]
+
+def test_inverted_index_bm25():
+    index = InvertedIndex()
+    index.add(1, "jazz " * 3 + "and more words here", None, None)
+    index.add(2, "jazz", None, None)
+    index.add(3, None, None, ["jazz"])
+    index.add(4, "nothing relevant", None, None)
+    assert [user_id for user_id, _ in index.search(["jazz"])] == [3, 2, 1]
+    index.remove(3)
+    index.add(2, "blues", None, None)
+    assert [user_id for user_id, _ in index.search(["jazz"])] == [1]
+    assert index.search(["jazz", "blues"]) == [] and len(index) == 3
+
+def test_search_endpoint(client):
+    tokens = []
+    for index, (gender, bio) in enumerate([("male", "Looking for jazz nights"), ("female", "Jazz singer")]):
+        client.post("/users/", json={
+            "email": "user%d@example.com" % index, "password": "testpassword123", "username": "user%d" % index,
+            "first_name": "Test", "last_name": "User", "date_of_birth": "1990-01-01",
+            "gender": gender, "looking_for": "female" if gender == "male" else "male",
+        })
+        login = client.post("/token", data={"username": "user%d" % index, "password": "testpassword123"})
+        tokens.append({"Authorization": "Bearer " + login.json()["access_token"]})
+        client.put("/users/profile", headers=tokens[-1], json={"bio": bio})
+    headers = tokens[0]
+    response = client.get("/search", params={"q": "jazz"}, headers=headers)
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()] == ["user1"]
+    assert client.get("/search", params={"q": ""}, headers=headers).status_code == 422
@@ -0,0 +1,131 @@
+from datetime import date
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.user import Like, MatchFeedEntry, SeenFilter, User
+from app.services import feed
+from app.services.feed import MatchFeedService
+from app.services.matches import MatchService
+from app.services.seen import ScalableBloomFilter, SeenService, seen_cache
+
+def test_added_ids_are_always_found():
+    bloom = ScalableBloomFilter(error_rate=0.01, initial_capacity=64)
+    ids = np.random.default_rng(1).choice(10**9, 10_000, replace=False)
+    bloom.add(ids)
+    assert len(bloom) == 10_000
+    assert bloom.contains(ids).all()
+    assert int(ids[0]) in bloom
+
+def test_false_positive_rate_stays_under_target_as_it_grows():
+    rng = np.random.default_rng(2)
+    for error_rate in (0.01, 0.001):
+        bloom = ScalableBloomFilter(error_rate=error_rate, initial_capacity=256)
+        bloom.add(rng.choice(10**9, 10_000, replace=False) * 2)
+        probes = rng.choice(10**9, 200_000, replace=False) * 2 + 1
+        assert bloom.contains(probes).mean() <= error_rate
+        # Bounded memory: about 34KB per user for 10k swipes at 1%
+        assert bloom.nbytes() < 10_000 * 3 * -np.log(error_rate) / np.log(2) ** 2 / 8
+
+def test_repeated_ids_do_not_use_capacity():
+    bloom = ScalableBloomFilter(initial_capacity=16)
+    for _ in range(5):
+        bloom.add(range(10))
+    assert len(bloom) == 10 and len(bloom.stages) == 1
+
+def test_serialization_roundtrip():
+    bloom = ScalableBloomFilter(error_rate=0.02, initial_capacity=32)
+    bloom.add(range(0, 3000, 3))
+    copy = ScalableBloomFilter.from_bytes(bloom.to_bytes())
+    probes = np.arange(3000)
+    assert copy.error_rate == 0.02 and len(copy) == len(bloom)
+    assert (copy.contains(probes) == bloom.contains(probes)).all()
+    copy.add([1])
+    assert 1 in copy
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    session.add_all([
+        User(id=index, username="user%d" % index, email="user%d@example.com" % index, hashed_password="x",
+             date_of_birth=date(1990, 1, 1), gender="male" if index == 1 else "female",
+             looking_for="female" if index == 1 else "male", is_active=True)
+        for index in range(1, 8)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def feed_ids(db, user_id):
+    return [card["id"] for card in MatchFeedService.get_feed_cards(db, db.get(User, user_id))]
+
+def test_liked_and_passed_candidates_leave_the_feed(db):
+    assert feed_ids(db, 1) == [2, 3, 4, 5, 6, 7]
+    MatchService.record_like(db, 1, 3)
+    MatchFeedService.record_pass(db, 1, 5)
+    assert feed_ids(db, 1) == [2, 4, 6, 7]
+
+    # Stored with the like or pass, so a fresh process builds the same feed
+    seen_cache.clear()
+    assert db.get(SeenFilter, 1).items == 2
+    db.query(MatchFeedEntry).delete()
+    db.commit()
+    assert feed_ids(db, 1) == [2, 4, 6, 7]
+    assert SeenService.seen_mask(db, 1, [3, 4, 5]).tolist() == [True, False, True]
+
+def test_likes_from_before_seen_sets_seed_the_filter(db):
+    db.add_all([Like(liker_id=1, liked_id=2, timestamp=date(2024, 1, 1)), Like(liker_id=1, liked_id=6, timestamp=date(2024, 1, 1))])
+    db.commit()
+    assert SeenService.seen_mask(db, 1, [2, 3, 6]).tolist() == [True, False, True]
+    MatchFeedService.record_pass(db, 1, 3)
+    seen_cache.clear()
+    assert SeenService.seen_mask(db, 1, [2, 3, 4, 6]).tolist() == [True, True, False, True]
+
+def test_profile_changes_do_not_bring_back_swiped_users(db):
+    feed_ids(db, 1)
+    MatchFeedService.record_pass(db, 1, 4)
+    candidate = db.get(User, 4)
+    candidate.bio = "updated"
+    db.commit()
+    MatchFeedService.refresh_user(db, candidate)
+    assert 4 not in feed_ids(db, 1)
+
+def test_own_swipes_do_not_hide_the_user_from_others(db, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_SIZE", 2)
+    db.add_all([
+        User(id=index, username="user%d" % index, email="user%d@example.com" % index, hashed_password="x",
+             date_of_birth=date(1990, 1, 1), gender="male", looking_for="female", is_active=True, interests=["gaming"])
+        for index in (8, 9)
+    ])
+    db.get(User, 2).interests = ["hiking", "jazz", "gaming"]
+    db.commit()
+    assert feed_ids(db, 2) == [8, 9]
+
+    MatchFeedService.record_pass(db, 1, 2)
+    user = db.get(User, 1)
+    user.interests = ["hiking", "jazz"]
+    db.commit()
+    MatchFeedService.refresh_user(db, user)
+    assert feed_ids(db, 2) == [1, 8]
+    assert 2 not in feed_ids(db, 1)
+
+def test_pass_endpoint(client):
+    tokens = {}
+    for name, gender, looking_for in (("alice", "female", "male"), ("bob", "male", "female")):
+        client.post("/users/", json={
+            "email": "%s@example.com" % name, "password": "secret123", "username": name,
+            "first_name": name, "last_name": "Test", "date_of_birth": "1990-01-01",
+            "gender": gender, "looking_for": looking_for,
+        })
+        token = client.post("/token", data={"username": name, "password": "secret123"}).json()["access_token"]
+        tokens[name] = {"Authorization": "Bearer " + token}
+
+    assert [user["username"] for user in client.get("/matches", headers=tokens["alice"]).json()] == ["bob"]
+    assert client.post("/users/pass/bob", headers=tokens["alice"]).status_code == 204
+    assert client.get("/matches", headers=tokens["alice"]).json() == []
+    assert client.post("/users/pass/alice", headers=tokens["alice"]).status_code == 400
+    assert client.post("/users/pass/nobody", headers=tokens["alice"]).status_code == 404
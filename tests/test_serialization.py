@@ -0,0 +1,63 @@
+import random
+from datetime import date, datetime, timezone
+from typing import List
+import pytest
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.database import Base
+from app.models.loading import USER_CARDS
+from app.models.user import Match, Message, User
+from app.serialization import MESSAGE, USER_CARD, dumps
+from app.services import feed
+from app.services.feed import MatchFeedService
+from app.services.matches import MatchService
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(feed, "FEED_SIZE", 10)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    rng = random.Random(9)
+    for index in range(1, 31):
+        session.add(User(
+            id=index, email="user%d@example.com" % index, username="user%d" % index, first_name="Zoë",
+            last_name="O'Brien \"%d\"" % index, date_of_birth=date(1990, 1 + index % 12, 1 + index % 28),
+            gender="female" if index % 2 else "male", looking_for="male" if index % 2 else "female",
+            bio=rng.choice([None, "línea 1\nline 2 ✨"]), interests=rng.choice([None, [], ["hiking", "jazz"]]),
+            personality_traits=rng.choice([None, ["introvert", "creative"]]),
+            latitude=rng.choice([None, 40.7128 + index / 1000]), longitude=rng.choice([None, -74.006]),
+            height=rng.choice([None, 171]), has_children=rng.choice([None, False]), wants_children=rng.choice([None, True]),
+            compatibility_score=rng.choice([None, 0.1 + 0.2, 85.0]), is_active=True,
+        ))
+        session.add(Match(user_id=1, matched_user_id=index))
+    session.add_all([
+        Message(sender_id=1, receiver_id=2, content="hi", timestamp=datetime(2026, 3, 1, 12, 30, 5, 123456, timezone.utc)),
+        Message(sender_id=2, receiver_id=1, content="hey ☃", timestamp=datetime(2026, 3, 1, 12, 31, tzinfo=timezone.utc)),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def test_projected_rows_encode_like_the_response_models(db):
+    users = TypeAdapter(List[schemas.User])
+    cards = MatchService.list_match_cards(db, 1, after=0, limit=100)
+    matched = db.execute(select(User).options(*USER_CARDS).order_by(User.id)).scalars().all()
+    assert dumps(cards) == users.dump_json(users.validate_python(matched))
+    assert len(cards) == 30 and tuple(cards[0]) == USER_CARD.fields
+
+    messages = TypeAdapter(List[schemas.Message])
+    rows = MESSAGE.dicts(db.execute(MESSAGE.select().order_by(Message.id)))
+    assert dumps(rows) == messages.dump_json(messages.validate_python(db.query(Message).order_by(Message.id).all()))
+
+def test_feed_cards_carry_the_feed_score(db):
+    viewer = db.get(User, 1)
+    cards = MatchFeedService.get_feed_cards(db, viewer, skip=2, limit=5)
+    expected = [
+        schemas.User.model_validate(db.get(User, candidate_id)).model_copy(update={"compatibility_score": score})
+        for candidate_id, score in MatchFeedService.feed_page(db, viewer.id, skip=2, limit=5)
+    ]
+    assert cards and dumps(cards) == TypeAdapter(List[schemas.User]).dump_json(expected)
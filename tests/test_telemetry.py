@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.database import pool_options
+from app.telemetry import (
+    Histogram, RequestStats, TimedQueuePool, current_request, instrument_pool, instrument_queries, metrics, pools, timed,
+)
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        "sqlite:///%s" % (tmp_path / "pool.db"), poolclass=TimedQueuePool,
+        pool_size=1, max_overflow=1, pool_timeout=0.05,
+    )
+    yield engine
+    engine.dispose()
+    pools.pop("test", None)
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 1, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(6.25)
+
+def test_pool_options_from_environment(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+    options = pool_options("sqlite:///./app.db")
+    assert options["pool_size"] == 3
+    assert options["pool_pre_ping"] is True
+    assert options["pool_use_lifo"] is False
+    assert pool_options("sqlite://") == {}
+
+def test_pool_telemetry_tracks_overflow_and_timeouts(engine):
+    telemetry = instrument_pool(engine, "test")
+    first, second = engine.connect(), engine.connect()
+    first.execute(text("select 1"))
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    snapshot = telemetry.snapshot()
+    assert snapshot["checked_out"] == 2
+    assert snapshot["peak_checked_out"] == 2
+    assert snapshot["overflow_connections"] == 1
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_seconds"]["count"] == 3
+
+    first.close()
+    second.close()
+    snapshot = telemetry.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkout_seconds"]["count"] == 2
+    # The overflow connection is closed on checkin, ending its lifetime
+    assert snapshot["connection_lifetime_seconds"]["count"] == 1
+
+def test_queries_are_attributed_to_the_current_request(engine):
+    instrument_queries(engine)
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("select 1"))
+            connection.execute(text("select 2"))
+    finally:
+        current_request.reset(token)
+    with engine.connect() as connection:
+        connection.execute(text("select 3"))
+    assert stats.queries == 2
+    assert stats.db_seconds > 0
+
+def test_timed_records_operation_duration():
+    calls = metrics.operation("test.double").snapshot()["count"]
+    assert timed("test.double")(lambda value: value * 2)(21) == 42
+    assert metrics.operation("test.double").snapshot()["count"] == calls + 1
+
+def test_metrics_endpoint_labels_requests_by_route_template(client):
+    client.get("/users/me")
+    client.get("/messages/nobody")
+    client.get("/no/such/path")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/users/me",status="401"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/messages/{username}"}' in body
+    assert 'route="<unmatched>",status="404"' in body
+    assert "/messages/nobody" not in body
+    assert "# TYPE http_request_db_queries histogram" in body
+    assert 'db_pool_checkouts_total{pool="sync"}' in body
@@ -0,0 +1,121 @@
+import random
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.user import User, VocabularyTerm
+from app.services.compatibility import CompatibilityService
+from app.services.features import ProfileFeatures
+from app.services.vocabulary import INTEREST, LANGUAGE, VocabularyService, interned, to_bytes
+
+INTERESTS = ["reading", "travel", "music", "hiking", "cooking", "gaming", "yoga", "art"]
+LANGUAGES = ["english", "spanish", "french"]
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+def bits(db, kind):
+    return dict(db.query(VocabularyTerm.term, VocabularyTerm.bit).filter(VocabularyTerm.kind == kind).all())
+
+def test_terms_are_interned_densely_per_kind(db):
+    db.add(User(username="a", interests=["music", "yoga", "music"], languages=["english"]))
+    db.add(User(username="b", interests=["yoga", "art"], languages=["french", "english"]))
+    db.commit()
+    assert bits(db, INTEREST) == {"music": 0, "yoga": 1, "art": 2}
+    assert bits(db, LANGUAGE) == {"english": 0, "french": 1}
+
+    a, b = db.query(User).order_by(User.id).all()
+    assert a.interest_bits == to_bytes([0, 1])
+    assert b.language_bits == to_bytes([0, 1])
+
+def test_editing_a_list_reencodes_its_bits(db):
+    user = User(username="a", interests=["music"], languages=["english"])
+    db.add(user)
+    db.commit()
+    user.interests = ["art", "music"]
+    assert user.interest_bits is None
+    db.commit()
+    assert user.interest_bits == to_bytes([bits(db, INTEREST)["art"], bits(db, INTEREST)["music"]])
+    assert user.language_bits == to_bytes([0])
+
+    user.interests = []
+    db.commit()
+    assert user.interest_bits is None
+
+def test_rolled_back_terms_are_not_cached(db):
+    db.add(User(username="a", interests=["music"]))
+    db.flush()
+    db.rollback()
+    assert interned(db.get_bind())[INTEREST].get("music") == -1
+
+    db.add(User(username="b", interests=["art", "music"]))
+    db.commit()
+    assert interned(db.get_bind())[INTEREST].get("art") == bits(db, INTEREST)["art"]
+    assert db.query(User).one().interest_bits == to_bytes(bits(db, INTEREST).values())
+
+def test_intern_reuses_terms_committed_elsewhere(db):
+    db.add(VocabularyTerm(kind=INTEREST, term="chess", bit=0))
+    db.commit()
+    user = User(username="a", interests=["chess", "music"])
+    db.add(user)
+    db.commit()
+    assert bits(db, INTEREST) == {"chess": 0, "music": 1}
+    assert user.interest_bits == to_bytes([0, 1])
+
+def test_scoring_from_bitsets_matches_strings(db):
+    rng = random.Random(5)
+    users = []
+    for index in range(30):
+        user = User(
+            username="user%d" % index,
+            interests=[rng.choice(INTERESTS) for _ in range(rng.randint(0, 5))] or None,
+            languages=rng.sample(LANGUAGES, rng.randint(0, 2)),
+            relationship_goals=rng.choice(["casual", "serious", None]),
+        )
+        db.add(user)
+        users.append(user)
+    db.commit()
+
+    # Transient copies carry no bitsets, so they take the string path
+    plain = [User(id=u.id, interests=u.interests, languages=u.languages, relationship_goals=u.relationship_goals)
+             for u in users]
+    for left, right in zip(users, users[1:]):
+        plain_left, plain_right = plain[users.index(left)], plain[users.index(right)]
+        score, common, _, _ = CompatibilityService.calculate_compatibility(left, right)
+        expected_score, expected_common, _, _ = CompatibilityService.calculate_compatibility(plain_left, plain_right)
+        assert score == expected_score
+        assert sorted(common) == sorted(expected_common)
+
+    interned_features = ProfileFeatures.from_users(users, VocabularyService.feature_vocabularies(db))
+    string_features = ProfileFeatures.from_users(plain)
+    for row in range(len(users)):
+        np.testing.assert_array_equal(
+            CompatibilityService.score_pairs(interned_features.take([row]), interned_features),
+            CompatibilityService.score_pairs(string_features.take([row]), string_features),
+        )
+
+def test_vocabularies_load_once_and_follow_commits(db):
+    db.add(VocabularyTerm(kind=INTEREST, term="chess", bit=0))
+    db.commit()
+    first = VocabularyService.feature_vocabularies(db)
+    assert first.interests.get("chess") == 0
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    second = VocabularyService.feature_vocabularies(db)
+    assert statements == [] and second.interests is first.interests
+
+    db.add(User(username="a", interests=["music"]))
+    db.commit()
+    statements.clear()
+    third = VocabularyService.feature_vocabularies(db)
+    assert statements == [] and third.interests is not first.interests
+    assert third.interests.get("music") == 1 and third.languages is first.languages